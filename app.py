@@ -2,56 +2,36 @@ from flask import Flask, jsonify, request, render_template
 import os
 import json
 import time
-from pathlib import Path
+
+import settings
+from httpcache import ResponseCache, if_match_revision, revision_conflict_body
+from read_api import read_api
 
 app = Flask(__name__)
 
-DOCUMENTS_DIR = Path.home() / 'Documents' / 'PromptData'
-DOCUMENTS_DIR.mkdir(parents=True, exist_ok=True)
-DATA_FILE = DOCUMENTS_DIR / 'config.json'
-COOLDOWN_MINUTES = 3
-
-def load_data():
-    """Load data from config.json"""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                # Ensure all prompts have required fields
-                for prompt in data.get('prompts', []):
-                    if 'versions' not in prompt:
-                        prompt['versions'] = [{
-                            'id': f"{int(time.time())}-v1",
-                            'name': prompt['name'],
-                            'text': prompt['text'],
-                            'timestamp': int(time.time() * 1000),
-                            'version': 1
-                        }]
-                        prompt['currentVersion'] = 1
-                    if 'usageCount' not in prompt:
-                        prompt['usageCount'] = 0
-                
-                # Ensure all folders have order field and parentId
-                for i, folder in enumerate(data.get('folders', [])):
-                    if 'order' not in folder:
-                        folder['order'] = i
-                    if 'parentId' not in folder:
-                        folder['parentId'] = None
-                    if 'expanded' not in folder:
-                        folder['expanded'] = True
-                
-                # Sort folders by order
-                data['folders'] = sorted(data.get('folders', []), key=lambda x: x.get('order', 0))
-                
-                return data
-        except json.JSONDecodeError:
-            pass
-    return {'prompts': [], 'folders': []}
-
-def save_data(data):
-    """Save data to config.json"""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+# Legacy single-document config used by index.html/app.js
+CONFIG_PATH = "config.json"
+
+response_cache = ResponseCache()
+
+repo, events, usage = settings.open_repository()
+settings.enable_diagnostics(app, repo)
+app.register_blueprint(read_api(repo, events, usage, response_cache))
+
+def revision_conflict(kind, item):
+    """An error response if the request's If-Match doesn't allow changing `item`, else None.
+
+    400 if the header is malformed, 409 if it names another revision (see
+    if_match_revision).
+    """
+    try:
+        expected = if_match_revision()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conflict = revision_conflict_body(kind, item, expected)
+    if conflict is not None:
+        return jsonify(conflict), 409
+    return None
 
 @app.route('/')
 def index():
@@ -59,18 +39,25 @@ def index():
 
 @app.route('/api/data', methods=['GET'])
 def get_data():
-    """Get all prompts and folders"""
-    return jsonify(load_data())
+    """Get all prompts (without version history) and folders"""
+    def build():
+        data = repo.summary_document()
+        data['folders'].sort(key=lambda x: x.get('order', 0))
+        return data
+
+    with repo.lock:
+        etag = repo.etag()
+        entry = response_cache.get('data', etag, build)
+    return response_cache.response(entry, etag)
 
 @app.route('/api/prompts', methods=['POST'])
 def add_prompt():
     """Add a new prompt"""
-    data = load_data()
     prompt_data = request.json
-    
+
     now = int(time.time() * 1000)
     new_prompt = {
-        'id': str(now),
+        'id': repo.new_id(now),
         'name': prompt_data['name'],
         'text': prompt_data['text'],
         'folderId': prompt_data.get('folderId'),
@@ -84,586 +71,205 @@ def add_prompt():
         'currentVersion': 1,
         'usageCount': 0
     }
-    
-    data['prompts'].append(new_prompt)
-    save_data(data)
-    return jsonify(new_prompt)
+
+    with repo.transaction():
+        repo.insert('prompt', new_prompt)
+        return jsonify(repo.prompt_summary(new_prompt))
 
 @app.route('/api/prompts/<prompt_id>', methods=['PUT'])
 def update_prompt(prompt_id):
-    """Update a prompt (creates new version)"""
-    data = load_data()
+    """Update a prompt (creates new version); If-Match: "<rev>" makes it conditional"""
     updates = request.json
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
+
+    with repo.transaction():
+        prompt = repo.get_prompt(prompt_id)
+        if prompt:
+            conflict = revision_conflict('prompt', prompt)
+            if conflict:
+                return conflict
             new_version = prompt['currentVersion'] + 1
             now = int(time.time() * 1000)
-            
-            new_version_entry = {
+            name = updates.get('name', prompt['name'])
+            text = updates.get('text', prompt['text'])
+
+            repo.add_version(prompt_id, {
                 'id': f"{now}-v{new_version}",
-                'name': updates.get('name', prompt['name']),
-                'text': updates.get('text', prompt['text']),
+                'name': name,
+                'text': text,
                 'timestamp': now,
                 'version': new_version
-            }
-            
-            prompt['name'] = updates.get('name', prompt['name'])
-            prompt['text'] = updates.get('text', prompt['text'])
-            prompt['versions'].append(new_version_entry)
-            prompt['currentVersion'] = new_version
-            break
-    
-    save_data(data)
+            })
+            repo.update('prompt', prompt_id, name=name, text=text, currentVersion=new_version)
+            return jsonify({'success': True, 'rev': prompt['rev']})
+
     return jsonify({'success': True})
 
 @app.route('/api/prompts/<prompt_id>', methods=['DELETE'])
 def delete_prompt(prompt_id):
-    """Delete a prompt"""
-    data = load_data()
-    data['prompts'] = [p for p in data['prompts'] if p['id'] != prompt_id]
-    save_data(data)
+    """Delete a prompt; If-Match: "<rev>" makes it conditional"""
+    with repo.transaction():
+        prompt = repo.get_prompt(prompt_id)
+        if prompt:
+            conflict = revision_conflict('prompt', prompt)
+            if conflict:
+                return conflict
+            repo.delete('prompt', prompt_id)
     return jsonify({'success': True})
 
 @app.route('/api/prompts/<prompt_id>/copy', methods=['POST'])
 def copy_prompt(prompt_id):
     """Track prompt copy with cooldown"""
-    data = load_data()
-    now = int(time.time() * 1000)
-    cooldown_ms = COOLDOWN_MINUTES * 60 * 1000
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            last_copied = prompt.get('lastCopiedAt', 0)
-            if now - last_copied >= cooldown_ms:
-                prompt['usageCount'] = prompt.get('usageCount', 0) + 1
-                prompt['lastCopiedAt'] = now
-            break
-    
-    save_data(data)
+    usage.record(prompt_id)
     return jsonify({'success': True})
 
 @app.route('/api/prompts/<prompt_id>/restore/<version_id>', methods=['POST'])
 def restore_version(prompt_id, version_id):
     """Restore a prompt to a previous version"""
-    data = load_data()
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            for version in prompt['versions']:
-                if version['id'] == version_id:
-                    prompt['name'] = version['name']
-                    prompt['text'] = version['text']
-                    break
-            break
-    
-    save_data(data)
+    with repo.transaction():
+        version = repo.find_version(prompt_id, version_id)
+        if version:
+            repo.update('prompt', prompt_id, name=version['name'], text=version['text'])
+
+    return jsonify({'success': True})
+
+@app.route('/api/folders/<folder_id>/state', methods=['PUT'])
+def set_folder_state(folder_id):
+    """Save whether a folder is expanded in the sidebar"""
+    expanded = bool(request.json.get('expanded'))
+    with repo.transaction():
+        folder = repo.get_folder(folder_id)
+        if not folder:
+            return jsonify({'error': 'Folder not found'}), 404
+        if folder.get('expanded') != expanded:
+            repo.update('folder', folder_id, expanded=expanded)
     return jsonify({'success': True})
 
 @app.route('/api/folders', methods=['POST'])
 def add_folder():
     """Add a new folder"""
-    data = load_data()
     folder_data = request.json
-    
-    # Get the highest order number for the same parent level
-    parent_id = folder_data.get('parentId')
-    siblings = [f for f in data['folders'] if f.get('parentId') == parent_id]
-    max_order = max([f.get('order', 0) for f in siblings], default=-1)
-    
-    new_folder = {
-        'id': str(int(time.time() * 1000)),
-        'name': folder_data['name'],
-        'expanded': True,
-        'order': max_order + 1,
-        'parentId': parent_id
-    }
-    
-    data['folders'].append(new_folder)
-    save_data(data)
-    return jsonify(new_folder)
 
-@app.route('/api/folders/<folder_id>', methods=['DELETE'])
-def delete_folder(folder_id):
-    """Delete a folder (moves prompts and subfolders to parent)"""
-    data = load_data()
-    
-    # Find the folder being deleted
-    folder_to_delete = None
-    for folder in data['folders']:
-        if folder['id'] == folder_id:
-            folder_to_delete = folder
-            break
-    
-    if not folder_to_delete:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    parent_id = folder_to_delete.get('parentId')
-    
-    # Move child folders to parent
-    for folder in data['folders']:
-        if folder.get('parentId') == folder_id:
-            folder['parentId'] = parent_id
-    
-    # Move prompts to parent folder
-    for prompt in data['prompts']:
-        if prompt.get('folderId') == folder_id:
-            prompt['folderId'] = parent_id
-    
-    # Remove folder
-    data['folders'] = [f for f in data['folders'] if f['id'] != folder_id]
-    
-    save_data(data)
-    return jsonify({'success': True})
+    with repo.transaction():
+        parent_id = folder_data.get('parentId')
 
-@app.route('/api/folders/<folder_id>/move-up', methods=['POST'])
-def move_folder_up(folder_id):
-    """Move folder up in order within same parent"""
-    data = load_data()
-    
-    # Find the folder
-    folder = None
-    for f in data['folders']:
-        if f['id'] == folder_id:
-            folder = f
-            break
-    
-    if not folder:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    # Get siblings (folders with same parent)
-    siblings = [f for f in data['folders'] if f.get('parentId') == folder.get('parentId')]
-    siblings.sort(key=lambda x: x.get('order', 0))
-    
-    # Find current position
-    current_index = next((i for i, f in enumerate(siblings) if f['id'] == folder_id), -1)
-    
-    if current_index > 0:
-        # Swap orders with previous sibling
-        prev_folder = siblings[current_index - 1]
-        folder['order'], prev_folder['order'] = prev_folder['order'], folder['order']
-        
-        save_data(data)
-        return jsonify({'success': True})
-    
-    return jsonify({'error': 'Cannot move up'}), 400
+        new_folder = {
+            'id': repo.new_id(),
+            'name': folder_data['name'],
+            'expanded': True,
+            'order': repo.tree.append_order(parent_id),
+            'parentId': parent_id
+        }
 
-@app.route('/api/folders/<folder_id>/move-down', methods=['POST'])
-def move_folder_down(folder_id):
-    """Move folder down in order within same parent"""
-    data = load_data()
-    
-    # Find the folder
-    folder = None
-    for f in data['folders']:
-        if f['id'] == folder_id:
-            folder = f
-            break
-    
-    if not folder:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    # Get siblings (folders with same parent)
-    siblings = [f for f in data['folders'] if f.get('parentId') == folder.get('parentId')]
-    siblings.sort(key=lambda x: x.get('order', 0))
-    
-    # Find current position
-    current_index = next((i for i, f in enumerate(siblings) if f['id'] == folder_id), -1)
-    
-    if current_index < len(siblings) - 1:
-        # Swap orders with next sibling
-        next_folder = siblings[current_index + 1]
-        folder['order'], next_folder['order'] = next_folder['order'], folder['order']
-        
-        save_data(data)
-        return jsonify({'success': True})
-    
-    return jsonify({'error': 'Cannot move down'}), 400
+        repo.insert('folder', new_folder)
+        return jsonify(new_folder)
 
-@app.route('/api/folders/<folder_id>/move', methods=['POST'])
-def move_folder(folder_id):
-    """Move folder to different parent (for nesting)"""
-    data = load_data()
-    new_parent_id = request.json.get('parentId')
-    
-    # Find the folder
-    folder = None
-    for f in data['folders']:
-        if f['id'] == folder_id:
-            folder = f
-            break
-    
-    if not folder:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    # Check for circular reference
-    def would_create_cycle(folder_id, target_parent_id):
-        if target_parent_id is None:
-            return False
-        if target_parent_id == folder_id:
-            return True
-        
-        for f in data['folders']:
-            if f['id'] == target_parent_id:
-                return would_create_cycle(folder_id, f.get('parentId'))
-        return False
-    
-    if would_create_cycle(folder_id, new_parent_id):
-        return jsonify({'error': 'Cannot create circular reference'}), 400
-    
-    # Update parent
-    folder['parentId'] = new_parent_id
-    
-    # Update order to be last in new parent
-    siblings = [f for f in data['folders'] if f.get('parentId') == new_parent_id and f['id'] != folder_id]
-    max_order = max([f.get('order', 0) for f in siblings], default=-1)
-    folder['order'] = max_order + 1
-    
-    save_data(data)
-    return jsonify({'success': True})
-
-@app.route('/api/prompts/<prompt_id>/move', methods=['POST'])
-def move_prompt(prompt_id):
-    """Move prompt to folder"""
-    data = load_data()
-    folder_id = request.json.get('folderId')
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            prompt['folderId'] = folder_id
-            break
-    
-    save_data(data)
-    return jsonify({'success': True})
+@app.route('/api/folders/<folder_id>', methods=['DELETE'])
+def delete_folder(folder_id):
+    """Delete a folder (moves prompts and subfolders to parent); If-Match: "<rev>" makes it conditional"""
+    with repo.transaction():
+        folder_to_delete = repo.get_folder(folder_id)
+        if not folder_to_delete:
+            return jsonify({'error': 'Folder not found'}), 404
+        conflict = revision_conflict('folder', folder_to_delete)
+        if conflict:
+            return conflict
 
-if __name__ == '__main__':
-    app.run(debug=True)
+        parent_id = folder_to_delete.get('parentId')
 
-                        prompt['currentVersion'] = 1
-                    if 'usageCount' not in prompt:
-                        prompt['usageCount'] = 0
-                
-                # Ensure all folders have order field and parentId
-                for i, folder in enumerate(data.get('folders', [])):
-                    if 'order' not in folder:
-                        folder['order'] = i
-                    if 'parentId' not in folder:
-                        folder['parentId'] = None
-                    if 'expanded' not in folder:
-                        folder['expanded'] = True
-                
-                # Sort folders by order
-                data['folders'] = sorted(data.get('folders', []), key=lambda x: x.get('order', 0))
-                
-                return data
-        except json.JSONDecodeError:
-            pass
-    return {'prompts': [], 'folders': []}
-
-def save_data(data):
-    """Save data to config.json"""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+        # Move child folders to parent
+        for folder in repo.child_folders(folder_id):
+            repo.update('folder', folder['id'], parentId=parent_id)
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+        # Move prompts to parent folder
+        for prompt in repo.child_prompts(folder_id):
+            repo.update('prompt', prompt['id'], folderId=parent_id)
 
-@app.route('/api/data', methods=['GET'])
-def get_data():
-    """Get all prompts and folders"""
-    return jsonify(load_data())
+        # Remove folder
+        repo.delete('folder', folder_id)
 
-@app.route('/api/prompts', methods=['POST'])
-def add_prompt():
-    """Add a new prompt"""
-    data = load_data()
-    prompt_data = request.json
-    
-    now = int(time.time() * 1000)
-    new_prompt = {
-        'id': str(now),
-        'name': prompt_data['name'],
-        'text': prompt_data['text'],
-        'folderId': prompt_data.get('folderId'),
-        'versions': [{
-            'id': f"{now}-v1",
-            'name': prompt_data['name'],
-            'text': prompt_data['text'],
-            'timestamp': now,
-            'version': 1
-        }],
-        'currentVersion': 1,
-        'usageCount': 0
-    }
-    
-    data['prompts'].append(new_prompt)
-    save_data(data)
-    return jsonify(new_prompt)
-
-@app.route('/api/prompts/<prompt_id>', methods=['PUT'])
-def update_prompt(prompt_id):
-    """Update a prompt (creates new version)"""
-    data = load_data()
-    updates = request.json
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            new_version = prompt['currentVersion'] + 1
-            now = int(time.time() * 1000)
-            
-            new_version_entry = {
-                'id': f"{now}-v{new_version}",
-                'name': updates.get('name', prompt['name']),
-                'text': updates.get('text', prompt['text']),
-                'timestamp': now,
-                'version': new_version
-            }
-            
-            prompt['name'] = updates.get('name', prompt['name'])
-            prompt['text'] = updates.get('text', prompt['text'])
-            prompt['versions'].append(new_version_entry)
-            prompt['currentVersion'] = new_version
-            break
-    
-    save_data(data)
     return jsonify({'success': True})
 
-@app.route('/api/prompts/<prompt_id>', methods=['DELETE'])
-def delete_prompt(prompt_id):
-    """Delete a prompt"""
-    data = load_data()
-    data['prompts'] = [p for p in data['prompts'] if p['id'] != prompt_id]
-    save_data(data)
-    return jsonify({'success': True})
-
-@app.route('/api/prompts/<prompt_id>/copy', methods=['POST'])
-def copy_prompt(prompt_id):
-    """Track prompt copy with cooldown"""
-    data = load_data()
-    now = int(time.time() * 1000)
-    cooldown_ms = COOLDOWN_MINUTES * 60 * 1000
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            last_copied = prompt.get('lastCopiedAt', 0)
-            if now - last_copied >= cooldown_ms:
-                prompt['usageCount'] = prompt.get('usageCount', 0) + 1
-                prompt['lastCopiedAt'] = now
-            break
-    
-    save_data(data)
-    return jsonify({'success': True})
-
-@app.route('/api/prompts/<prompt_id>/restore/<version_id>', methods=['POST'])
-def restore_version(prompt_id, version_id):
-    """Restore a prompt to a previous version"""
-    data = load_data()
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            for version in prompt['versions']:
-                if version['id'] == version_id:
-                    prompt['name'] = version['name']
-                    prompt['text'] = version['text']
-                    break
-            break
-    
-    save_data(data)
-    return jsonify({'success': True})
-
-@app.route('/api/folders', methods=['POST'])
-def add_folder():
-    """Add a new folder"""
-    data = load_data()
-    folder_data = request.json
-    
-    # Get the highest order number for folders at the same level
-    parent_id = folder_data.get('parentId')
-    same_level_folders = [f for f in data['folders'] if f.get('parentId') == parent_id]
-    max_order = max([f.get('order', 0) for f in same_level_folders], default=-1)
-    
-    new_folder = {
-        'id': str(int(time.time() * 1000)),
-        'name': folder_data['name'],
-        'expanded': True,
-        'order': max_order + 1,
-        'parentId': parent_id
-    }
-    
-    data['folders'].append(new_folder)
-    save_data(data)
-    return jsonify(new_folder)
-
-@app.route('/api/folders/<folder_id>', methods=['DELETE'])
-def delete_folder(folder_id):
-    """Delete a folder (moves prompts and subfolders to parent)"""
-    data = load_data()
-    
-    # Find the folder being deleted
-    folder_to_delete = None
-    for folder in data['folders']:
-        if folder['id'] == folder_id:
-            folder_to_delete = folder
-            break
-    
-    if not folder_to_delete:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    parent_id = folder_to_delete.get('parentId')
-    
-    # Move child folders to parent
-    for folder in data['folders']:
-        if folder.get('parentId') == folder_id:
-            folder['parentId'] = parent_id
-    
-    # Move prompts to parent folder
-    for prompt in data['prompts']:
-        if prompt.get('folderId') == folder_id:
-            prompt['folderId'] = parent_id
-    
-    # Remove folder
-    data['folders'] = [f for f in data['folders'] if f['id'] != folder_id]
-    
-    save_data(data)
-    return jsonify({'success': True})
+def swap_folder_order(folder_id, offset):
+    """Swap a folder's order with the sibling `offset` places away; returns the response"""
+    with repo.transaction():
+        folder = repo.get_folder(folder_id)
+        if not folder:
+            return jsonify({'error': 'Folder not found'}), 404
+        conflict = revision_conflict('folder', folder)
+        if conflict:
+            return conflict
+
+        # Get siblings (folders with same parent), already in order
+        siblings = repo.child_folders(folder.get('parentId'))
+
+        # Find current position
+        current_index = next((i for i, f in enumerate(siblings) if f['id'] == folder_id), -1)
+        other_index = current_index + offset
+
+        if 0 <= other_index < len(siblings):
+            other = siblings[other_index]
+            folder_order, other_order = folder['order'], other['order']
+            repo.update('folder', folder_id, order=other_order)
+            repo.update('folder', other['id'], order=folder_order)
+            return jsonify({'success': True})
+    return jsonify({'error': f"Cannot move {'up' if offset < 0 else 'down'}"}), 400
 
 @app.route('/api/folders/<folder_id>/move-up', methods=['POST'])
 def move_folder_up(folder_id):
-    """Move folder up in order"""
-    data = load_data()
-    
-    # Find the folder
-    folder = None
-    for f in data['folders']:
-        if f['id'] == folder_id:
-            folder = f
-            break
-    
-    if not folder:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    # Get siblings (folders with same parent)
-    siblings = [f for f in data['folders'] if f.get('parentId') == folder.get('parentId')]
-    siblings.sort(key=lambda x: x.get('order', 0))
-    
-    # Find current position
-    current_index = next((i for i, f in enumerate(siblings) if f['id'] == folder_id), -1)
-    
-    if current_index > 0:
-        # Swap orders with previous sibling
-        prev_folder = siblings[current_index - 1]
-        folder['order'], prev_folder['order'] = prev_folder['order'], folder['order']
-        
-        save_data(data)
-        return jsonify({'success': True})
-    
-    return jsonify({'error': 'Cannot move up'}), 400
+    """Move folder up in order within same parent"""
+    return swap_folder_order(folder_id, -1)
 
 @app.route('/api/folders/<folder_id>/move-down', methods=['POST'])
 def move_folder_down(folder_id):
-    """Move folder down in order"""
-    data = load_data()
-    
-    # Find the folder
-    folder = None
-    for f in data['folders']:
-        if f['id'] == folder_id:
-            folder = f
-            break
-    
-    if not folder:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    # Get siblings (folders with same parent)
-    siblings = [f for f in data['folders'] if f.get('parentId') == folder.get('parentId')]
-    siblings.sort(key=lambda x: x.get('order', 0))
-    
-    # Find current position
-    current_index = next((i for i, f in enumerate(siblings) if f['id'] == folder_id), -1)
-    
-    if current_index < len(siblings) - 1:
-        # Swap orders with next sibling
-        next_folder = siblings[current_index + 1]
-        folder['order'], next_folder['order'] = next_folder['order'], folder['order']
-        
-        save_data(data)
-        return jsonify({'success': True})
-    
-    return jsonify({'error': 'Cannot move down'}), 400
+    """Move folder down in order within same parent"""
+    return swap_folder_order(folder_id, 1)
 
 @app.route('/api/folders/<folder_id>/move', methods=['POST'])
 def move_folder(folder_id):
-    """Move folder to different parent"""
-    data = load_data()
+    """Move folder to different parent (for nesting)"""
     new_parent_id = request.json.get('parentId')
-    
-    # Find the folder
-    folder = None
-    for f in data['folders']:
-        if f['id'] == folder_id:
-            folder = f
-            break
-    
-    if not folder:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    # Check for circular reference
-    def would_create_cycle(folder_id, target_parent_id):
-        if target_parent_id is None:
-            return False
-        if target_parent_id == folder_id:
-            return True
-        
-        for f in data['folders']:
-            if f['id'] == target_parent_id:
-                return would_create_cycle(folder_id, f.get('parentId'))
-        return False
-    
-    if would_create_cycle(folder_id, new_parent_id):
-        return jsonify({'error': 'Cannot create circular reference'}), 400
-    
-    # Update parent
-    folder['parentId'] = new_parent_id
-    
-    # Update order to be last in new parent
-    siblings = [f for f in data['folders'] if f.get('parentId') == new_parent_id and f['id'] != folder_id]
-    max_order = max([f.get('order', 0) for f in siblings], default=-1)
-    folder['order'] = max_order + 1
-    
-    save_data(data)
+
+    with repo.transaction():
+        folder = repo.get_folder(folder_id)
+        if not folder:
+            return jsonify({'error': 'Folder not found'}), 404
+        conflict = revision_conflict('folder', folder)
+        if conflict:
+            return conflict
+
+        # Check for circular reference
+        if repo.tree.would_create_cycle(folder_id, new_parent_id):
+            return jsonify({'error': 'Cannot create circular reference'}), 400
+
+        # Update order to be last in new parent
+        repo.update('folder', folder_id, parentId=new_parent_id,
+                    order=repo.tree.append_order(new_parent_id))
+
     return jsonify({'success': True})
 
 @app.route('/api/prompts/<prompt_id>/move', methods=['POST'])
 def move_prompt(prompt_id):
     """Move prompt to folder"""
-    data = load_data()
     folder_id = request.json.get('folderId')
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            prompt['folderId'] = folder_id
-            break
-    
-    save_data(data)
-    return jsonify({'success': True})
 
-if __name__ == '__main__':
-    app.run(debug=True)
+    with repo.transaction():
+        prompt = repo.get_prompt(prompt_id)
+        if prompt:
+            conflict = revision_conflict('prompt', prompt)
+            if conflict:
+                return conflict
+            repo.update('prompt', prompt_id, folderId=folder_id)
 
+    return jsonify({'success': True})
 
-
-from flask import Flask, render_template, request, jsonify
-import json
-import os
-
-app = Flask(__name__)
-CONFIG_PATH = "config.json"
-
-def load_config():
+# ------------------ Legacy config (index.html / app.js) ------------------
+def ensure_config():
     if not os.path.exists(CONFIG_PATH):
         with open(CONFIG_PATH, 'w') as f:
             json.dump({"folders": {}}, f)
+
+def load_config():
+    ensure_config()
     with open(CONFIG_PATH, 'r') as f:
         return json.load(f)
 
@@ -671,13 +277,14 @@ def save_config(data):
     with open(CONFIG_PATH, 'w') as f:
         json.dump(data, f, indent=2)
 
-@app.route('/')
-def index():
-    return render_template('index.html')
-
 @app.route('/get_config', methods=['GET'])
 def get_config():
-    return jsonify(load_config())
+    ensure_config()
+    # The file is only read and parsed when it changed since the cached body
+    st = os.stat(CONFIG_PATH)
+    etag = f"{st.st_mtime_ns}-{st.st_size}"
+    entry = response_cache.get('config', etag, load_config)
+    return response_cache.response(entry, etag)
 
 @app.route('/save_config', methods=['POST'])
 def save_config_route():
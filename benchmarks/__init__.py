@@ -0,0 +1,14 @@
+"""Benchmarks on synthetic repositories.
+
+Run from the project root:
+
+    python -m benchmarks run [--shape small|medium|large|deep|flat] [--prompts N] ...
+    python -m benchmarks compare OLD.json NEW.json
+
+``run`` generates a repository of the requested shape (generate.py),
+times loading and saving it (persistence.py) and every route of app.py
+and dapp.py through the Flask test client (routes.py, one process per
+app). It prints ops/s, p50/p99 latency and traced peak memory per
+benchmark and saves everything as JSON under benchmarks/results (ignored
+by git; ``--results-dir`` writes elsewhere), which ``compare`` diffs.
+"""
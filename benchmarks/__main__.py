@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import generate, persistence
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+COLUMNS = ('opsPerSecond', 'p50Ms', 'p99Ms', 'peakKb')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_app(app, data_path, args, workdir):
+    """Benchmark one app's routes in a fresh process; returns its results"""
+    out = Path(workdir) / f'{app}.json'
+    env = dict(os.environ, PYTHONPATH=str(ROOT), PROMPT_STORAGE_MODE=args.storage,
+               PROMPT_SNAPSHOT_FORMAT=args.snapshot_format,
+               PROMPT_SYNC_WRITES='1' if args.sync_writes else '0')
+    command = [sys.executable, '-m', 'benchmarks.routes', '--app', app, '--data', str(data_path),
+               '--iterations', str(args.iterations), '--out', str(out)]
+    if args.skip_memory:
+        command.append('--skip-memory')
+    subprocess.run(command, env=env, check=True)
+    with open(out) as f:
+        return json.load(f)
+
+
+def print_table(title, results):
+    print(f'\n{title}')
+    print(f"  {'':58}{'ops/s':>11}{'p50 ms':>11}{'p99 ms':>11}{'peak KB':>11}")
+    for name, result in results.items():
+        cells = ''.join(f"{result.get(c) if result.get(c) is not None else '-':>11}" for c in COLUMNS)
+        print(f'  {name:58}{cells}')
+
+
+def run(args):
+    options = generate.options_from_args(args)
+    with tempfile.TemporaryDirectory(prefix='promptrepo-bench-') as workdir:
+        data_path = Path(workdir) / 'config.json'
+        print(f'Generating {options}')
+        started = time.perf_counter()
+        document = generate.generate(**options)
+        stored_bytes = generate.write(document, data_path, args.snapshot_format)
+        del document
+        generated = time.perf_counter() - started
+
+        print('Benchmarking load and save')
+        results = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'shape': dict(options, name=args.shape),
+            'config': {'storage': args.storage, 'snapshotFormat': args.snapshot_format,
+                       'syncWrites': args.sync_writes, 'iterations': args.iterations},
+            'data': {'bytes': stored_bytes, 'generateSeconds': round(generated, 3)},
+            'persistence': persistence.run(data_path, args.storage, args.snapshot_format,
+                                           iterations=args.load_iterations, memory=not args.skip_memory),
+            'apps': {}
+        }
+        for app in args.apps:
+            print(f'Benchmarking {app} routes')
+            results['apps'][app] = run_app(app, data_path, args, workdir)
+
+    print_table('Load and save', results['persistence'])
+    for app, app_results in results['apps'].items():
+        print_table(f"{app} (started in {app_results['startupSeconds']}s)", app_results['routes'])
+        if app_results['uncovered']:
+            print(f"  Not benchmarked: {', '.join(app_results['uncovered'])}")
+
+    results_dir = Path(args.results_dir)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    path = results_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{args.shape or 'custom'}.json"
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nSaved {path}')
+
+
+def flatten(results):
+    """Benchmark name -> result for every benchmark in a results file"""
+    flat = {f'persistence {k}': v for k, v in results.get('persistence', {}).items()}
+    for app, app_results in results.get('apps', {}).items():
+        flat.update({f'{app} {k}': v for k, v in app_results['routes'].items()})
+    return flat
+
+
+def compare(args):
+    with open(args.old) as f:
+        old = flatten(json.load(f))
+    with open(args.new) as f:
+        new = flatten(json.load(f))
+    print(f"{'':66}{'old p50':>10}{'new p50':>10}{'change':>9}")
+    for name in (name for name in old if name in new):
+        before, after = old[name]['p50Ms'], new[name]['p50Ms']
+        change = f'{(after - before) / before * 100:+.0f}%' if before else '-'
+        flag = ' <' if before and after > before * (1 + args.threshold / 100) else ''
+        print(f'{name:66}{before:>10}{after:>10}{change:>9}{flag}')
+    for name in sorted(old.keys() ^ new.keys()):
+        print(f"{name:66} only in {'old' if name in old else 'new'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Benchmark the prompt repository on synthetic data')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='generate a repository and benchmark it')
+    generate.add_shape_arguments(run_parser)
+    run_parser.add_argument('--apps', nargs='+', default=['app', 'dapp'], choices=['app', 'dapp'])
+    run_parser.add_argument('--iterations', type=int, default=200, help='requests per route')
+    run_parser.add_argument('--load-iterations', type=int, default=3,
+                            help='repetitions of the load and save benchmarks')
+    run_parser.add_argument('--storage', default='snapshot', choices=['snapshot', 'journal', 'sqlite', 'shared'])
+    run_parser.add_argument('--snapshot-format', default='json', choices=['binary', 'json'])
+    run_parser.add_argument('--sync-writes', action='store_true', help='write before every response')
+    run_parser.add_argument('--skip-memory', action='store_true', help='skip the traced peak-memory runs')
+    run_parser.add_argument('--results-dir', default=str(RESULTS_DIR))
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='compare the p50 latencies of two result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10,
+                                help='mark benchmarks slower by more than this percentage')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Synthetic repositories for the benchmarks.
+
+python -m benchmarks.generate OUT [--shape NAME] [--prompts N] ... writes a
+config.json-layout document (delta-encoded histories, current
+schemaVersion) of the requested shape.
+"""
+import argparse
+import math
+import random
+import string
+import time
+from pathlib import Path
+
+import serializers
+from migrations import SCHEMA_VERSION
+from storage import write_file_atomic
+from versions import VersionStore
+
+# Named shapes; explicit options override them
+SHAPES = {
+    'small': {'prompts': 10_000, 'versions': 5, 'folder_depth': 3, 'fan_out': 4},
+    'medium': {'prompts': 100_000, 'versions': 5, 'folder_depth': 3, 'fan_out': 6},
+    'large': {'prompts': 1_000_000, 'versions': 3, 'folder_depth': 4, 'fan_out': 6},
+    'deep': {'prompts': 10_000, 'versions': 50, 'folder_depth': 8, 'fan_out': 2},
+    'flat': {'prompts': 10_000, 'versions': 5, 'folder_depth': 1, 'fan_out': 2, 'mega_folder': 5_000},
+}
+
+DEFAULTS = {'prompts': 10_000, 'versions': 5, 'folder_depth': 3, 'fan_out': 4,
+            'mega_folder': 0, 'words': 60, 'seed': 1}
+
+# Ids are millisecond timestamps, like the ones the apps hand out
+BASE_ID = 1_700_000_000_000
+
+
+def shape_options(shape=None, **overrides):
+    """Generator options for a named shape with explicit overrides applied"""
+    options = dict(DEFAULTS)
+    if shape:
+        options.update(SHAPES[shape])
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return options
+
+
+def _vocabulary(rng, size=2000):
+    return [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+            for _ in range(size)]
+
+
+def _folders(folder_depth, fan_out, next_id):
+    """A tree `folder_depth` levels deep with `fan_out` subfolders per folder"""
+    folders = []
+    parents = [None]
+    for depth in range(folder_depth):
+        level = []
+        for parent_id in parents:
+            for order in range(fan_out):
+                folder = {'id': next_id(), 'name': f'Folder {depth}.{len(level)}',
+                          'parentId': parent_id, 'order': order, 'expanded': depth == 0, 'rev': 1}
+                level.append(folder)
+        folders.extend(level)
+        parents = [f['id'] for f in level]
+    return folders
+
+
+def _render(words, per_line=10):
+    # Multi-line like real prompts, so edits change a few lines (deltas are by line)
+    return '\n'.join(' '.join(words[i:i + per_line]) for i in range(0, len(words), per_line))
+
+
+def _history(rng, vocabulary, prompt_id, name, versions, words, now):
+    """Versions with full texts, each a small edit of the one before"""
+    text = rng.choices(vocabulary, k=words)
+    history = []
+    for number in range(1, versions + 1):
+        if number > 1:
+            # Replace a few words and sometimes append a sentence
+            for _ in range(rng.randint(1, 4)):
+                text[rng.randrange(len(text))] = rng.choice(vocabulary)
+            if rng.random() < 0.3:
+                text.extend(rng.choices(vocabulary, k=rng.randint(3, 12)))
+        history.append({'id': f'{prompt_id}-v{number}', 'name': name, 'text': _render(text),
+                        'timestamp': now - (versions - number) * 60_000, 'version': number})
+    return history
+
+
+def generate(prompts=10_000, versions=5, folder_depth=3, fan_out=4, mega_folder=0,
+             words=60, seed=1):
+    """A repository document of the given shape.
+
+    Prompts are spread at random over the folder tree and the top level,
+    except `mega_folder` of them, which all go into one extra flat folder.
+    Each prompt has `versions` versions of about `words` words; copy counts
+    are heavy-tailed, as real usage is. Apart from timestamps (relative to
+    now), the same arguments always produce the same document.
+    """
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+    now = int(time.time() * 1000)
+    counter = iter(range(BASE_ID, BASE_ID + 10 ** 9))
+
+    def next_id():
+        return str(next(counter))
+
+    folders = _folders(folder_depth, fan_out, next_id)
+    containers = [None] + [f['id'] for f in folders]
+    mega_id = None
+    if mega_folder:
+        mega_id = next_id()
+        folders.append({'id': mega_id, 'name': 'Everything', 'parentId': None,
+                        'order': fan_out, 'expanded': False, 'rev': 1})
+
+    store = VersionStore()
+    orders = {}
+    document_prompts = []
+    for i in range(prompts):
+        prompt_id = next_id()
+        container = mega_id if i < mega_folder else rng.choice(containers)
+        name = f'Prompt {i}'
+        history = _history(rng, vocabulary, prompt_id, name, versions, words, now)
+        text = history[-1]['text']
+        # Encode right away so only one prompt's full texts are held at once
+        store.encode_history(prompt_id, history)
+        store.forget(prompt_id)
+        prompt = {'id': prompt_id, 'name': name, 'text': text, 'folderId': container,
+                  'order': orders.get(container, 0), 'versions': history,
+                  'currentVersion': versions, 'rev': versions, 'usageCount': 0}
+        orders[container] = prompt['order'] + 1
+        uses = int(rng.paretovariate(1.2)) - 1
+        if uses > 0:
+            last = now - rng.randrange(30 * 24 * 60 * 60 * 1000)
+            prompt.update(usageCount=uses, lastCopiedAt=last,
+                          recentUsage=round(uses * math.exp(-rng.random()), 3))
+        document_prompts.append(prompt)
+
+    return {'prompts': document_prompts, 'folders': folders,
+            'schemaVersion': SCHEMA_VERSION, 'journalSeq': 0}
+
+
+def write(document, path, snapshot_format='json'):
+    """Write a generated document where a Repository would read it; returns its size"""
+    payload = serializers.make_serializer(snapshot_format).dumps(document)
+    write_file_atomic(Path(path), payload)
+    return len(payload)
+
+
+def add_shape_arguments(parser):
+    parser.add_argument('--shape', choices=sorted(SHAPES), help='named shape (default: small)')
+    parser.add_argument('--prompts', type=int)
+    parser.add_argument('--versions', type=int, help='versions per prompt')
+    parser.add_argument('--folder-depth', type=int)
+    parser.add_argument('--fan-out', type=int, help='subfolders per folder')
+    parser.add_argument('--mega-folder', type=int, help='prompts in one extra flat folder')
+    parser.add_argument('--words', type=int, help='words per prompt text')
+    parser.add_argument('--seed', type=int)
+
+
+def options_from_args(args):
+    return shape_options(args.shape, prompts=args.prompts, versions=args.versions,
+                         folder_depth=args.folder_depth, fan_out=args.fan_out,
+                         mega_folder=args.mega_folder, words=args.words, seed=args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic prompt repository')
+    parser.add_argument('out', help='file to write (e.g. config.json)')
+    parser.add_argument('--snapshot-format', default='json', choices=['binary', 'json'])
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    options = options_from_args(args)
+    started = time.perf_counter()
+    document = generate(**options)
+    size = write(document, args.out, args.snapshot_format)
+    print(f"Wrote {len(document['prompts'])} prompts and {len(document['folders'])} folders "
+          f"({size / 1e6:.1f} MB) to {args.out} in {time.perf_counter() - started:.1f}s")
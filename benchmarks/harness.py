@@ -0,0 +1,54 @@
+import time
+import tracemalloc
+
+
+def percentile(sorted_times, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    index = max(0, min(len(sorted_times) - 1, int(round(fraction * len(sorted_times) + 0.5)) - 1))
+    return sorted_times[index]
+
+
+def summarize(times):
+    """ops/s, p50, p99 and mean (ms) of per-operation durations in seconds"""
+    ordered = sorted(times)
+    total = sum(ordered)
+    return {
+        'iterations': len(ordered),
+        'opsPerSecond': round(len(ordered) / total, 2) if total else None,
+        'p50Ms': round(percentile(ordered, 0.5) * 1000, 4),
+        'p99Ms': round(percentile(ordered, 0.99) * 1000, 4),
+        'meanMs': round(total / len(ordered) * 1000, 4),
+        'maxMs': round(ordered[-1] * 1000, 4)
+    }
+
+
+def peak_memory(run, setup=None):
+    """Peak bytes allocated while running `run` once (traced separately from timing)"""
+    args = setup() if setup else None
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        run(args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(run, setup=None, iterations=100, warmup=3, memory=True):
+    """Time `run(args)` over `iterations` calls, each with fresh `setup()` args.
+
+    Only `run` is timed. Tracing allocations slows Python down several
+    times, so peak memory comes from one extra call made after timing.
+    """
+    for _ in range(warmup):
+        run(setup() if setup else None)
+    times = []
+    for _ in range(iterations):
+        args = setup() if setup else None
+        started = time.perf_counter()
+        run(args)
+        times.append(time.perf_counter() - started)
+    result = summarize(times)
+    if memory:
+        result['peakKb'] = round(peak_memory(run, setup) / 1024, 1)
+    return result
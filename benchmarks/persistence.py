@@ -0,0 +1,75 @@
+"""Loading and saving a repository in isolation from the routes."""
+import atexit
+import itertools
+import shutil
+import tempfile
+from pathlib import Path
+
+import serializers
+from benchmarks.harness import measure
+from repository import Repository
+from storage import make_storage
+
+
+def open_repository(path, storage_mode, snapshot_format):
+    # A long flush interval keeps the write-behind thread out of the timings
+    return Repository(path, flush_interval=3600, storage_mode=storage_mode,
+                      snapshot_format=snapshot_format)
+
+
+def close_repository(repo):
+    repo.close()
+    # Otherwise atexit keeps every opened repository alive
+    atexit.unregister(repo.close)
+
+
+def run(data_path, storage_mode='snapshot', snapshot_format='json', iterations=3, memory=True):
+    """Benchmark reading, loading, snapshotting and writing a copy of `data_path`.
+
+    'load' is the whole startup (read, parse, index), 'read' only the
+    storage read and parse, 'save' a full rewrite and 'flush-edit' the
+    write of one changed prompt, which is where the storage modes differ.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix='promptrepo-bench-'))
+    path = workdir / 'config.json'
+    shutil.copyfile(data_path, path)
+    results = {}
+    try:
+        # The first open may convert the file (e.g. into SQLite)
+        close_repository(open_repository(path, storage_mode, snapshot_format))
+
+        results['load'] = measure(
+            lambda _: close_repository(open_repository(path, storage_mode, snapshot_format)),
+            iterations=iterations, warmup=0, memory=memory)
+
+        storage = make_storage(storage_mode, path, snapshot_format=snapshot_format)
+        results['read'] = measure(lambda _: storage.load(), iterations=iterations, warmup=0, memory=memory)
+        storage.close()
+
+        repo = open_repository(path, storage_mode, snapshot_format)
+        try:
+            results['snapshot'] = measure(lambda _: repo.snapshot(), iterations=iterations,
+                                          warmup=0, memory=memory)
+            document = repo.snapshot()
+            for name, serializer in serializers.SERIALIZERS.items():
+                results[f'serialize-{name}'] = measure(lambda _: serializer.dumps(document),
+                                                       iterations=iterations, warmup=0, memory=memory)
+            del document
+            results['save'] = measure(lambda _: repo.compact(), iterations=iterations,
+                                      warmup=0, memory=memory)
+
+            prompt_ids = itertools.cycle(list(repo.prompts))
+
+            def edit_and_flush(_):
+                with repo.transaction():
+                    prompt_id = next(prompt_ids)
+                    repo.update('prompt', prompt_id, name=repo.prompts[prompt_id]['name'] + '.')
+                repo.flush()
+
+            results['flush-edit'] = measure(edit_and_flush, iterations=iterations * 10,
+                                            warmup=1, memory=memory)
+        finally:
+            close_repository(repo)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
@@ -0,0 +1,239 @@
+"""Drive every route of app.py or dapp.py through the Flask test client.
+
+python -m benchmarks.routes --app dapp --data config.json [--out result.json]
+
+Run it in a process of its own (``python -m benchmarks`` does): importing
+an app opens the repository under $HOME/Documents/PromptData, so HOME is
+pointed at a scratch directory holding a copy of the data first. The
+storage options come from the usual PROMPT_* environment variables.
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.harness import measure
+
+# Routes that touch the whole repository run this fraction of the iterations
+HEAVY_SHARE = 20
+
+IMPORT_PROMPTS = 5
+
+
+def load_app(name, data_path, workdir):
+    """Import app.py or dapp.py serving a copy of `data_path`"""
+    target = Path(workdir) / 'Documents' / 'PromptData' / 'config.json'
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(data_path, target)
+    os.environ['HOME'] = str(workdir)
+    # app.py's legacy config.json is relative to the working directory
+    os.chdir(workdir)
+    return importlib.import_module(name)
+
+
+def import_body(rng):
+    """A small NDJSON export: one folder with a few prompts of two versions"""
+    records = [{'type': 'header', 'format': 'promptrepo-ndjson', 'version': 1},
+               {'type': 'folder', 'id': 'f', 'name': 'Imported', 'parentId': None, 'order': 0}]
+    for i in range(IMPORT_PROMPTS):
+        texts = [f'Imported prompt {i} {rng.random()}', f'Imported prompt {i} edited']
+        records.append({'type': 'prompt', 'id': f'p{i}', 'name': f'Imported {i}', 'text': texts[-1],
+                        'folderId': 'f', 'order': i, 'currentVersion': 2})
+        records.extend({'type': 'version', 'promptId': f'p{i}', 'id': f'p{i}-v{n}', 'name': f'Imported {i}',
+                        'text': text, 'timestamp': 0, 'version': n} for n, text in enumerate(texts, 1))
+    return ''.join(json.dumps(r) + '\n' for r in records)
+
+
+class Fixture:
+    """Picks existing items for requests and creates throwaway ones"""
+
+    def __init__(self, module, seed=1):
+        self.module = module
+        self.repo = module.repo
+        self.client = module.app.test_client()
+        self.rng = random.Random(seed)
+        with self.repo.lock:
+            self.prompt_ids = list(self.repo.prompts)
+            self.folder_ids = list(self.repo.folders)
+            self.top_folders = [f['id'] for f in self.repo.child_folders(None)]
+            sizes = Counter(p.get('folderId') for p in self.repo.prompts.values())
+        # The container with the most prompts, for paging and moves
+        self.largest = max(sizes, key=sizes.get) if sizes else None
+        self.largest_ids = [pid for pid in self.prompt_ids
+                            if self.repo.prompts[pid].get('folderId') == self.largest]
+        self.words = self.repo.prompts[self.prompt_ids[0]]['text'].split() if self.prompt_ids else ['x']
+
+    def prompt(self):
+        return self.rng.choice(self.prompt_ids)
+
+    def folder(self):
+        return self.rng.choice(self.folder_ids) if self.folder_ids else None
+
+    def container_path(self, container_id):
+        return 'root' if container_id is None else container_id
+
+    def new_prompt(self):
+        data = self.client.post('/api/prompts', json={'name': 'Scratch', 'text': 'scratch'}).get_json()
+        return data['id']
+
+    def new_folder(self):
+        return self.client.post('/api/folders', json={'name': 'Scratch'}).get_json()['id']
+
+
+def common_scenarios(fx):
+    """(method, rule) -> (setup returning request args, heavy) for routes both apps have"""
+    def edit():
+        pid = fx.prompt()
+        return {'path': f'/api/prompts/{pid}', 'json': {'text': f'Edited {fx.rng.random()}'}}
+
+    def restore():
+        pid = fx.prompt()
+        return {'path': f"/api/prompts/{pid}/restore/{fx.repo.prompts[pid]['versions'][0]['id']}"}
+
+    def toggle_state():
+        fid = fx.folder()
+        return {'path': f'/api/folders/{fid}/state',
+                'json': {'expanded': not fx.repo.folders[fid].get('expanded')}}
+
+    return {
+        ('GET', '/'): (lambda: {'path': '/'}, False),
+        ('GET', '/api/data'): (lambda: {'path': '/api/data'}, True),
+        ('GET', '/api/changes'): (lambda: {'path': f'/api/changes?since={max(fx.repo.revision - 10, 0)}'
+                                                   f'&instance={fx.repo.instance_id}'}, False),
+        ('GET', '/api/events'): (lambda: {'path': '/api/events', 'stream': True}, False),
+        ('GET', '/api/export'): (lambda: {'path': '/api/export'}, True),
+        ('POST', '/api/import'): (lambda: {'path': '/api/import', 'data': import_body(fx.rng)}, False),
+        ('GET', '/api/search'): (lambda: {'path': f'/api/search?q={fx.rng.choice(fx.words)[:4]}'}, False),
+        ('GET', '/api/prompts/top'): (lambda: {'path': '/api/prompts/top?k=50'}, False),
+        ('POST', '/api/prompts'): (lambda: {'path': '/api/prompts', 'json': {
+            'name': 'Benchmark', 'text': f'Benchmark {fx.rng.random()}', 'folderId': fx.folder()}}, False),
+        ('PUT', '/api/prompts/<prompt_id>'): (edit, False),
+        ('DELETE', '/api/prompts/<prompt_id>'): (lambda: {'path': f'/api/prompts/{fx.new_prompt()}'}, False),
+        ('POST', '/api/prompts/<prompt_id>/copy'): (lambda: {'path': f'/api/prompts/{fx.prompt()}/copy'}, False),
+        ('POST', '/api/prompts/<prompt_id>/restore/<version_id>'): (restore, False),
+        ('GET', '/api/prompts/<prompt_id>/versions'): (
+            lambda: {'path': f'/api/prompts/{fx.prompt()}/versions'}, False),
+        ('GET', '/api/folders/stats'): (lambda: {'path': '/api/folders/stats'}, True),
+        ('GET', '/api/folders/<folder_id>/subtree'): (
+            lambda: {'path': f'/api/folders/{fx.rng.choice(fx.top_folders)}/subtree'}, True),
+        ('GET', '/api/folders/<folder_id>/children'): (
+            lambda: {'path': f'/api/folders/{fx.container_path(fx.largest)}/children?limit=100'}, False),
+        ('PUT', '/api/folders/<folder_id>/state'): (toggle_state, False),
+        ('POST', '/api/folders'): (lambda: {'path': '/api/folders', 'json': {
+            'name': 'Benchmark', 'parentId': fx.folder()}}, False),
+        ('DELETE', '/api/folders/<folder_id>'): (lambda: {'path': f'/api/folders/{fx.new_folder()}'}, False),
+    }
+
+
+def app_scenarios(fx):
+    """Routes only app.py has"""
+    return {
+        ('POST', '/api/folders/<folder_id>/move-up'): (
+            lambda: {'path': f'/api/folders/{fx.folder()}/move-up'}, False),
+        ('POST', '/api/folders/<folder_id>/move-down'): (
+            lambda: {'path': f'/api/folders/{fx.folder()}/move-down'}, False),
+        ('POST', '/api/folders/<folder_id>/move'): (
+            lambda: {'path': f'/api/folders/{fx.new_folder()}/move', 'json': {'parentId': fx.folder()}}, False),
+        ('POST', '/api/prompts/<prompt_id>/move'): (
+            lambda: {'path': f'/api/prompts/{fx.prompt()}/move', 'json': {'folderId': fx.folder()}}, False),
+        ('GET', '/get_config'): (lambda: {'path': '/get_config'}, False),
+        ('POST', '/save_config'): (lambda: {'path': '/save_config', 'json': {'folders': {}}}, False),
+    }
+
+
+def dapp_scenarios(fx):
+    """Routes only dapp.py has"""
+    def move():
+        # To the top of the largest container, which orders against its neighbours
+        pid = fx.rng.choice(fx.largest_ids or fx.prompt_ids)
+        return {'path': '/api/items/move', 'json': {
+            'type': 'prompt', 'itemId': pid, 'targetContainer': fx.largest, 'targetPosition': 0}}
+
+    def batch():
+        return {'path': '/api/batch', 'json': {'operations': [
+            {'op': 'addPrompt', 'data': {'name': 'Batch', 'text': 'Batch'}},
+            {'op': 'updatePrompt', 'id': fx.prompt(), 'data': {'text': f'Batch {fx.rng.random()}'}},
+            {'op': 'copyPrompt', 'id': fx.prompt()}]}}
+
+    return {
+        ('POST', '/api/items/move'): (move, False),
+        ('POST', '/api/batch'): (batch, False),
+    }
+
+
+def request_runner(client, method, statuses):
+    def run(args):
+        response = client.open(args['path'], method=method, json=args.get('json'),
+                               data=args.get('data'), buffered=not args.get('stream'))
+        if args.get('stream'):
+            # An event stream never ends: take its first event
+            next(iter(response.response))
+            response.close()
+        else:
+            response.get_data()
+        statuses[response.status_code] += 1
+    return run
+
+
+def run(name, data_path, iterations=200, memory=True):
+    """Benchmark every route of app `name`; returns the results by route"""
+    workdir = tempfile.mkdtemp(prefix='promptrepo-bench-')
+    module = None
+    try:
+        started = time.perf_counter()
+        module = load_app(name, data_path, workdir)
+        startup = time.perf_counter() - started
+        # Failing routes (e.g. / without its template) are counted, not logged
+        module.app.logger.disabled = True
+        fx = Fixture(module)
+        scenarios = common_scenarios(fx)
+        scenarios.update(app_scenarios(fx) if name == 'app' else dapp_scenarios(fx))
+
+        routes = {}
+        # The apps print on some routes; keep the report readable
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for (method, rule), (setup, heavy) in scenarios.items():
+                statuses = Counter()
+                count = max(3, iterations // HEAVY_SHARE) if heavy else iterations
+                result = measure(request_runner(fx.client, method, statuses), setup,
+                                 iterations=count, warmup=1 if heavy else 3, memory=memory)
+                result['statuses'] = {str(k): v for k, v in sorted(statuses.items())}
+                routes[f'{method} {rule}'] = result
+
+        served = {(method, rule.rule) for rule in module.app.url_map.iter_rules()
+                  if rule.endpoint != 'static' for method in rule.methods - {'HEAD', 'OPTIONS'}}
+        return {'startupSeconds': round(startup, 3), 'routes': routes,
+                'uncovered': sorted(f'{m} {r}' for m, r in served - scenarios.keys())}
+    finally:
+        if module is not None:
+            # Write everything out before the scratch directory goes
+            module.usage.close()
+            module.repo.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the routes of one app')
+    parser.add_argument('--app', required=True, choices=['app', 'dapp'])
+    parser.add_argument('--data', required=True, help='repository file to serve (copied)')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--skip-memory', action='store_true', help='skip the traced peak-memory runs')
+    parser.add_argument('--out', help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    # run() changes into a scratch directory
+    data_path = os.path.abspath(args.data)
+    out = os.path.abspath(args.out) if args.out else None
+    results = run(args.app, data_path, iterations=args.iterations, memory=not args.skip_memory)
+    if out:
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
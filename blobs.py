@@ -0,0 +1,211 @@
+import hashlib
+
+# Texts shorter than this are always written inline: a reference would
+# save little or nothing
+BLOB_MIN_CHARS = 64
+
+
+def text_hash(text):
+    """The content address a stored text is referenced by"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class BlobStore:
+    """Reference-counted, content-addressed store of prompt and version texts.
+
+    Texts are looked up by content (the str hash, which Python caches on
+    each string), so every prompt and keyframe version holding the same
+    text points at one shared string: a prompt and its first version, a
+    restored version, prompts created from the same template. Identical
+    texts are then also the same object, which makes equality checks an
+    identity compare. On disk the texts are shared by hash (see
+    pack_document and BlobWriter); the binary snapshot gets that for free,
+    as pickle memoizes objects.
+
+    The repository acquires a text for every reference it stores and
+    releases it when the reference goes (an edit, a deleted prompt); a text
+    is dropped once nothing refers to it.
+    """
+
+    def __init__(self):
+        # text -> [the shared string, number of references]
+        self._entries = {}
+
+    def rebuild(self, prompts):
+        """Share the texts of loaded prompts, replacing them in place"""
+        self._entries = {}
+        for prompt in prompts:
+            self.acquire_prompt(prompt)
+
+    def acquire(self, text):
+        """Add a reference to `text`; returns the shared string to store"""
+        entry = self._entries.get(text)
+        if entry is None:
+            entry = self._entries[text] = [text, 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, text):
+        entry = self._entries[text]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._entries[text]
+
+    def acquire_prompt(self, prompt):
+        """Acquire a prompt's text and those of its keyframe versions"""
+        prompt['text'] = self.acquire(prompt['text'])
+        for version in prompt['versions']:
+            if 'text' in version:
+                version['text'] = self.acquire(version['text'])
+
+    def release_prompt(self, prompt):
+        self.release(prompt['text'])
+        for version in prompt['versions']:
+            if 'text' in version:
+                self.release(version['text'])
+
+    def __contains__(self, text):
+        return text in self._entries
+
+    def stats(self):
+        """Number of distinct texts, their size and the references to them"""
+        return {
+            'texts': len(self._entries),
+            'characters': sum(len(text) for text, _ in self._entries.values()),
+            'references': sum(count for _, count in self._entries.values())
+        }
+
+
+# ------------------ On disk ------------------
+# Stored prompts and keyframe versions may carry a ``textHash`` in place of
+# their ``text``; the texts are kept once, keyed by that hash: in a
+# top-level ``blobs`` map of a JSON snapshot, in 'blob' journal records and
+# in the sqlite blobs table. The repository only ever sees inline texts.
+
+def _with_text(item, text):
+    stored = {k: v for k, v in item.items() if k != 'textHash'}
+    stored['text'] = text
+    return stored
+
+
+def _with_hash(item, digest):
+    stored = {k: v for k, v in item.items() if k != 'text'}
+    stored['textHash'] = digest
+    return stored
+
+
+def pack_item(item, reference):
+    """A copy of a prompt or version (and its versions) with texts replaced by hashes.
+
+    ``reference(text)`` returns the hash to store a text under, or None to
+    keep it inline. `item` itself is not changed.
+    """
+    digest = reference(item['text']) if 'text' in item else None
+    packed = _with_hash(item, digest) if digest is not None else item
+    if 'versions' in item:
+        if packed is item:
+            packed = dict(item)
+        packed['versions'] = [pack_item(v, reference) for v in item['versions']]
+    return packed
+
+
+def unpack_item(item, blobs):
+    """Resolve the hashes of a packed prompt or version in place"""
+    digest = item.pop('textHash', None)
+    if digest is not None:
+        item['text'] = blobs[digest]
+    for version in item.get('versions', ()):
+        unpack_item(version, blobs)
+    return item
+
+
+def pack_document(document):
+    """A snapshot document with every text stored more than once moved to ``blobs``.
+
+    Texts stored once stay inline, so a snapshot without duplicates reads
+    exactly as before.
+    """
+    counts = {}
+    for prompt in document['prompts']:
+        for item in (prompt, *prompt['versions']):
+            text = item.get('text')
+            if text is not None and len(text) >= BLOB_MIN_CHARS:
+                counts[text] = counts.get(text, 0) + 1
+    shared = {}
+    for text, count in counts.items():
+        if count > 1:
+            shared[text] = text_hash(text)
+    if not shared:
+        return document
+    packed = dict(document, prompts=[pack_item(p, shared.get) for p in document['prompts']])
+    packed['blobs'] = {digest: text for text, digest in shared.items()}
+    return packed
+
+
+def unpack_document(data):
+    """Resolve a stored document's ``blobs`` in place; returns it"""
+    blobs = data.pop('blobs', None)
+    if blobs:
+        for prompt in data.get('prompts', ()):
+            unpack_item(prompt, blobs)
+    return data
+
+
+def _record_items(record):
+    """The prompt-like dicts of a mutation record that may hold a text"""
+    op = record['op']
+    if op == 'put' and record['kind'] == 'prompt':
+        return ('item',)
+    if op == 'set' and record['kind'] == 'prompt':
+        return ('fields',)
+    if op == 'ver':
+        return ('version',)
+    return ()
+
+
+class BlobWriter:
+    """Packs mutation records for an append-only log of them (the journal).
+
+    The first record of a file that refers to a text is preceded by a
+    ``{'op': 'blob', 'hash': ..., 'text': ...}`` record; later ones only
+    carry the hash. ``reset`` starts over for a new (or truncated) file.
+    """
+
+    def __init__(self):
+        self._written = set()
+
+    def reset(self):
+        self._written = set()
+
+    def pack(self, record):
+        """[records to append] for one mutation record, blobs first; `record` is not changed"""
+        out = []
+
+        def reference(text):
+            if len(text) < BLOB_MIN_CHARS:
+                return None
+            digest = text_hash(text)
+            if digest not in self._written:
+                self._written.add(digest)
+                out.append({'op': 'blob', 'hash': digest, 'text': text})
+            return digest
+
+        packed = record
+        for key in _record_items(record):
+            item = pack_item(record[key], reference)
+            if item is not record[key]:
+                packed = dict(packed, **{key: item})
+        out.append(packed)
+        return out
+
+
+def unpack_records(records):
+    """Resolve the hashes in records packed by BlobWriter, dropping the blob records"""
+    blobs = {}
+    for record in records:
+        if record.get('op') == 'blob':
+            blobs[record['hash']] = record['text']
+            continue
+        for key in _record_items(record):
+            unpack_item(record[key], blobs)
+        yield record
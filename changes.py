@@ -0,0 +1,50 @@
+from collections import deque
+
+
+def touched_keys(records):
+    """(kind, id) of every prompt and folder a list of mutation records touches"""
+    keys = []
+    for record in records:
+        if record['op'] == 'ver':
+            keys.append(('prompt', record['id']))
+        elif record['op'] == 'put':
+            keys.append((record['kind'], record['item']['id']))
+        else:
+            keys.append((record['kind'], record['id']))
+    return keys
+
+
+class ChangeLog:
+    """Bounded log of which prompts and folders each revision touched.
+
+    Only keys are kept; readers look up the current state of the touched
+    items, so several edits to the same prompt collapse into one upsert.
+    Once a revision is evicted, clients that last saw an older revision
+    have to resync from /api/data.
+    """
+
+    def __init__(self, max_revisions=1000):
+        self._entries = deque(maxlen=max_revisions)
+        # Oldest `since` revision that can still be answered
+        self.floor = 0
+
+    def append(self, revision, keys):
+        if len(self._entries) == self._entries.maxlen:
+            self.floor = self._entries[0][0]
+        self._entries.append((revision, keys))
+
+    def since(self, revision):
+        """Keys touched after `revision`, or None if that history was evicted"""
+        if revision < self.floor:
+            return None
+        touched = set()
+        for entry_revision, keys in reversed(self._entries):
+            if entry_revision <= revision:
+                break
+            touched.update(keys)
+        return touched
+
+    def reset(self, revision):
+        """Forget all history: clients behind `revision` resync (after a reload)"""
+        self._entries.clear()
+        self.floor = revision
@@ -1,15 +1,11 @@
 from flask import Flask, jsonify, request, render_template
-import os
-import json
 import time
-from pathlib import Path
 
-app = Flask(__name__)
+import settings
+from httpcache import ResponseCache, if_match_revision, revision_conflict_body
+from read_api import read_api
 
-DOCUMENTS_DIR = Path.home() / 'Documents' / 'PromptData'
-DOCUMENTS_DIR.mkdir(parents=True, exist_ok=True)
-DATA_FILE = DOCUMENTS_DIR / 'config.json'
-COOLDOWN_MINUTES = 3
+app = Flask(__name__)
 
 def create_seed_data():
     """Create initial seed data with example folder and prompts"""
@@ -81,52 +77,11 @@ def create_seed_data():
         'folders': [example_folder]
     }
 
-def load_data():
-    """Load data from config.json"""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                # Ensure all prompts have required fields
-                for i, prompt in enumerate(data.get('prompts', [])):
-                    if 'versions' not in prompt:
-                        prompt['versions'] = [{
-                            'id': f"{int(time.time())}-v1",
-                            'name': prompt['name'],
-                            'text': prompt['text'],
-                            'timestamp': int(time.time() * 1000),
-                            'version': 1
-                        }]
-                        prompt['currentVersion'] = 1
-                    if 'usageCount' not in prompt:
-                        prompt['usageCount'] = 0
-                    if 'order' not in prompt:
-                        prompt['order'] = i
-                        
-                # Ensure all folders have order field and parentId
-                for i, folder in enumerate(data.get('folders', [])):
-                    if 'order' not in folder:
-                        folder['order'] = i
-                    if 'parentId' not in folder:
-                        folder['parentId'] = None
-                    # Don't override existing expanded state, but default to False
-                    if 'expanded' not in folder:
-                        folder['expanded'] = False
-                        
-                return data
-        except json.JSONDecodeError:
-            pass
-    
-    # If file doesn't exist or is corrupted, create seed data
-    print("Creating new config.json with seed data...")
-    seed_data = create_seed_data()
-    save_data(seed_data)
-    return seed_data
+response_cache = ResponseCache()
 
-def save_data(data):
-    """Save data to config.json"""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+repo, events, usage = settings.open_repository(seed=create_seed_data)
+settings.enable_diagnostics(app, repo)
+app.register_blueprint(read_api(repo, events, usage, response_cache))
 
 @app.route('/')
 def index():
@@ -134,31 +89,59 @@ def index():
 
 @app.route('/api/data', methods=['GET'])
 def get_data():
-    """Get all prompts and folders"""
-    return jsonify(load_data())
+    """Get all prompts (without version history) and folders"""
+    with repo.lock:
+        etag = repo.etag()
+        entry = response_cache.get('data', etag, repo.summary_document)
+    return response_cache.response(entry, etag)
 
-@app.route('/api/prompts', methods=['POST'])
-def add_prompt():
-    """Add a new prompt"""
-    data = load_data()
-    prompt_data = request.json
-    
-    # Get the highest order number for items in the same container
+class OperationError(Exception):
+    """A mutation that can't be applied, with the HTTP status to report"""
+
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        # Further fields of the error body, e.g. the revisions of a conflict
+        self.details = details or {}
+
+    def body(self):
+        return {'error': self.message, **self.details}
+
+def requested_revision():
+    """The item revision named by the request's If-Match header, or None (see if_match_revision)"""
+    try:
+        return if_match_revision()
+    except ValueError as e:
+        raise OperationError(str(e))
+
+def check_revision(kind, item, rev):
+    """Refuse to change an item that is no longer at the revision the client saw"""
+    conflict = revision_conflict_body(kind, item, rev)
+    if conflict is not None:
+        raise OperationError(conflict.pop('error'), 409, conflict)
+
+# ------------------ Mutations ------------------
+# Shared by the single-item routes and /api/batch; call inside repo.transaction().
+# A `rev` makes the change conditional on the item's current revision.
+
+def require_strings(**fields):
+    """Refuse names and texts that aren't strings before anything is changed"""
+    for field, value in fields.items():
+        if not isinstance(value, str):
+            raise OperationError(f'{field} must be a string')
+
+def create_prompt(prompt_data):
+    require_strings(name=prompt_data['name'], text=prompt_data['text'])
     folder_id = prompt_data.get('folderId')
-    
-    # Get all items in the same container
-    container_folders = [f for f in data['folders'] if f.get('parentId') == folder_id]
-    container_prompts = [p for p in data['prompts'] if p.get('folderId') == folder_id]
-    all_items = container_folders + container_prompts
-    max_order = max([item.get('order', 0) for item in all_items], default=-1)
-    
+
     now = int(time.time() * 1000)
     new_prompt = {
-        'id': str(now),
+        'id': repo.new_id(now),
         'name': prompt_data['name'],
         'text': prompt_data['text'],
         'folderId': folder_id,
-        'order': max_order + 1,
+        'order': repo.append_order(folder_id),
         'versions': [{
             'id': f"{now}-v1",
             'name': prompt_data['name'],
@@ -169,239 +152,262 @@ def add_prompt():
         'currentVersion': 1,
         'usageCount': 0
     }
-    
-    data['prompts'].append(new_prompt)
-    save_data(data)
-    return jsonify(new_prompt)
+
+    repo.insert('prompt', new_prompt)
+    return repo.prompt_summary(new_prompt)
+
+def edit_prompt(prompt_id, updates, rev=None):
+    prompt = repo.get_prompt(prompt_id)
+    if prompt:
+        check_revision('prompt', prompt, rev)
+        new_version = prompt['currentVersion'] + 1
+        now = int(time.time() * 1000)
+        name = updates.get('name', prompt['name'])
+        text = updates.get('text', prompt['text'])
+        require_strings(name=name, text=text)
+
+        repo.add_version(prompt_id, {
+            'id': f"{now}-v{new_version}",
+            'name': name,
+            'text': text,
+            'timestamp': now,
+            'version': new_version
+        })
+        repo.update('prompt', prompt_id, name=name, text=text, currentVersion=new_version)
+        return {'success': True, 'rev': prompt['rev']}
+    return {'success': True}
+
+def remove_prompt(prompt_id, rev=None):
+    prompt = repo.get_prompt(prompt_id)
+    if prompt:
+        check_revision('prompt', prompt, rev)
+        repo.delete('prompt', prompt_id)
+    return {'success': True}
+
+def track_copy(prompt_id):
+    usage.record(prompt_id)
+    return {'success': True}
+
+def create_folder(folder_data):
+    require_strings(name=folder_data['name'])
+    parent_id = folder_data.get('parentId')
+
+    new_folder = {
+        'id': repo.new_id(),
+        'name': folder_data['name'],
+        'expanded': False,  # Always default to closed
+        'order': repo.append_order(parent_id),
+        'parentId': parent_id
+    }
+
+    repo.insert('folder', new_folder)
+    return new_folder
+
+def remove_folder(folder_id, rev=None):
+    """Delete a folder, moving its prompts and subfolders to its parent"""
+    folder_to_delete = repo.get_folder(folder_id)
+    if not folder_to_delete:
+        raise OperationError('Folder not found', 404)
+    check_revision('folder', folder_to_delete, rev)
+
+    parent_id = folder_to_delete.get('parentId')
+
+    # Move child folders to parent
+    for folder in repo.child_folders(folder_id):
+        repo.update('folder', folder['id'], parentId=parent_id)
+
+    # Move prompts to parent folder
+    for prompt in repo.child_prompts(folder_id):
+        repo.update('prompt', prompt['id'], folderId=parent_id)
+
+    # Remove folder
+    repo.delete('folder', folder_id)
+    return {'success': True}
+
+def place_item(move_data, rev=None):
+    """Move a prompt or folder into a container at a position; returns its new order"""
+    item_type = move_data.get('type')  # 'prompt' or 'folder'
+    item_id = move_data.get('itemId')
+    target_container = move_data.get('targetContainer')  # folder ID or null for root
+    target_position = move_data.get('targetPosition')  # index in the target container
+
+    # Find the item being moved
+    moved_item = repo.get(item_type, item_id)
+
+    if not moved_item:
+        raise OperationError(f'{str(item_type).title()} not found', 404)
+    check_revision(item_type, moved_item, rev)
+
+    # For folders, check circular reference
+    if item_type == 'folder' and repo.tree.would_create_cycle(item_id, target_container):
+        raise OperationError('Cannot create circular reference')
+
+    # Take the order between the new neighbours, so only this item changes
+    order = repo.order_at(target_container, target_position, moving=(item_type, item_id))
+    if item_type == 'prompt':
+        repo.update('prompt', item_id, folderId=target_container, order=order)
+    else:
+        repo.update('folder', item_id, parentId=target_container, order=order)
+
+    return order
+
+# ------------------ Routes ------------------
+
+@app.route('/api/prompts', methods=['POST'])
+def add_prompt():
+    """Add a new prompt"""
+    try:
+        with repo.transaction():
+            return jsonify(create_prompt(request.json))
+    except OperationError as e:
+        return jsonify(e.body()), e.status
 
 @app.route('/api/prompts/<prompt_id>', methods=['PUT'])
 def update_prompt(prompt_id):
-    """Update a prompt (creates new version)"""
-    data = load_data()
-    updates = request.json
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            new_version = prompt['currentVersion'] + 1
-            now = int(time.time() * 1000)
-            
-            new_version_entry = {
-                'id': f"{now}-v{new_version}",
-                'name': updates.get('name', prompt['name']),
-                'text': updates.get('text', prompt['text']),
-                'timestamp': now,
-                'version': new_version
-            }
-            
-            prompt['name'] = updates.get('name', prompt['name'])
-            prompt['text'] = updates.get('text', prompt['text'])
-            prompt['versions'].append(new_version_entry)
-            prompt['currentVersion'] = new_version
-            break
-    
-    save_data(data)
-    return jsonify({'success': True})
+    """Update a prompt (creates new version); If-Match: "<rev>" makes it conditional"""
+    try:
+        with repo.transaction():
+            return jsonify(edit_prompt(prompt_id, request.json, requested_revision()))
+    except OperationError as e:
+        return jsonify(e.body()), e.status
 
 @app.route('/api/prompts/<prompt_id>', methods=['DELETE'])
 def delete_prompt(prompt_id):
-    """Delete a prompt"""
-    data = load_data()
-    data['prompts'] = [p for p in data['prompts'] if p['id'] != prompt_id]
-    save_data(data)
-    return jsonify({'success': True})
+    """Delete a prompt; If-Match: "<rev>" makes it conditional"""
+    try:
+        with repo.transaction():
+            return jsonify(remove_prompt(prompt_id, requested_revision()))
+    except OperationError as e:
+        return jsonify(e.body()), e.status
 
 @app.route('/api/prompts/<prompt_id>/copy', methods=['POST'])
 def copy_prompt(prompt_id):
     """Track prompt copy with cooldown"""
-    data = load_data()
-    now = int(time.time() * 1000)
-    cooldown_ms = COOLDOWN_MINUTES * 60 * 1000
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            last_copied = prompt.get('lastCopiedAt', 0)
-            if now - last_copied >= cooldown_ms:
-                prompt['usageCount'] = prompt.get('usageCount', 0) + 1
-                prompt['lastCopiedAt'] = now
-            break
-    
-    save_data(data)
-    return jsonify({'success': True})
+    return jsonify(track_copy(prompt_id))
 
 @app.route('/api/prompts/<prompt_id>/restore/<version_id>', methods=['POST'])
 def restore_version(prompt_id, version_id):
     """Restore a prompt to a previous version"""
-    data = load_data()
-    
-    for prompt in data['prompts']:
-        if prompt['id'] == prompt_id:
-            for version in prompt['versions']:
-                if version['id'] == version_id:
-                    prompt['name'] = version['name']
-                    prompt['text'] = version['text']
-                    break
-            break
-    
-    save_data(data)
+    with repo.transaction():
+        version = repo.find_version(prompt_id, version_id)
+        if version:
+            repo.update('prompt', prompt_id, name=version['name'], text=version['text'])
+
+    return jsonify({'success': True})
+
+@app.route('/api/folders/<folder_id>/state', methods=['PUT'])
+def set_folder_state(folder_id):
+    """Save whether a folder is expanded in the sidebar"""
+    expanded = bool(request.json.get('expanded'))
+    with repo.transaction():
+        folder = repo.get_folder(folder_id)
+        if not folder:
+            return jsonify({'error': 'Folder not found'}), 404
+        if folder.get('expanded') != expanded:
+            repo.update('folder', folder_id, expanded=expanded)
     return jsonify({'success': True})
 
 @app.route('/api/folders', methods=['POST'])
 def add_folder():
     """Add a new folder"""
-    data = load_data()
-    folder_data = request.json
-    
-    # Get the highest order number for items in the same container
-    parent_id = folder_data.get('parentId')
-    
-    # Get all items in the same container
-    container_folders = [f for f in data['folders'] if f.get('parentId') == parent_id]
-    container_prompts = [p for p in data['prompts'] if p.get('folderId') == parent_id]
-    all_items = container_folders + container_prompts
-    max_order = max([item.get('order', 0) for item in all_items], default=-1)
-    
-    new_folder = {
-        'id': str(int(time.time() * 1000)),
-        'name': folder_data['name'],
-        'expanded': False,  # Always default to closed
-        'order': max_order + 1,
-        'parentId': parent_id
-    }
-    
-    data['folders'].append(new_folder)
-    save_data(data)
-    return jsonify(new_folder)
+    try:
+        with repo.transaction():
+            return jsonify(create_folder(request.json))
+    except OperationError as e:
+        return jsonify(e.body()), e.status
 
 @app.route('/api/folders/<folder_id>', methods=['DELETE'])
 def delete_folder(folder_id):
-    """Delete a folder (moves prompts and subfolders to parent)"""
-    data = load_data()
-    
-    # Find the folder being deleted
-    folder_to_delete = None
-    for folder in data['folders']:
-        if folder['id'] == folder_id:
-            folder_to_delete = folder
-            break
-    
-    if not folder_to_delete:
-        return jsonify({'error': 'Folder not found'}), 404
-    
-    parent_id = folder_to_delete.get('parentId')
-    
-    # Move child folders to parent
-    for folder in data['folders']:
-        if folder.get('parentId') == folder_id:
-            folder['parentId'] = parent_id
-    
-    # Move prompts to parent folder
-    for prompt in data['prompts']:
-        if prompt.get('folderId') == folder_id:
-            prompt['folderId'] = parent_id
-    
-    # Remove folder
-    data['folders'] = [f for f in data['folders'] if f['id'] != folder_id]
-    
-    save_data(data)
-    return jsonify({'success': True})
+    """Delete a folder (moves prompts and subfolders to parent); If-Match: "<rev>" makes it conditional"""
+    try:
+        with repo.transaction():
+            return jsonify(remove_folder(folder_id, requested_revision()))
+    except OperationError as e:
+        return jsonify(e.body()), e.status
 
 @app.route('/api/items/move', methods=['POST'])
 def move_item():
-    """Move an item (prompt or folder) to a new position"""
+    """Move an item (prompt or folder) to a new position; If-Match: "<rev>" makes it conditional"""
     try:
-        data = load_data()
         move_data = request.json
-        
-        item_type = move_data.get('type')  # 'prompt' or 'folder'
-        item_id = move_data.get('itemId')
-        target_container = move_data.get('targetContainer')  # folder ID or null for root
-        target_position = move_data.get('targetPosition')  # index in the target container
-        
-        print(f"Moving {item_type} {item_id} to container {target_container} at position {target_position}")
-        
-        # Find the item being moved
-        moved_item = None
-        if item_type == 'prompt':
-            for p in data['prompts']:
-                if p['id'] == item_id:
-                    moved_item = p
-                    break
-        else:  # folder
-            for f in data['folders']:
-                if f['id'] == item_id:
-                    moved_item = f
-                    break
-        
-        if not moved_item:
-            return jsonify({'error': f'{item_type.title()} not found'}), 404
-        
-        # For folders, check circular reference
-        if item_type == 'folder':
-            def would_create_cycle(folder_id, target_parent_id):
-                if target_parent_id is None:
-                    return False
-                if target_parent_id == folder_id:
-                    return True
-                
-                for f in data['folders']:
-                    if f['id'] == target_parent_id:
-                        return would_create_cycle(folder_id, f.get('parentId'))
-                return False
-            
-            if would_create_cycle(item_id, target_container):
-                return jsonify({'error': 'Cannot create circular reference'}), 400
-        
-        # Update the item's container
-        if item_type == 'prompt':
-            moved_item['folderId'] = target_container
-        else:
-            moved_item['parentId'] = target_container
-        
-        # Get all items in the target container
-        container_folders = [f for f in data['folders'] if f.get('parentId') == target_container]
-        container_prompts = [p for p in data['prompts'] if p.get('folderId') == target_container]
-        
-        # Create a combined list of all items in the container
-        all_items = []
-        for f in container_folders:
-            all_items.append({'id': f['id'], 'type': 'folder', 'order': f.get('order', 0), 'item': f})
-        for p in container_prompts:
-            all_items.append({'id': p['id'], 'type': 'prompt', 'order': p.get('order', 0), 'item': p})
-        
-        # Sort by current order
-        all_items.sort(key=lambda x: x['order'])
-        
-        # Remove the moved item from the list (it might already be in this container)
-        all_items = [item for item in all_items if item['id'] != item_id]
-        
-        # Insert the moved item at the target position
-        if target_position is None:
-            target_position = len(all_items)
-        
-        target_position = max(0, min(target_position, len(all_items)))
-        
-        moved_item_entry = {
-            'id': item_id, 
-            'type': item_type, 
-            'order': target_position, 
-            'item': moved_item
-        }
-        all_items.insert(target_position, moved_item_entry)
-        
-        # Update order values for all items
-        for i, item_entry in enumerate(all_items):
-            item_entry['item']['order'] = i
-        
-        print(f"Reordered {len(all_items)} items in container {target_container}")
-        
-        save_data(data)
+
+        print(f"Moving {move_data.get('type')} {move_data.get('itemId')} to container "
+              f"{move_data.get('targetContainer')} at position {move_data.get('targetPosition')}")
+
+        with repo.transaction():
+            order = place_item(move_data, requested_revision())
+
+        print(f"Placed at order {order} in container {move_data.get('targetContainer')}")
+
         return jsonify({'success': True})
-        
+
+    except OperationError as e:
+        return jsonify(e.body()), e.status
+
     except Exception as e:
         print(f"Error in move_item: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+# Operations accepted by /api/batch: op name -> handler(operation)
+BATCH_OPERATIONS = {
+    'addPrompt': lambda op: create_prompt(op['data']),
+    'updatePrompt': lambda op: edit_prompt(op['id'], op.get('data', {}), op.get('rev')),
+    'deletePrompt': lambda op: remove_prompt(op['id'], op.get('rev')),
+    'copyPrompt': lambda op: track_copy(op['id']),
+    'addFolder': lambda op: create_folder(op['data']),
+    'deleteFolder': lambda op: remove_folder(op['id'], op.get('rev')),
+    'moveItem': lambda op: {'success': True, 'order': place_item(op['data'], op.get('rev'))},
+}
+
+def operation_error(operation):
+    """Why a /api/batch operation is malformed, or None"""
+    if not isinstance(operation, dict):
+        return 'Operation must be an object'
+    op = operation.get('op')
+    if not isinstance(op, str) or op not in BATCH_OPERATIONS:
+        return f"Unknown operation: {op!r}"
+    if not isinstance(operation.get('data', {}), dict):
+        return f"Invalid {op} operation: data must be an object"
+    rev = operation.get('rev')
+    if rev is not None and (not isinstance(rev, int) or isinstance(rev, bool)):
+        return f"Invalid {op} operation: rev must be an integer"
+    return None
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Apply a list of operations in order, all or nothing.
+
+    Body: {"operations": [{"op": "moveItem", "data": {...}}, {"op": "deletePrompt", "id": "..."}, ...]}
+    with ``data`` as the single-item route takes it and an optional ``rev``
+    in place of If-Match. Everything is applied in one transaction, so the
+    batch costs one write. If an operation fails, the earlier ones are
+    rolled back (copies included) and the response names the failing index.
+    """
+    body = request.get_json(silent=True)
+    operations = body.get('operations', []) if isinstance(body, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({'error': 'Body must be {"operations": [...]}'}), 400
+    # Malformed operations are refused before anything is applied
+    for index, operation in enumerate(operations):
+        error = operation_error(operation)
+        if error:
+            return jsonify({'error': error, 'failedIndex': index}), 400
+
+    results = []
+    try:
+        # Copies are counted only once the batch has committed
+        with usage.deferred(), repo.transaction(), repo.atomic():
+            for operation in operations:
+                try:
+                    results.append(BATCH_OPERATIONS[operation['op']](operation))
+                except (KeyError, TypeError, AttributeError) as e:
+                    raise OperationError(f"Invalid {operation['op']} operation: {e!r}")
+    except OperationError as e:
+        return jsonify({**e.body(), 'failedIndex': len(results)}), e.status
+
+    return jsonify({'success': True, 'results': results})
+
 if __name__ == '__main__':
     app.run(debug=True)
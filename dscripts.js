@@ -716,7 +716,8 @@ function showEditFolderModal(folderId) {
 function showVersionHistory(promptId) {
   fetch(`/api/prompts/${promptId}/versions`)
     .then((response) => response.json())
-    .then((versions) => {
+    .then((page) => {
+      const versions = page.versions
       const container = document.getElementById("versionsList")
       container.innerHTML = versions
         .map(
@@ -0,0 +1,134 @@
+import json
+import threading
+from collections import deque
+
+# An idle stream sends a comment this often, which keeps proxies from
+# timing it out and lets the server notice disconnected clients
+HEARTBEAT_SECONDS = 15
+
+
+def format_event(event, payload, event_id=None):
+    """One Server-Sent Events frame carrying `payload` as JSON"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(payload, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def parse_event_id(event_id):
+    """(instance, revision) from an event id, or None if it is not one of ours"""
+    instance, _, revision = (event_id or '').rpartition('-')
+    if not instance or not revision.isdigit():
+        return None
+    return instance, int(revision)
+
+
+class Subscriber:
+    def __init__(self):
+        self.frames = deque()
+        # Set when the client fell more than buffer_size events behind; its
+        # buffer is dropped and it is told to resync instead
+        self.overflowed = False
+
+
+class EventHub:
+    """Fans repository change sets out to Server-Sent Events streams.
+
+    Each commit's change set (the same shape /api/changes returns) is
+    serialized once and appended to every subscriber's buffer. Buffers are
+    bounded: a client that stops reading loses its backlog and gets a single
+    ``resync`` event, so a stalled window can't grow server memory. Every
+    stream holds a server thread, hence the cap on connected clients.
+
+    Event ids are ``{instance}-{revision}``, so a reconnecting EventSource
+    (which sends Last-Event-ID) resumes from the change log.
+    """
+
+    def __init__(self, repo, max_clients=8, buffer_size=64, heartbeat=HEARTBEAT_SECONDS):
+        self.repo = repo
+        self.max_clients = max_clients
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self._cond = threading.Condition()
+        self._subscribers = set()
+        repo.add_listener(self.publish)
+
+    def publish(self, change_set):
+        # Called by the repository with its lock held; serializing here
+        # captures the items before a later mutation can change them
+        with self._cond:
+            if not self._subscribers:
+                return
+            event = 'resync' if change_set.get('resync') else 'change'
+            frame = format_event(event, change_set, self._event_id(change_set))
+            for subscriber in self._subscribers:
+                if subscriber.overflowed:
+                    continue
+                if len(subscriber.frames) >= self.buffer_size:
+                    subscriber.frames.clear()
+                    subscriber.overflowed = True
+                else:
+                    subscriber.frames.append(frame)
+            self._cond.notify_all()
+
+    def subscribe(self, last_event_id=None):
+        """A new Subscriber, or None when max_clients streams are open.
+
+        Its first event catches up from `last_event_id` if given, otherwise
+        it is a ``ready`` event with the current revision.
+        """
+        # Holding the repository lock keeps commits out until the subscriber
+        # is registered, so no change falls between catch-up and the stream
+        with self.repo.lock:
+            with self._cond:
+                if len(self._subscribers) >= self.max_clients:
+                    return None
+            subscriber = Subscriber()
+            resume = parse_event_id(last_event_id)
+            if resume is None:
+                state = {'revision': self.repo.revision, 'instance': self.repo.instance_id}
+                subscriber.frames.append(format_event('ready', state, self._event_id(state)))
+            else:
+                changes = self.repo.changes_since(resume[1], resume[0])
+                event = 'resync' if changes.get('resync') else 'change'
+                subscriber.frames.append(format_event(event, changes, self._event_id(changes)))
+            with self._cond:
+                self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    def stream(self, subscriber):
+        """Yield the subscriber's frames as they arrive, with heartbeats"""
+        try:
+            while True:
+                with self._cond:
+                    if not subscriber.frames and not subscriber.overflowed:
+                        self._cond.wait(self.heartbeat)
+                    frames = list(subscriber.frames)
+                    subscriber.frames.clear()
+                    overflowed = subscriber.overflowed
+                    subscriber.overflowed = False
+
+                if overflowed:
+                    state = {'resync': True, 'revision': self.repo.revision,
+                             'instance': self.repo.instance_id}
+                    yield format_event('resync', state, self._event_id(state))
+                elif frames:
+                    yield b''.join(frames)
+                else:
+                    yield b': heartbeat\n\n'
+                    # Notice writes by other processes sharing the file
+                    # while no request comes in
+                    self.repo.refresh()
+        finally:
+            # Runs when the server closes the generator after a failed write
+            self.unsubscribe(subscriber)
+
+    @staticmethod
+    def _event_id(state):
+        return f"{state['instance']}-{state['revision']}"
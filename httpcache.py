@@ -0,0 +1,83 @@
+import gzip
+import json
+import threading
+
+from flask import Response, request
+
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+
+
+def if_match_revision():
+    """The item revision named by the request's If-Match header, or None.
+
+    No header, or "*", makes a change unconditional. Otherwise the header
+    must be one strong tag holding an integer revision (e.g. "3"); anything
+    else raises ValueError, which both apps answer with 400. A revision
+    other than the item's current one is answered with 409.
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    try:
+        (tag,) = request.if_match.as_set()
+        return int(tag)
+    except ValueError:
+        raise ValueError('If-Match must name one revision') from None
+
+
+def revision_conflict_body(kind, item, expected):
+    """The 409 body refusing a change to `item` made against revision `expected`.
+
+    None if the change may go ahead: no revision was named (see
+    if_match_revision) or it is still the item's current one. Both apps
+    answer conflicts with this body, so clients see the same fields.
+    """
+    rev = item.get('rev', 0)
+    if expected is None or expected == rev:
+        return None
+    return {'error': f'{kind.title()} was changed elsewhere', 'rev': rev, 'expected': expected}
+
+
+class ResponseCache:
+    """Serialized (and lazily gzipped) JSON bodies, one per key and version.
+
+    ``version`` is whatever identifies the content, e.g. the repository
+    revision; a body is only rebuilt when the version changes, so repeated
+    loads of an unchanged repository cost a dict lookup.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build):
+        entry = self._entries.get(key)
+        if entry is None or entry['version'] != version:
+            body = json.dumps(build(), separators=(',', ':')).encode('utf-8')
+            entry = {'version': version, 'body': body, 'gzip': None}
+            self._entries[key] = entry
+        return entry
+
+    def gzipped(self, entry):
+        with self._lock:
+            if entry['gzip'] is None:
+                entry['gzip'] = gzip.compress(entry['body'], compresslevel=6)
+            return entry['gzip']
+
+    def response(self, entry, etag):
+        """A JSON response for `entry`, honouring If-None-Match and Accept-Encoding"""
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        body = entry['body']
+        # no-cache: browsers may keep the body but must revalidate every time
+        headers = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+        if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+            body = self.gzipped(entry)
+            headers['Content-Encoding'] = 'gzip'
+
+        response = Response(body, mimetype='application/json', headers=headers)
+        response.set_etag(etag)
+        return response
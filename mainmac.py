@@ -1,7 +1,7 @@
 import threading
 import webview
 import requests
-from app import app
+from app import app, repo, usage
 import time
 import os
 import sys
@@ -39,6 +39,10 @@ def watchdog_flask():
 # ------------------ Shutdown Handling ------------------
 def shutdown():
     print("Shutting down...")
+    # SIGTERM skips atexit handlers, so flush pending writes explicitly:
+    # buffered copy counts first, as they are written through the repository
+    usage.close()
+    repo.close()
     if sys.platform == "win32":
         sys.exit(0)
     else:
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum (Prometheus style)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # One count per bucket plus the +Inf bucket, not cumulative
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def samples(self):
+        """[(le, cumulative count)] ending with +Inf, and the sum"""
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        samples, running = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            running += count
+            samples.append((bound, running))
+        return samples, total
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+class Metrics:
+    """Per-route request metrics plus the repository's storage and lock figures.
+
+    Requests are keyed by the route pattern (``/api/prompts/<prompt_id>``),
+    not the path, so the number of series stays bounded. Repository figures
+    are read when /metrics is scraped, so they cost nothing in between.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._lock = threading.Lock()
+        # (route, method) -> Histogram of seconds
+        self._latency = {}
+        # (route, method, status) -> requests
+        self._requests = {}
+        # (route, method) -> [request body bytes, response body bytes]
+        self._bytes = {}
+
+    def observe_request(self, route, method, status, seconds, request_bytes, response_bytes):
+        key = (route, method)
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram()
+            self._requests[key + (status,)] = self._requests.get(key + (status,), 0) + 1
+            totals = self._bytes.setdefault(key, [0, 0])
+            totals[0] += request_bytes
+            totals[1] += response_bytes
+        histogram.observe(seconds)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+
+        def histogram(name, help_text, histograms):
+            samples = []
+            for labels, h in histograms:
+                buckets, total = h.samples()
+                samples.extend((f'_bucket{_labels(**labels, le=le)}', count) for le, count in buckets)
+                samples.append((f'_sum{_labels(**labels)}', total))
+                samples.append((f'_count{_labels(**labels)}', buckets[-1][1]))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            lines.extend(f'{name}{suffix} {value}' for suffix, value in samples)
+
+        with self._lock:
+            latency = sorted(self._latency.items())
+            requests = sorted(self._requests.items())
+            sizes = sorted((k, list(v)) for k, v in self._bytes.items())
+
+        histogram('promptrepo_request_duration_seconds', 'Request latency by route',
+                  [({'route': r, 'method': m}, h) for (r, m), h in latency])
+        metric('promptrepo_requests_total', 'counter', 'Requests by route and status',
+               [(_labels(route=r, method=m, status=s), n) for (r, m, s), n in requests])
+        metric('promptrepo_request_bytes_total', 'counter', 'Request body bytes by route',
+               [(_labels(route=r, method=m), b[0]) for (r, m), b in sizes])
+        metric('promptrepo_response_bytes_total', 'counter', 'Response body bytes by route',
+               [(_labels(route=r, method=m), b[1]) for (r, m), b in sizes])
+
+        repo = self.repo
+        if repo.lock_wait is not None:
+            histogram('promptrepo_lock_wait_seconds',
+                      'Time transactions waited for the repository (and shared file) lock',
+                      [({}, repo.lock_wait)])
+
+        io = repo.storage.io
+        metric('promptrepo_storage_reads_total', 'counter', 'Stored documents read', [('', io.reads)])
+        metric('promptrepo_storage_read_bytes_total', 'counter', 'Bytes read from storage',
+               [('', io.bytes_read)])
+        metric('promptrepo_storage_writes_total', 'counter', 'Storage writes (snapshots, journal appends, row batches)',
+               [('', io.writes)])
+        metric('promptrepo_storage_written_bytes_total', 'counter', 'Bytes written to storage',
+               [('', io.bytes_written)])
+        metric('promptrepo_storage_seconds_total', 'counter', 'Time spent parsing, serializing and writing',
+               [(_labels(phase='parse'), io.parse_seconds),
+                (_labels(phase='serialize'), io.serialize_seconds),
+                (_labels(phase='write'), io.write_seconds)])
+        metric('promptrepo_load_seconds', 'gauge', 'Duration of each phase of the last load',
+               [(_labels(phase=phase), seconds) for phase, seconds in repo.load_seconds.items()])
+
+        with repo.lock:
+            prompts = len(repo.prompts)
+            folders = len(repo.folders)
+            versions = sum(len(p['versions']) for p in repo.prompts.values())
+            revision = repo.revision
+        try:
+            stored_bytes = os.path.getsize(repo.storage.path)
+        except OSError:
+            stored_bytes = 0
+        metric('promptrepo_prompts', 'gauge', 'Prompts in the repository', [('', prompts)])
+        metric('promptrepo_folders', 'gauge', 'Folders in the repository', [('', folders)])
+        metric('promptrepo_versions', 'gauge', 'Stored prompt versions', [('', versions)])
+        metric('promptrepo_revision', 'gauge', 'Commits since this process started', [('', revision)])
+        metric('promptrepo_storage_file_bytes', 'gauge', 'Size of the data file', [('', stored_bytes)])
+        return '\n'.join(lines) + '\n'
+
+
+def instrument(app, repo, log_requests=False):
+    """Time every request of `app` and serve the results on /metrics.
+
+    With `log_requests`, each request is also printed as one JSON line.
+    Nothing is registered unless this is called, so disabled metrics cost
+    nothing.
+    """
+    metrics = Metrics(repo)
+    repo.lock_wait = Histogram()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_bytes = request.content_length or 0
+        # Streamed responses (events, export) have no length up front
+        response_bytes = response.content_length or 0
+        metrics.observe_request(route, request.method, response.status_code, seconds,
+                                request_bytes, response_bytes)
+        if log_requests:
+            print(json.dumps({
+                'time': round(time.time(), 3),
+                'method': request.method,
+                'route': route,
+                'path': request.path,
+                'status': response.status_code,
+                'ms': round(seconds * 1000, 3),
+                'requestBytes': request_bytes,
+                'responseBytes': response_bytes
+            }, separators=(',', ':')), flush=True)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Prometheus metrics"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
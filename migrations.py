@@ -0,0 +1,84 @@
+import time
+
+# Stamped into stored documents as ``schemaVersion``. A document at this
+# version is loaded as is; older ones are upgraded once at startup.
+SCHEMA_VERSION = 1
+
+
+def from_folder_map(data):
+    """Convert the legacy {"folders": {name: [{title, text}]}} layout (app.js)"""
+    now = int(time.time() * 1000)
+    folders, prompts = [], []
+    for folder_order, (name, items) in enumerate(data.get('folders', {}).items()):
+        folder_id = str(now + len(folders) + len(prompts))
+        folders.append({'id': folder_id, 'name': name, 'parentId': None, 'order': folder_order})
+        for order, item in enumerate(items or []):
+            prompts.append({'id': str(now + len(folders) + len(prompts)),
+                            'name': item.get('title') or item.get('name', ''),
+                            'text': item.get('text', ''),
+                            'folderId': folder_id,
+                            'order': order})
+    return {'prompts': prompts, 'folders': folders}
+
+
+def first_version(prompt, now):
+    """The version 1 history entry of a prompt stored without a history"""
+    return {'id': f"{prompt['id']}-v1", 'name': prompt['name'], 'text': prompt['text'],
+            'timestamp': now, 'version': 1}
+
+
+def normalize(data):
+    """Back-fill the fields every prompt and folder must have.
+
+    Run by the version 1 upgrade on documents from before schemaVersion,
+    whichever app or tool opens them first, so it is the only place that
+    decides those defaults.
+    """
+    now = int(time.time() * 1000)
+    for i, prompt in enumerate(data.get('prompts', [])):
+        prompt.setdefault('name', '')
+        prompt.setdefault('text', '')
+        prompt.setdefault('folderId', None)
+        if 'versions' not in prompt:
+            prompt['versions'] = [first_version(prompt, now)]
+            prompt['currentVersion'] = 1
+        prompt.setdefault('currentVersion', len(prompt['versions']))
+        prompt.setdefault('usageCount', 0)
+        prompt.setdefault('order', i)
+
+    for i, folder in enumerate(data.get('folders', [])):
+        folder.setdefault('order', i)
+        folder.setdefault('parentId', None)
+        folder.setdefault('expanded', False)
+    return data
+
+
+def _upgrade_to_1(data):
+    # Version 0 is anything written before the stamp: either layout, with
+    # fields missing
+    if isinstance(data.get('folders'), dict):
+        data = from_folder_map(data)
+    return normalize(data)
+
+
+# MIGRATIONS[n] upgrades a version n document to version n + 1
+MIGRATIONS = [_upgrade_to_1]
+
+
+def stored_version(data):
+    return data.get('schemaVersion', 0)
+
+
+def migrate(data):
+    """Upgrade a stored document to SCHEMA_VERSION.
+
+    Raises ValueError for documents written by a newer schema, which this
+    code must not rewrite.
+    """
+    version = stored_version(data)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Schema version {version} is newer than supported ({SCHEMA_VERSION})")
+    for step in MIGRATIONS[version:]:
+        data = step(data)
+    data['schemaVersion'] = SCHEMA_VERSION
+    return data
@@ -0,0 +1,30 @@
+# Items in a container are sorted by a numeric ``order``. Placing an item
+# between two neighbours gives it the midpoint of their orders, so a move
+# rewrites one record instead of renumbering the container. Repeated
+# insertion into the same gap halves it each time; once it falls below
+# REBALANCE_GAP the container is renumbered 0..n-1 in the background, and a
+# gap that can't be split any more forces that renumbering on the spot.
+REBALANCE_GAP = 1e-6
+
+
+def key_between(before, after):
+    """An order strictly between two neighbours' orders (None for an open end).
+
+    Returns None when there is no representable value in between.
+    """
+    if before is None and after is None:
+        return 0
+    if before is None:
+        return after - 1
+    if after is None:
+        return before + 1
+    middle = (before + after) / 2
+    if before < middle < after:
+        return middle
+    return None
+
+
+def needs_rebalance(before, key, after):
+    """Whether either gap around a newly placed key has become too narrow"""
+    return ((before is not None and key - before < REBALANCE_GAP) or
+            (after is not None and after - key < REBALANCE_GAP))
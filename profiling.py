@@ -0,0 +1,130 @@
+import cProfile
+import io
+import json
+import pstats
+import re
+import time
+from pathlib import Path
+
+from flask import g, jsonify, request
+
+# Profiles kept on disk; older ones are deleted as new ones are saved
+KEEP_PROFILES = 50
+
+
+def profile_requested():
+    return request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+
+
+class ProfileStore:
+    """Saved request profiles: NAME.prof (pstats data) plus NAME.json metadata"""
+
+    def __init__(self, directory, keep=KEEP_PROFILES):
+        self.directory = Path(directory)
+        self.keep = keep
+
+    def save(self, profiler, meta):
+        """Write a profile and its metadata; returns the profile's name"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', meta['route']).strip('-') or 'root'
+        name = f"{int(meta['timestamp'] * 1000)}-{meta['method'].lower()}-{slug}"
+        profiler.dump_stats(self.directory / f'{name}.prof')
+        with open(self.directory / f'{name}.json', 'w') as f:
+            json.dump(dict(meta, name=name), f)
+        self._prune()
+        return name
+
+    def recent(self, limit=None):
+        """Metadata of the saved profiles, newest first"""
+        entries = []
+        for path in sorted(self.directory.glob('*.json'), reverse=True)[:limit]:
+            try:
+                with open(path) as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def report(self, name, limit=40, sort='cumulative'):
+        """The top functions of a profile as pstats prints them, or None"""
+        path = self.directory / f'{name}.prof'
+        if not re.fullmatch(r'[A-Za-z0-9-]+', name) or not path.exists():
+            return None
+        out = io.StringIO()
+        pstats.Stats(str(path), stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def _prune(self):
+        for path in sorted(self.directory.glob('*.json'), reverse=True)[self.keep:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def enable_profiling(app, directory, keep=KEEP_PROFILES):
+    """Let requests to `app` ask to be profiled with cProfile.
+
+    A request with an ``X-Profile: 1`` header or ``?profile=1`` runs under
+    cProfile; the profile is saved to `directory` with its route, status
+    and timing, and named in the ``X-Profile-Name`` response header.
+    /api/profiles lists the saved profiles and /api/profiles/<name> prints
+    one. Other requests only pay for checking the header and query.
+    """
+    store = ProfileStore(directory, keep=keep)
+
+    @app.before_request
+    def start_profile():
+        if not profile_requested():
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler at a time; this request
+            # runs unprofiled while another is
+            return
+        g.profile = (profiler, time.time(), time.perf_counter())
+
+    @app.after_request
+    def save_profile(response):
+        entry = g.pop('profile', None)
+        if entry is None:
+            return response
+        profiler, started_at, started = entry
+        profiler.disable()
+        name = store.save(profiler, {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule is not None else 'unmatched',
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'seconds': round(time.perf_counter() - started, 6),
+            'responseBytes': response.content_length or 0,
+            'timestamp': started_at
+        })
+        response.headers['X-Profile-Name'] = name
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # after_request is skipped when the view raised
+        entry = g.pop('profile', None)
+        if entry is not None:
+            entry[0].disable()
+
+    @app.route('/api/profiles', methods=['GET'])
+    def list_profiles():
+        """List saved request profiles, newest first"""
+        limit = min(request.args.get('limit', 20, type=int), 500)
+        return jsonify({'profiles': store.recent(limit)})
+
+    @app.route('/api/profiles/<name>', methods=['GET'])
+    def get_profile(name):
+        """Print a saved profile's top functions (?sort=tottime, ?limit=N)"""
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'calls'):
+            return jsonify({'error': 'Invalid sort, expected cumulative, tottime or calls'}), 400
+        report = store.report(name, limit=min(request.args.get('limit', 40, type=int), 500), sort=sort)
+        if report is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return report, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+    return store
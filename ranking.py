@@ -0,0 +1,119 @@
+import math
+from bisect import bisect_left, insort
+
+# A copy's weight in the recent score halves every this many days
+HALF_LIFE_DAYS = 7
+
+MODES = ('recent', 'lifetime')
+
+
+def decay_rate(half_life_days=HALF_LIFE_DAYS):
+    """Exponential decay constant per millisecond"""
+    return math.log(2) / (half_life_days * 24 * 60 * 60 * 1000)
+
+
+def record_use(prompt, now, rate):
+    """Fields to set on a prompt for one counted copy at `now` (ms).
+
+    ``recentUsage`` is the decayed copy count as of ``lastCopiedAt``; a
+    prompt counted before it was tracked starts from its lifetime count.
+    """
+    last = prompt.get('lastCopiedAt', 0)
+    recent = prompt.get('recentUsage', prompt.get('usageCount', 0) if last else 0)
+    recent *= math.exp(-rate * max(now - last, 0))
+    return {'usageCount': prompt.get('usageCount', 0) + 1,
+            'recentUsage': recent + 1,
+            'lastCopiedAt': now}
+
+
+class UsageRanking:
+    """Prompts ranked by lifetime and by time-decayed copy counts.
+
+    The recent score of a prompt at time t is recentUsage * exp(-rate *
+    (t - lastCopiedAt)). All scores decay by the same factor, so prompts are
+    ranked by log(recentUsage) + rate * lastCopiedAt, which doesn't change
+    until the prompt is copied again. Both rankings are therefore plain
+    sorted lists updated on each copy, and a top-k query reads the first k
+    entries. Prompts that were never copied aren't indexed.
+
+    The repository calls add/remove/update as prompts change, like it does
+    for FolderStats; update compares against the stored keys, so edits that
+    don't touch usage cost a dict lookup.
+    """
+
+    def __init__(self, half_life_days=HALF_LIFE_DAYS):
+        self.rate = decay_rate(half_life_days)
+        # mode -> sorted [(-key, prompt id)]
+        self._ranks = {mode: [] for mode in MODES}
+        # prompt id -> {mode: key} it is ranked with
+        self._keys = {}
+
+    def rebuild(self, prompts):
+        self._ranks = {mode: [] for mode in MODES}
+        self._keys = {}
+        for prompt in prompts:
+            keys = self._rank_keys(prompt)
+            if keys is not None:
+                self._keys[prompt['id']] = keys
+                for mode, key in keys.items():
+                    self._ranks[mode].append((-key, prompt['id']))
+        for ranks in self._ranks.values():
+            ranks.sort()
+
+    def add(self, prompt):
+        keys = self._rank_keys(prompt)
+        if keys is None:
+            return
+        self._keys[prompt['id']] = keys
+        for mode, key in keys.items():
+            insort(self._ranks[mode], (-key, prompt['id']))
+
+    def remove(self, prompt_id):
+        keys = self._keys.pop(prompt_id, None)
+        if keys is None:
+            return
+        for mode, key in keys.items():
+            ranks = self._ranks[mode]
+            del ranks[bisect_left(ranks, (-key, prompt_id))]
+
+    def update(self, prompt):
+        if self._keys.get(prompt['id']) == self._rank_keys(prompt):
+            return
+        self.remove(prompt['id'])
+        self.add(prompt)
+
+    def top(self, k, mode='recent', now=None, pending=None):
+        """[(prompt id, score)] of the k highest ranked prompts.
+
+        The recent score is evaluated at `now` (ms) when given. ``pending``
+        maps prompt ids to usage fields not stored yet (see
+        UsageCounter.pending_fields); those prompts are ranked by them
+        instead of by their indexed keys.
+        """
+        if not pending:
+            ranked = self._ranks[mode][:k]
+        else:
+            # At most len(pending) of the leading entries are replaced
+            ranked = [(key, prompt_id) for key, prompt_id in self._ranks[mode][:k + len(pending)]
+                      if prompt_id not in pending]
+            for prompt_id, fields in pending.items():
+                keys = self._rank_keys(fields)
+                if keys is not None:
+                    ranked.append((-keys[mode], prompt_id))
+            ranked = sorted(ranked)[:k]
+        if mode == 'lifetime':
+            return [(prompt_id, -key) for key, prompt_id in ranked]
+        return [(prompt_id, math.exp(-key - self.rate * now) if now is not None else None)
+                for key, prompt_id in ranked]
+
+    def _rank_keys(self, prompt):
+        usage = prompt.get('usageCount', 0)
+        if usage <= 0:
+            return None
+        last = prompt.get('lastCopiedAt', 0)
+        recent = prompt.get('recentUsage', usage if last else 0)
+        if recent > 0:
+            recent_key = math.log(recent) + self.rate * last
+        else:
+            recent_key = -math.inf
+        return {'lifetime': usage, 'recent': recent_key}
@@ -0,0 +1,110 @@
+from flask import Blueprint, Response, jsonify, request
+
+from ranking import MODES as RANKING_MODES
+from transfer import export_records, import_records
+
+
+def read_api(repo, events, usage, response_cache):
+    """A blueprint with the routes app.py and dapp.py serve alike.
+
+    Mostly reads (changes, events, search, ranking, version and folder
+    pages); only the app-specific routes, such as /api/data and the
+    mutations, stay in each app. It also refreshes `repo` before every
+    request of the app it is registered on.
+    """
+    api = Blueprint('read_api', __name__)
+
+    @api.before_app_request
+    def refresh_repository():
+        # With shared storage another worker may have written since the last request
+        repo.refresh()
+
+    @api.route('/api/changes', methods=['GET'])
+    def get_changes():
+        """Get prompts and folders changed since a revision of /api/data"""
+        since = request.args.get('since', 0, type=int)
+        return jsonify(repo.changes_since(since, request.args.get('instance')))
+
+    @api.route('/api/events', methods=['GET'])
+    def stream_events():
+        """Stream repository changes as Server-Sent Events"""
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+        subscriber = events.subscribe(last_event_id)
+        if subscriber is None:
+            return jsonify({'error': 'Too many event streams'}), 503, {'Retry-After': '30'}
+        return Response(events.stream(subscriber), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @api.route('/api/export', methods=['GET'])
+    def export_data():
+        """Stream the repository as NDJSON, one folder, prompt or version per line"""
+        return Response(export_records(repo), mimetype='application/x-ndjson',
+                        headers={'Content-Disposition': 'attachment; filename=prompts.ndjson'})
+
+    @api.route('/api/import', methods=['POST'])
+    def import_data():
+        """Add the records of an NDJSON export (with new ids) and report throughput"""
+        return jsonify(import_records(repo, request.stream))
+
+    @api.route('/api/search', methods=['GET'])
+    def search_prompts():
+        """Search prompt names and text (name matches rank first)"""
+        query = request.args.get('q', '')
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        folder_id = request.args.get('folder')
+        return jsonify(repo.search(query, limit=limit, folder_id=folder_id))
+
+    @api.route('/api/prompts/top', methods=['GET'])
+    def top_prompts():
+        """Get the most used prompts ('recent' weighs recent copies more, 'lifetime' counts all)"""
+        k = min(request.args.get('k', 10, type=int), 500)
+        mode = request.args.get('mode', 'recent')
+        if mode not in RANKING_MODES:
+            return jsonify({'error': f"Invalid mode, expected one of: {', '.join(RANKING_MODES)}"}), 400
+        # Rank with the copies still buffered, so a copy shows up right away
+        # without writing them early
+        return jsonify({'mode': mode,
+                        'prompts': repo.top_prompts(max(k, 0), mode, pending=usage.pending_fields())})
+
+    @api.route('/api/prompts/<prompt_id>/versions', methods=['GET'])
+    def get_versions(prompt_id):
+        """Get a page of a prompt's version history, newest first"""
+        cursor = request.args.get('cursor', type=int)
+        # At least one version per page, or a paging client would never advance
+        limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+        with repo.lock:
+            if not repo.get_prompt(prompt_id):
+                return jsonify({'error': 'Prompt not found'}), 404
+            return jsonify(repo.versions_page(prompt_id, cursor=cursor, limit=limit))
+
+    @api.route('/api/folders/stats', methods=['GET'])
+    def get_folder_stats():
+        """Get prompt counts, total usage and last modification of every folder's subtree"""
+        with repo.lock:
+            etag = repo.etag()
+            entry = response_cache.get('folder-stats', etag, repo.folder_stats)
+        return response_cache.response(entry, etag)
+
+    @api.route('/api/folders/<folder_id>/subtree', methods=['GET'])
+    def get_subtree(folder_id):
+        """Get all prompts in a folder and its subfolders"""
+        subtree = repo.subtree(folder_id)
+        if subtree is None:
+            return jsonify({'error': 'Folder not found'}), 404
+        return jsonify(subtree)
+
+    @api.route('/api/folders/<folder_id>/children', methods=['GET'])
+    def get_children(folder_id):
+        """Get a page of the folders and prompts in a folder ('root' or 'null' for the top level)"""
+        container_id = None if folder_id in ('root', 'null') else folder_id
+        # At least one item per page, or a paging client would never advance
+        limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+        with repo.lock:
+            if container_id is not None and not repo.get_folder(container_id):
+                return jsonify({'error': 'Folder not found'}), 404
+            try:
+                return jsonify(repo.children_page(container_id, request.args.get('cursor'), limit))
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+    return api
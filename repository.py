@@ -0,0 +1,861 @@
+import atexit
+import threading
+import uuid
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from blobs import BlobStore
+from changes import ChangeLog, touched_keys
+from migrations import SCHEMA_VERSION, migrate, stored_version
+from ordering import key_between, needs_rebalance
+from ranking import UsageRanking
+from search import SearchIndex
+from serializers import gc_paused
+from stats import FolderStats
+from storage import make_storage
+from tree import FolderTree
+from versions import VersionStore
+
+# Fields the server maintains (copy counts) or that only record UI state.
+# Setting them doesn't bump an item's ``rev``, so they never cause a conflict.
+UNVERSIONED_FIELDS = frozenset({'usageCount', 'recentUsage', 'lastCopiedAt', 'expanded'})
+
+
+class Repository:
+    """Process-resident prompts and folders with write-behind persistence.
+
+    The data is read once at startup and every request is served from
+    memory. Routes mutate through insert/update/delete inside a transaction;
+    each mutation is recorded as a compact record (put/set/del/ver) and
+    handed to the storage backend on commit. Storage is then flushed by a
+    background thread once no mutation has happened for ``flush_interval``
+    seconds (but at least every ``max_delay`` seconds under constant load),
+    or before the transaction returns when ``sync_writes`` is set.
+
+    Version histories are delta-compressed by versions.VersionStore: only
+    every ``keyframe_interval``-th version keeps its full text.
+
+    Stored documents carry a ``schemaVersion``. Older ones are upgraded
+    once at load by migrations.migrate (which back-fills missing fields)
+    and rewritten, so nothing is normalized afterwards. A ``read_only``
+    repository (e.g. for an export) upgrades them in memory only and never
+    writes its files.
+
+    Identical texts are stored once: blobs.BlobStore shares one string
+    between every prompt and keyframe version that holds it, and drops it
+    when the last of them is edited or deleted. Every storage also writes
+    them once, referenced by hash (see the end of blobs.py).
+
+    Folders are also indexed by tree.FolderTree (ordered children, ancestor
+    paths), which routes use for sibling queries and cycle checks.
+
+    ``storage_mode`` selects the backend from storage.make_storage:
+    'snapshot' (config.json rewritten on flush), 'journal' (mutations
+    appended to config.journal) or 'sqlite' (row-level writes to
+    config.sqlite3). Snapshots are indented JSON or, with
+    ``snapshot_format='binary'``, the compact format from serializers.py.
+
+    'shared' lets several server processes use one config.json (see
+    shared_storage.py): transactions hold an exclusive file lock and write
+    through before it is released, and ``refresh`` reloads the data when
+    another process has replaced the file.
+    """
+
+    def __init__(self, path, seed=None, flush_interval=1.0,
+                 max_delay=None, sync_writes=False, storage_mode='snapshot',
+                 compact_bytes=4 * 1024 * 1024, snapshot_format='json', keyframe_interval=20,
+                 change_log_size=1000, read_only=False):
+        self.path = Path(path)
+        self.seed = seed
+        self.read_only = read_only
+        self.flush_interval = flush_interval
+        self.max_delay = max_delay if max_delay is not None else flush_interval * 5
+        # A shared file must be written before its lock is released
+        self.sync_writes = sync_writes or storage_mode == 'shared'
+        self.storage = make_storage(storage_mode, self.path, compact_bytes=compact_bytes,
+                                    snapshot_format=snapshot_format)
+        self.versions = VersionStore(keyframe_interval=keyframe_interval)
+        self.blobs = BlobStore()
+        self.search_index = SearchIndex()
+        self.tree = FolderTree()
+        self.stats = FolderStats(self)
+        self.ranking = UsageRanking()
+        self.changes = ChangeLog(max_revisions=change_log_size)
+
+        # Locks are always taken in this order: storage.locked() (shared
+        # storage's file lock), _write_lock, lock. So writes happen after a
+        # transaction has released the repository lock.
+        self.lock = threading.RLock()
+        self._cond = threading.Condition(self.lock)
+        self._write_lock = threading.Lock()
+        # Nesting depth of transaction() in the thread holding the lock
+        self._depth = 0
+        self.prompts = {}
+        self.folders = {}
+        # container id (None for root) -> [(order, kind, id)] of the items
+        # directly in it, kept sorted
+        self._containers = defaultdict(list)
+        # Containers whose order gaps got narrow, renumbered when idle
+        self._rebalance = set()
+        # prompt id -> {version id: position in prompt['versions']}
+        self._version_index = {}
+        # Bumped by every commit that changed something; with the instance
+        # id it identifies the repository contents (e.g. as an HTTP ETag)
+        self.revision = 0
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._pending = []
+        self._dirty = False
+        self._first_change = 0.0
+        self._last_change = 0.0
+        self._closed = False
+        self._listeners = []
+        self._last_id = 0
+        # Undo steps of the innermost atomic() block, None outside of one
+        self._undo = None
+        self._compactor = None
+        self._flusher = None
+        # Seconds the last load spent in each phase (read, migrate, replay, index)
+        self.load_seconds = {}
+        # metrics.Histogram of seconds transactions waited for the locks;
+        # set by metrics.instrument, nothing is timed while it is None
+        self.lock_wait = None
+
+        self.load()
+
+        if not self.sync_writes and not read_only:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+        atexit.register(self.close)
+
+    # ------------------ Loading ------------------
+    def load(self):
+        """Load the stored data into memory, seeding it if missing or corrupted"""
+        # The storage lock keeps other processes from seeding or migrating
+        # a shared file at the same time
+        with self.storage.locked():
+            self._load()
+
+    def _load(self):
+        started = time.perf_counter()
+        data = self.storage.load()
+        self.load_seconds = {'read': time.perf_counter() - started}
+
+        seeded = False
+        if data is None:
+            if self.seed:
+                print(f"Creating new {self.path.name} with seed data...")
+                data = self.seed()
+                seeded = True
+            else:
+                data = {'prompts': [], 'folders': [], 'schemaVersion': SCHEMA_VERSION}
+
+        # Documents from older versions are upgraded once and rewritten,
+        # after copying the stored files aside
+        started = time.perf_counter()
+        version = stored_version(data)
+        migrated = version != SCHEMA_VERSION
+        if migrated:
+            data = migrate(data)
+            if self.read_only:
+                print(f"Upgraded {self.storage.path.name} from schema version {version} "
+                      f"in memory only (opened read-only)")
+            elif not seeded:
+                for backup in self.storage.backup(f'v{version}'):
+                    print(f"Backed up {backup.name} before migrating")
+                print(f"Migrated {self.storage.path.name} from schema version {version} to {SCHEMA_VERSION}")
+        self.load_seconds['migrate'] = time.perf_counter() - started
+
+        with self.lock:
+            started = time.perf_counter()
+            self.prompts = {p['id']: p for p in data.get('prompts', [])}
+            self.folders = {f['id']: f for f in data.get('folders', [])}
+            self._seq = data.get('journalSeq', 0)
+
+            # Replay mutations recorded after the snapshot was written
+            replayed = 0
+            for record in self.storage.replay(self._seq):
+                self.apply_record(record)
+                self._seq = record['seq']
+                replayed += 1
+            if replayed:
+                print(f"Replayed {replayed} journal records")
+            self.load_seconds['replay'] = time.perf_counter() - started
+            started = time.perf_counter()
+
+            # Histories written before delta compression are re-encoded once
+            reencoded = sum(self.versions.encode_history(p['id'], p['versions'])
+                            for p in self.prompts.values())
+            if reencoded:
+                print(f"Delta-encoded {reencoded} stored versions")
+
+            self._rebuild_indexes()
+            self.load_seconds['index'] = time.perf_counter() - started
+
+        if self.read_only:
+            return
+        if seeded or migrated or reencoded or self.storage.needs_rewrite:
+            with self.storage.locked(), self._write_lock:
+                self.storage.save_all(self)
+
+    def refresh(self):
+        """Reload the data if another process replaced the stored file.
+
+        Only shared storage ever goes stale, and checking costs a stat(), so
+        this runs before every request. Clients are told to resync, as after
+        a restart. Returns whether anything was reloaded.
+        """
+        if not self.storage.is_stale():
+            return False
+        with self.lock:
+            # Another thread may have reloaded while this one waited
+            if not self.storage.is_stale():
+                return False
+            started = time.perf_counter()
+            data = self.storage.load() or {}
+            read = time.perf_counter()
+            self.prompts = {p['id']: p for p in data.get('prompts', [])}
+            self.folders = {f['id']: f for f in data.get('folders', [])}
+            self._seq = data.get('journalSeq', 0)
+            self._rebalance = set()
+            self.versions.clear()
+            self._rebuild_indexes()
+            self.load_seconds = {'read': read - started, 'index': time.perf_counter() - read}
+
+            self.revision += 1
+            self.changes.reset(self.revision)
+            state = {'resync': True, 'revision': self.revision, 'instance': self.instance_id}
+            for listener in self._listeners:
+                listener(state)
+        return True
+
+    def document(self):
+        """Return the repository in the config.json layout"""
+        with self.lock:
+            return {
+                'prompts': list(self.prompts.values()),
+                'folders': list(self.folders.values())
+            }
+
+    def summary_document(self):
+        """Like document() but with prompts reduced to their current state.
+
+        Includes the revision it reflects, to continue from with changes_since.
+        """
+        with self.lock:
+            return {
+                'prompts': [self.prompt_summary(p) for p in self.prompts.values()],
+                'folders': list(self.folders.values()),
+                'revision': self.revision,
+                'instance': self.instance_id
+            }
+
+    def changes_since(self, since, instance=None):
+        """Prompts and folders upserted or deleted after revision `since`.
+
+        Returns ``resync: True`` when that revision is no longer in the change
+        log or belongs to another server process (``instance``).
+        """
+        with self.lock:
+            touched = None
+            if (instance is None or instance == self.instance_id) and since <= self.revision:
+                touched = self.changes.since(since)
+            if touched is None:
+                return {'resync': True, 'revision': self.revision, 'instance': self.instance_id}
+
+            return self._change_set(touched)
+
+    def _change_set(self, touched):
+        """Current state of the touched (kind, id) keys, as /api/changes returns it"""
+        result = {
+            'revision': self.revision,
+            'instance': self.instance_id,
+            'prompts': [],
+            'folders': [],
+            'deletedPrompts': [],
+            'deletedFolders': []
+        }
+        for kind, item_id in touched:
+            item = self.get(kind, item_id)
+            if item is None:
+                result['deletedPrompts' if kind == 'prompt' else 'deletedFolders'].append(item_id)
+            elif kind == 'prompt':
+                result['prompts'].append(self.prompt_summary(item))
+            else:
+                result['folders'].append(item)
+        return result
+
+    def add_listener(self, callback):
+        """Call ``callback(change_set)`` after every commit that changed something.
+
+        Callbacks run with the repository lock held, so they must not block.
+        """
+        with self.lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self.lock:
+            self._listeners.remove(callback)
+
+    @staticmethod
+    def prompt_summary(prompt):
+        """A prompt without its version history, plus the number of versions"""
+        summary = {k: v for k, v in prompt.items() if k != 'versions'}
+        summary['versionCount'] = len(prompt['versions'])
+        return summary
+
+    def etag(self):
+        return f"{self.instance_id}-{self.revision}"
+
+    def snapshot(self):
+        """The document written to config.json, safe to serialize without the lock"""
+        with self.lock, gc_paused():
+            # Prompts and folders are updated in place and histories are
+            # appended to, so those are copied; stored versions never change.
+            # This holds the lock for a fraction of the time serializing does.
+            return {
+                'prompts': [dict(p, versions=list(p['versions'])) for p in self.prompts.values()],
+                'folders': [dict(f) for f in self.folders.values()],
+                'schemaVersion': SCHEMA_VERSION,
+                'journalSeq': self._seq
+            }
+
+    # ------------------ Lookups ------------------
+    def _collection(self, kind):
+        return self.prompts if kind == 'prompt' else self.folders
+
+    def get(self, kind, item_id):
+        return self._collection(kind).get(item_id)
+
+    def get_prompt(self, prompt_id):
+        return self.prompts.get(prompt_id)
+
+    def get_folder(self, folder_id):
+        return self.folders.get(folder_id)
+
+    def find_version(self, prompt_id, version_id):
+        """A version with its full text, or None"""
+        position = self._version_index.get(prompt_id, {}).get(version_id)
+        if position is None:
+            return None
+        return self.versions.expand(prompt_id, self.prompts[prompt_id]['versions'], position)
+
+    def versions_page(self, prompt_id, cursor=None, limit=20):
+        """One page of a prompt's versions, newest first.
+
+        ``cursor`` is the position to continue below (from the previous
+        page's ``nextCursor``); positions never change because history is
+        append-only, so pages stay stable while new versions are added.
+        """
+        with self.lock:
+            versions = self.prompts[prompt_id]['versions']
+            end = len(versions) if cursor is None else max(0, min(cursor, len(versions)))
+            start = max(0, end - limit)
+            return {
+                'versions': [self.versions.expand(prompt_id, versions, i)
+                             for i in range(end - 1, start - 1, -1)],
+                'total': len(versions),
+                'nextCursor': start if start > 0 else None
+            }
+
+    def search(self, query, limit=50, folder_id=None):
+        """Prompts matching `query`: name matches first, then text matches.
+
+        Within each group prompts are ranked by usageCount, then name.
+        ``folder_id`` restricts results to one folder ('root' for unfiled
+        prompts). The match counts are None when the search stopped at
+        `limit` results before counting them (see SearchIndex.search).
+        """
+        with self.lock:
+            within = None
+            if folder_id is not None:
+                container = None if folder_id == 'root' else folder_id
+                within = [item_id for _, kind, item_id in self._containers.get(container, ())
+                          if kind == 'prompt']
+            name_ids, text_ids, name_total, text_total = self.search_index.search(query, limit, within)
+            results = [dict(self.prompt_summary(self.prompts[i]), match='name') for i in name_ids]
+            results.extend(dict(self.prompt_summary(self.prompts[i]), match='text') for i in text_ids)
+            return {'results': results, 'nameMatches': name_total, 'textMatches': text_total}
+
+    def top_prompts(self, k=10, mode='recent', now=None, pending=None):
+        """Summaries of the k most used prompts, each with its ``score``.
+
+        ``mode`` is 'recent' (copies decayed by age, see ranking.py) or
+        'lifetime' (usageCount). ``pending`` holds usage fields not written
+        yet (UsageCounter.pending_fields), which are ranked and returned in
+        place of the stored ones.
+        """
+        now = int(time.time() * 1000) if now is None else now
+        pending = pending or {}
+        with self.lock:
+            pending = {i: fields for i, fields in pending.items() if i in self.prompts}
+            return [dict(self.prompt_summary(self.prompts[prompt_id]), **pending.get(prompt_id, {}),
+                         score=score)
+                    for prompt_id, score in self.ranking.top(k, mode, now, pending)]
+
+    def folder_stats(self):
+        """Aggregates of every folder (see stats.FolderStats), by folder id"""
+        with self.lock:
+            return self.stats.all()
+
+    def subtree(self, folder_id):
+        """Summaries of every prompt under a folder.
+
+        A folder's own prompts come first, then each subfolder's subtree in
+        display order, as the UI lists them. Returns None for unknown folders.
+        """
+        with self.lock:
+            folder = self.folders.get(folder_id)
+            if folder is None:
+                return None
+            prompts = []
+            stack = [folder_id]
+            while stack:
+                container_id = stack.pop()
+                prompts.extend(self.prompt_summary(p) for p in self.child_prompts(container_id))
+                stack.extend(reversed(self.tree.children(container_id)))
+            return {'folder': folder, 'stats': self.stats.get(folder_id), 'prompts': prompts}
+
+    def children_page(self, container_id, cursor=None, limit=100):
+        """One page of the folders and prompts directly in a container, in display order.
+
+        Items carry a ``type`` of 'folder' or 'prompt'; prompts are summaries.
+        ``cursor`` is the previous page's ``nextCursor``, which names the last
+        item returned rather than a position, so the next page starts in the
+        right place even if items were added or moved in between. Raises
+        ValueError for a malformed cursor.
+        """
+        with self.lock:
+            members = self._containers.get(container_id, [])
+            start = 0
+            if cursor is not None:
+                order, kind, item_id = cursor.split(':', 2)
+                start = bisect_right(members, (float(order), kind, item_id))
+            page = members[start:start + limit]
+            items = []
+            for _, kind, item_id in page:
+                if kind == 'folder':
+                    items.append(dict(self.folders[item_id], type='folder'))
+                else:
+                    items.append(dict(self.prompt_summary(self.prompts[item_id]), type='prompt'))
+            more = start + len(page) < len(members)
+            return {
+                'items': items,
+                'total': len(members),
+                'nextCursor': '%r:%s:%s' % page[-1] if more and page else None,
+                'revision': self.revision,
+                'instance': self.instance_id
+            }
+
+    def container_items(self, container_id):
+        """(kind, item) pairs for the folders and prompts directly in a container, in order"""
+        return [(kind, self.get(kind, item_id)) for _, kind, item_id in self._containers.get(container_id, ())]
+
+    def child_folders(self, container_id):
+        """Folders directly in a container, in display order"""
+        return [self.folders[folder_id] for folder_id in self.tree.children(container_id)]
+
+    def child_prompts(self, container_id):
+        return [item for kind, item in self.container_items(container_id) if kind == 'prompt']
+
+    # ------------------ Indexes ------------------
+    @staticmethod
+    def container_of(kind, item):
+        return item.get('folderId') if kind == 'prompt' else item.get('parentId')
+
+    def _rebuild_indexes(self):
+        self._containers = defaultdict(list)
+        self._version_index = {}
+        for kind in ('folder', 'prompt'):
+            for item in self._collection(kind).values():
+                self._containers[self.container_of(kind, item)].append(self._order_entry(kind, item))
+        for members in self._containers.values():
+            members.sort()
+        for prompt in self.prompts.values():
+            self._index_versions(prompt)
+        self.blobs.rebuild(self.prompts.values())
+        self.search_index.rebuild(self.prompts.values())
+        self.tree.rebuild(self.folders.values())
+        self.stats.rebuild()
+        self.ranking.rebuild(self.prompts.values())
+
+    def _index_versions(self, prompt):
+        self._version_index[prompt['id']] = {v['id']: i for i, v in enumerate(prompt['versions'])}
+
+    @staticmethod
+    def _order_entry(kind, item):
+        return (item.get('order', 0), kind, item['id'])
+
+    def _index_add(self, kind, item):
+        insort(self._containers[self.container_of(kind, item)], self._order_entry(kind, item))
+
+    def _index_remove(self, kind, item):
+        container = self.container_of(kind, item)
+        members = self._containers.get(container)
+        if members is not None:
+            entry = self._order_entry(kind, item)
+            i = bisect_left(members, entry)
+            if i < len(members) and members[i] == entry:
+                del members[i]
+            if not members:
+                del self._containers[container]
+
+    # ------------------ Ordering ------------------
+    def append_order(self, container_id):
+        """Order value that places an item after everything in a container"""
+        members = self._containers.get(container_id)
+        return key_between(members[-1][0] if members else None, None)
+
+    def order_at(self, container_id, position, moving=None):
+        """Order value that places an item at index `position` (None: the end) of a container.
+
+        ``moving`` is the (kind, id) of an item being moved, which doesn't
+        count as a neighbour. Only if the gap can't be split any more is the
+        container renumbered first (touching every item); otherwise nothing
+        but the placed item changes.
+        """
+        members = [m for m in self._containers.get(container_id, ()) if m[1:] != moving]
+        if position is None:
+            position = len(members)
+        position = max(0, min(position, len(members)))
+        before = members[position - 1][0] if position > 0 else None
+        after = members[position][0] if position < len(members) else None
+        key = key_between(before, after)
+        if key is None:
+            self.rebalance(container_id)
+            return self.order_at(container_id, position, moving)
+        if needs_rebalance(before, key, after):
+            self._rebalance.add(container_id)
+        return key
+
+    def rebalance(self, container_id):
+        """Renumber a container's items 0..n-1 in their current order"""
+        self._rebalance.discard(container_id)
+        for i, (order, kind, item_id) in enumerate(list(self._containers.get(container_id, ()))):
+            if order != i:
+                # Renumbering keeps every item in place, so revisions stay
+                self._set_fields(kind, item_id, {'order': i})
+
+    def _rebalance_containers(self):
+        for container_id in list(self._rebalance):
+            self.rebalance(container_id)
+
+    def _rebalance_pending(self):
+        with self.transaction():
+            self._rebalance_containers()
+
+    # ------------------ Mutations ------------------
+    # These must be called inside ``transaction()``.
+
+    def insert(self, kind, item):
+        """Add a new prompt or folder (at revision 1)"""
+        item['rev'] = 1
+        self._attach(kind, item)
+        self._record({'op': 'put', 'kind': kind, 'item': item})
+        self._on_undo(lambda: self._detach(kind, item))
+        return item
+
+    def update(self, kind, item_id, **fields):
+        """Set fields on an existing prompt or folder, bumping its ``rev``"""
+        if not fields.keys() <= UNVERSIONED_FIELDS:
+            fields['rev'] = self._collection(kind)[item_id].get('rev', 0) + 1
+        return self._set_fields(kind, item_id, fields)
+
+    def _set_fields(self, kind, item_id, fields):
+        item = self._collection(kind)[item_id]
+        if self._undo is not None:
+            previous = {k: item[k] for k in fields if k in item}
+            added = [k for k in fields if k not in item]
+            self._undo.append(lambda: self._restore_fields(kind, item, previous, added))
+        replaced_text = None
+        if kind == 'prompt' and 'text' in fields:
+            replaced_text = item['text']
+            fields['text'] = self.blobs.acquire(fields['text'])
+        # Only the container and order affect the container index
+        reindex = 'order' in fields or ('folderId' if kind == 'prompt' else 'parentId') in fields
+        if reindex:
+            self._index_remove(kind, item)
+        item.update(fields)
+        if reindex:
+            self._index_add(kind, item)
+        if replaced_text is not None:
+            self.blobs.release(replaced_text)
+        if kind == 'prompt':
+            if 'name' in fields or 'text' in fields:
+                self.search_index.update(item)
+            elif 'usageCount' in fields:
+                self.search_index.reorder(item)
+            self.stats.update_prompt(item)
+            self.ranking.update(item)
+        else:
+            self.tree.update(item)
+            self.stats.update_folder(item)
+        self._record({'op': 'set', 'kind': kind, 'id': item_id, 'fields': fields})
+        return item
+
+    def delete(self, kind, item_id):
+        """Remove a prompt or folder, returning it (or None)"""
+        item = self._collection(kind).get(item_id)
+        if item is not None:
+            self._detach(kind, item)
+            self._record({'op': 'del', 'kind': kind, 'id': item_id})
+            self._on_undo(lambda: self._attach(kind, item))
+        return item
+
+    def add_version(self, prompt_id, version):
+        """Append a version entry (with full text) to a prompt's history"""
+        versions = self.prompts[prompt_id]['versions']
+        stored = self.versions.encode(prompt_id, versions, version)
+        if 'text' in stored:
+            stored['text'] = self.blobs.acquire(stored['text'])
+        self._version_index[prompt_id][version['id']] = len(versions)
+        versions.append(stored)
+        self.stats.update_prompt(self.prompts[prompt_id])
+        self._record({'op': 'ver', 'id': prompt_id, 'version': stored})
+        self._on_undo(lambda: self._pop_version(prompt_id, version['id']))
+        return version
+
+    def new_id(self, now=None):
+        """A millisecond-timestamp id that no prompt or folder uses yet"""
+        now = int(time.time() * 1000) if now is None else now
+        # Starting past the last id handed out keeps bulk inserts from
+        # probing every id already taken in the same millisecond
+        now = max(now, self._last_id + 1)
+        while str(now) in self.prompts or str(now) in self.folders:
+            now += 1
+        self._last_id = now
+        return str(now)
+
+    @contextmanager
+    def atomic(self):
+        """Undo the block's in-memory mutations if it raises.
+
+        Use inside ``transaction()``: nothing is staged for storage before
+        the transaction commits, so dropping the block's records and undoing
+        its changes in memory leaves no trace of it.
+        """
+        with self.lock:
+            outer = self._undo
+            self._undo = []
+            mark = len(self._pending)
+            seq = self._seq
+            try:
+                yield self
+            except BaseException:
+                for step in reversed(self._undo):
+                    step()
+                del self._pending[mark:]
+                self._seq = seq
+                raise
+            else:
+                if outer is not None:
+                    outer.extend(self._undo)
+            finally:
+                self._undo = outer
+
+    def _on_undo(self, step):
+        if self._undo is not None:
+            self._undo.append(step)
+
+    def _attach(self, kind, item):
+        self._collection(kind)[item['id']] = item
+        self._index_add(kind, item)
+        if kind == 'prompt':
+            self._index_versions(item)
+            self.blobs.acquire_prompt(item)
+            self.search_index.add(item)
+            self.stats.add_prompt(item)
+            self.ranking.add(item)
+        else:
+            self.tree.add(item)
+            self.stats.add_folder(item)
+
+    def _detach(self, kind, item):
+        del self._collection(kind)[item['id']]
+        self._index_remove(kind, item)
+        if kind == 'prompt':
+            self._version_index.pop(item['id'], None)
+            self.versions.forget(item['id'])
+            self.blobs.release_prompt(item)
+            self.search_index.remove(item['id'])
+            self.stats.remove_prompt(item['id'])
+            self.ranking.remove(item['id'])
+        else:
+            self.stats.remove_folder(item['id'])
+            self.tree.remove(item['id'])
+
+    def _restore_fields(self, kind, item, previous, added):
+        if kind == 'prompt' and ('text' in previous or 'text' in added):
+            if 'text' in previous:
+                previous['text'] = self.blobs.acquire(previous['text'])
+            self.blobs.release(item['text'])
+        self._index_remove(kind, item)
+        item.update(previous)
+        for key in added:
+            item.pop(key, None)
+        self._index_add(kind, item)
+        if kind == 'prompt':
+            self.search_index.update(item)
+            self.stats.update_prompt(item)
+            self.ranking.update(item)
+        else:
+            self.tree.update(item)
+            self.stats.update_folder(item)
+
+    def _pop_version(self, prompt_id, version_id):
+        stored = self.prompts[prompt_id]['versions'].pop()
+        if 'text' in stored:
+            self.blobs.release(stored['text'])
+        del self._version_index[prompt_id][version_id]
+        self.versions.forget(prompt_id)
+        self.stats.update_prompt(self.prompts[prompt_id])
+
+    def _record(self, record):
+        self._seq += 1
+        record['seq'] = self._seq
+        self._pending.append(record)
+
+    def apply_record(self, record):
+        """Apply a mutation record (used when replaying the journal)"""
+        op = record['op']
+        if op == 'put':
+            self._collection(record['kind'])[record['item']['id']] = record['item']
+        elif op == 'set':
+            item = self._collection(record['kind']).get(record['id'])
+            if item is not None:
+                item.update(record['fields'])
+        elif op == 'del':
+            self._collection(record['kind']).pop(record['id'], None)
+        elif op == 'ver':
+            prompt = self.prompts.get(record['id'])
+            if prompt is not None:
+                prompt['versions'].append(record['version'])
+
+    @contextmanager
+    def transaction(self):
+        """Hold the repository lock and persist whatever changed on exit.
+
+        With ``sync_writes`` the outermost transaction writes after releasing
+        the repository lock (see the lock order in __init__), but before it
+        returns; a shared file stays locked until then.
+        """
+        if self.read_only:
+            raise RuntimeError(f"{self.path.name} was opened read-only")
+        started = time.perf_counter() if self.lock_wait is not None else None
+        with self.storage.locked():
+            with self.lock:
+                if started is not None:
+                    self.lock_wait.observe(time.perf_counter() - started)
+                # Apply the changes to the latest data of a shared file
+                self.refresh()
+                self._depth += 1
+                try:
+                    yield self
+                finally:
+                    self._depth -= 1
+                    outermost = self._depth == 0
+                    if outermost and self._rebalance and self._flusher is None:
+                        # No background writer renumbers them when idle
+                        self._rebalance_containers()
+                    self.commit()
+            if self.sync_writes and outermost:
+                self.flush()
+
+    def commit(self):
+        """Stage the pending records and notify listeners (the lock must be held)"""
+        with self.lock:
+            if not self._pending:
+                return
+            self.storage.stage(self._pending)
+            self.revision += 1
+            keys = touched_keys(self._pending)
+            self.changes.append(self.revision, keys)
+            self._pending = []
+            if self._listeners:
+                change_set = self._change_set(set(keys))
+                for listener in self._listeners:
+                    listener(change_set)
+            now = time.monotonic()
+            if not self._dirty:
+                self._first_change = now
+            self._last_change = now
+            self._dirty = True
+            if not self.sync_writes:
+                self._cond.notify()
+
+    # ------------------ Persistence ------------------
+    def flush(self):
+        """Persist staged changes now (never with the repository lock held)"""
+        with self.storage.locked(), self._write_lock:
+            with self.lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+            try:
+                self.storage.flush(self)
+            except Exception as e:
+                print(f"Error saving {self.path}: {e}")
+                with self.lock:
+                    self._dirty = True
+                return
+
+        if self.storage.needs_compaction():
+            self._start_compaction()
+
+    def _start_compaction(self):
+        with self.lock:
+            if self._closed or (self._compactor and self._compactor.is_alive()):
+                return
+            self._compactor = threading.Thread(target=self.compact, daemon=True)
+            self._compactor.start()
+
+    def compact(self):
+        """Rewrite the full snapshot (and empty the journal) in the background"""
+        try:
+            # Holding the write lock keeps new records staged in memory
+            # until the journal has been truncated
+            with self.storage.locked(), self._write_lock:
+                self.storage.save_all(self)
+        except Exception as e:
+            print(f"Error compacting {self.path}: {e}")
+
+    def _due_in(self):
+        """Seconds until the pending changes should be flushed"""
+        now = time.monotonic()
+        quiet = self._last_change + self.flush_interval - now
+        overdue = self._first_change + self.max_delay - now
+        return min(quiet, overdue)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if not self._dirty:
+                        self._cond.wait()
+                        continue
+                    delay = self._due_in()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._closed:
+                    return
+            if self._rebalance:
+                self._rebalance_pending()
+            self.flush()
+
+    def close(self):
+        """Stop the background writer and flush anything still pending"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        if self._compactor is not None:
+            self._compactor.join()
+        self.flush()
+        self.storage.close()
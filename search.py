@@ -0,0 +1,266 @@
+import gc
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r'\w+')
+GRAM_SIZE = 3
+
+# Up to SORT_LIMIT candidate prompts are ranked by sorting them. A query
+# part matching up to COLLECT_TOKENS tokens with up to COLLECT_LIMIT postings
+# between them is collected and the ranked order is walked for members;
+# beyond that matches are dense enough to walk checking substrings.
+SORT_LIMIT = 2000
+COLLECT_TOKENS = 5000
+COLLECT_LIMIT = 50_000
+
+
+def tokenize(text):
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+def rank_key(prompt):
+    """Search results come most copied first, then by name"""
+    return (-prompt.get('usageCount', 0), prompt.get('name', ''), prompt['id'])
+
+
+def grams(token):
+    """Every substring of `token` up to GRAM_SIZE characters long"""
+    out = set()
+    for n in range(1, GRAM_SIZE + 1):
+        for i in range(len(token) - n + 1):
+            out.add(token[i:i + n])
+    return out
+
+
+class SearchIndex:
+    """Inverted index over prompt names and current text.
+
+    Postings map each lowercase word token to the prompts whose name (or
+    text) contains it. Substring matching, which is what the UI offers, goes
+    through a gram index over the vocabulary rather than over documents:
+    every 1-3 character substring of a token points to the tokens containing
+    it, so a query part is resolved to the matching tokens and then to their
+    postings. Memory therefore grows with the vocabulary and the number of
+    distinct tokens per prompt, not with total text length.
+
+    Every prompt is also kept in ranked order (see rank_key), so a search
+    never has to rank every match: a query with few candidates sorts them,
+    others walk the ranked order and stop at the `limit`-th match. A common
+    query, such as the first letter typed, then stops after about `limit`
+    prompts instead of collecting most of the corpus.
+    """
+
+    def __init__(self):
+        self._postings = {'name': defaultdict(set), 'text': defaultdict(set)}
+        self._grams = defaultdict(set)
+        self._vocab = set()
+        # prompt id -> (lowercase name, lowercase text, name tokens, text tokens)
+        self._docs = {}
+        # sorted [rank_key] of every prompt, and prompt id -> its rank_key
+        self._ranked = []
+        self._rank_keys = {}
+
+    def rebuild(self, prompts):
+        self.__init__()
+        # Building millions of small sets otherwise triggers repeated full
+        # garbage collections
+        gc.disable()
+        try:
+            for prompt in prompts:
+                self._index(prompt)
+                self._rank_keys[prompt['id']] = rank_key(prompt)
+            self._ranked = sorted(self._rank_keys.values())
+        finally:
+            gc.enable()
+
+    def add(self, prompt):
+        self._index(prompt)
+        key = self._rank_keys[prompt['id']] = rank_key(prompt)
+        insort(self._ranked, key)
+
+    def _index(self, prompt):
+        name = prompt.get('name', '').lower()
+        text = prompt.get('text', '').lower()
+        name_tokens = tokenize(name)
+        text_tokens = tokenize(text)
+        self._docs[prompt['id']] = (name, text, name_tokens, text_tokens)
+        for token in (name_tokens | text_tokens) - self._vocab:
+            self._vocab.add(token)
+            for gram in grams(token):
+                self._grams[gram].add(token)
+        prompt_id = prompt['id']
+        for field, tokens in (('name', name_tokens), ('text', text_tokens)):
+            postings = self._postings[field]
+            for token in tokens:
+                postings[token].add(prompt_id)
+
+    def remove(self, prompt_id):
+        doc = self._docs.pop(prompt_id, None)
+        if doc is None:
+            return
+        key = self._rank_keys.pop(prompt_id)
+        del self._ranked[bisect_left(self._ranked, key)]
+        for field, tokens in (('name', doc[2]), ('text', doc[3])):
+            postings = self._postings[field]
+            for token in tokens:
+                ids = postings.get(token)
+                if ids is None:
+                    continue
+                ids.discard(prompt_id)
+                if not ids:
+                    del postings[token]
+                    if token not in self._postings['name'] and token not in self._postings['text']:
+                        self._forget_token(token)
+
+    def update(self, prompt):
+        self.remove(prompt['id'])
+        self.add(prompt)
+
+    def reorder(self, prompt):
+        """Move a prompt whose usageCount changed to its new rank"""
+        key = rank_key(prompt)
+        old = self._rank_keys.get(prompt['id'])
+        if old is None or old == key:
+            return
+        del self._ranked[bisect_left(self._ranked, old)]
+        self._rank_keys[prompt['id']] = key
+        insort(self._ranked, key)
+
+    def _forget_token(self, token):
+        self._vocab.discard(token)
+        for gram in grams(token):
+            tokens = self._grams.get(gram)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._grams[gram]
+
+    def _tokens_containing(self, part):
+        """Vocabulary tokens that contain `part` as a substring"""
+        if len(part) <= GRAM_SIZE:
+            return self._grams.get(part, set())
+        parts = sorted((self._grams.get(part[i:i + GRAM_SIZE], set())
+                        for i in range(len(part) - GRAM_SIZE + 1)), key=len)
+        candidates = set(parts[0])
+        for tokens in parts[1:]:
+            candidates &= tokens
+            if not candidates:
+                break
+        return {t for t in candidates if part in t}
+
+    def _candidates(self, field, parts):
+        """Ids of prompts with a `field` token containing the rarest query part.
+
+        None if no part is narrow enough to collect (see COLLECT_TOKENS). The
+        other parts (and the query as a whole) are left to the caller.
+        """
+        postings = self._postings[field]
+        best = None
+        for part in parts:
+            tokens = self._tokens_containing(part)
+            if len(tokens) > COLLECT_TOKENS:
+                continue
+            size = 0
+            for token in tokens:
+                size += len(postings.get(token, ()))
+                if size > COLLECT_LIMIT:
+                    break
+            if size <= COLLECT_LIMIT and (best is None or size < best[0]):
+                best = (size, tokens)
+        if best is None:
+            return None
+        ids = set()
+        for token in best[1]:
+            ids |= postings.get(token, set())
+        return ids
+
+    def _field_search(self, field, query, exact, ids, limit, exclude):
+        """Ranked ids of up to `limit` prompts whose `field` contains `query`, and their total.
+
+        `ids` are the field's candidates from _candidates (None to check
+        every prompt). The total is None when the search stopped at `limit`
+        before counting every match.
+        """
+        docs = self._docs
+        position = 0 if field == 'name' else 1
+        if ids is not None and len(ids) <= SORT_LIMIT:
+            if not exact:
+                ids = {i for i in ids if query in docs[i][position]}
+            ids -= exclude
+            return heapq.nsmallest(limit, ids, key=self._rank_keys.__getitem__), len(ids)
+
+        found = []
+        for _, _, prompt_id in self._ranked:
+            if ids is not None and prompt_id not in ids:
+                continue
+            if (ids is None or not exact) and query not in docs[prompt_id][position]:
+                continue
+            if prompt_id not in exclude:
+                found.append(prompt_id)
+                if len(found) == limit:
+                    return found, None
+        return found, len(found)
+
+    def _scan(self, query, limit):
+        """search() for a query too common to collect in either field.
+
+        One walk of the ranked order checks both strings, so a query that
+        turns out to match few prompts reads each of them only once.
+        """
+        docs = self._docs
+        names, texts = [], []
+        for _, _, prompt_id in self._ranked:
+            doc = docs[prompt_id]
+            if query in doc[0]:
+                names.append(prompt_id)
+                if len(names) == limit:
+                    return names, [], None, None
+            elif len(texts) < limit and query in doc[1]:
+                texts.append(prompt_id)
+        text_total = len(texts) if len(texts) < limit else None
+        return names, texts[:limit - len(names)], len(names), text_total
+
+    def search(self, query, limit=50, within=None):
+        """The best ranked prompts whose name contains `query`, then those whose text does.
+
+        Returns (name ids, text ids, name total, text total) with at most
+        `limit` ids in all. A total is None if the search stopped before
+        counting every match. ``within`` restricts the search to those
+        prompt ids (e.g. one folder's).
+        """
+        query = query.lower()
+        if not query or limit <= 0:
+            return [], [], 0, 0
+        if within is not None:
+            name_ids = {i for i in within if query in self._docs[i][0]}
+            text_ids = {i for i in within if i not in name_ids and query in self._docs[i][1]}
+            rank = self._rank_keys.__getitem__
+            return (heapq.nsmallest(limit, name_ids, key=rank),
+                    heapq.nsmallest(max(limit - len(name_ids), 0), text_ids, key=rank),
+                    len(name_ids), len(text_ids))
+
+        parts = TOKEN_RE.findall(query)
+        if not parts:
+            # Only punctuation or spaces (e.g. '{{'), which no token holds
+            return self._scan(query, limit)
+        # A query that is a single word can only occur inside one token, so
+        # its candidates need no substring check
+        exact = len(parts) == 1 and parts[0] == query
+        name_candidates = self._candidates('name', parts)
+        text_candidates = None
+        if name_candidates is None:
+            text_candidates = self._candidates('text', parts)
+            if text_candidates is None:
+                return self._scan(query, limit)
+
+        name_ids, name_total = self._field_search('name', query, exact, name_candidates, limit, set())
+        if len(name_ids) == limit:
+            return name_ids, [], name_total, None
+        # Fewer than `limit` name matches means all of them were returned
+        if name_candidates is not None:
+            text_candidates = self._candidates('text', parts)
+        text_ids, text_total = self._field_search('text', query, exact, text_candidates,
+                                                  limit - len(name_ids), set(name_ids))
+        return name_ids, text_ids, name_total, text_total
@@ -0,0 +1,110 @@
+import gc
+import io
+import json
+import pickle
+import sys
+from contextlib import contextmanager
+
+# Leads every binary snapshot; JSON documents start with '{' (or whitespace)
+BINARY_MAGIC = b'PRSNAP1\n'
+
+
+class JsonSerializer:
+    """Pretty-printed JSON, readable and diffable but slow for large histories"""
+
+    name = 'json'
+    # Whether an object referenced twice is written once
+    shares_objects = False
+
+    def dumps(self, data):
+        return json.dumps(data, indent=2).encode('utf-8')
+
+    def loads(self, payload):
+        return json.loads(payload)
+
+
+class _DataUnpickler(pickle.Unpickler):
+    # Snapshots only hold dicts, lists, strings and numbers; refusing every
+    # global keeps a tampered file from running code
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Unexpected object in snapshot: {module}.{name}")
+
+
+class BinarySerializer:
+    """Compact binary snapshot: BINARY_MAGIC followed by a pickle.
+
+    Pickle writes length-prefixed strings and memoizes repeated objects, so
+    the field names shared by every prompt and version (the same key
+    objects in memory) are stored once and referenced after that. Both
+    directions run in C; dumping is several times faster than indented JSON,
+    which shortens every write-behind flush. Protocol 4 reads the same on
+    every Python 3.4+.
+    """
+
+    name = 'binary'
+    shares_objects = True
+
+    def dumps(self, data):
+        return BINARY_MAGIC + pickle.dumps(data, protocol=4)
+
+    def loads(self, payload):
+        stream = io.BytesIO(payload)
+        stream.seek(len(BINARY_MAGIC))
+        return _DataUnpickler(stream).load()
+
+
+SERIALIZERS = {s.name: s for s in (JsonSerializer(), BinarySerializer())}
+
+
+def make_serializer(name):
+    """The serializer for a PROMPT_SNAPSHOT_FORMAT value"""
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown snapshot format: {name}") from None
+
+
+def detect(payload):
+    """The serializer that wrote `payload`"""
+    if payload.startswith(BINARY_MAGIC):
+        return SERIALIZERS['binary']
+    return SERIALIZERS['json']
+
+
+@contextmanager
+def gc_paused():
+    """Pause the cyclic GC while building many containers that aren't garbage"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def loads(payload):
+    """Parse a snapshot in whichever format it was written"""
+    # Parsing allocates a container per prompt and version; collections
+    # triggered meanwhile would otherwise double the load time
+    with gc_paused():
+        return detect(payload).loads(payload)
+
+
+def export_json(source, out):
+    """Write a snapshot of either format to `out` as indented JSON"""
+    with open(source, 'rb') as f:
+        data = loads(f.read())
+    json.dump(data, out, indent=2)
+    out.write('\n')
+
+
+if __name__ == '__main__':
+    # python serializers.py config.json [out.json]: inspect a binary snapshot
+    if len(sys.argv) < 2:
+        sys.exit('usage: serializers.py SNAPSHOT [OUT.json]')
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w') as out:
+            export_json(sys.argv[1], out)
+    else:
+        export_json(sys.argv[1], sys.stdout)
@@ -0,0 +1,75 @@
+"""Settings shared by app.py and dapp.py, read from PROMPT_* environment variables"""
+import os
+from pathlib import Path
+
+from events import EventHub
+from metrics import instrument
+from profiling import enable_profiling
+from repository import Repository
+from usage import UsageCounter
+
+DOCUMENTS_DIR = Path.home() / 'Documents' / 'PromptData'
+DOCUMENTS_DIR.mkdir(parents=True, exist_ok=True)
+DATA_FILE = DOCUMENTS_DIR / 'config.json'
+COOLDOWN_MINUTES = 3
+
+# Seconds without changes before the write-behind flush, or set
+# PROMPT_SYNC_WRITES=1 to write config.json before every response
+FLUSH_INTERVAL = float(os.environ.get('PROMPT_FLUSH_INTERVAL', '1.0'))
+SYNC_WRITES = os.environ.get('PROMPT_SYNC_WRITES', '0') == '1'
+
+# 'snapshot' rewrites config.json on every flush; 'journal' appends each
+# mutation to config.journal and rebuilds config.json once the journal
+# grows past JOURNAL_COMPACT_BYTES; 'sqlite' writes only the changed rows
+# to config.sqlite3 (migrating config.json on first start); 'shared' is
+# snapshot mode for several worker processes serving one config.json
+# (each write locks the file and goes to disk before the response)
+STORAGE_MODE = os.environ.get('PROMPT_STORAGE_MODE', 'snapshot')
+JOURNAL_COMPACT_BYTES = int(os.environ.get('PROMPT_JOURNAL_COMPACT_BYTES', str(4 * 1024 * 1024)))
+# Snapshot file format: 'json' (readable and editable by hand) or 'binary'
+# (compact, several times faster to write and read). Either is detected on
+# load and rewritten in this format on the next save, so opting in to
+# 'binary' converts config.json; `python serializers.py config.json`
+# prints a binary snapshot as JSON
+SNAPSHOT_FORMAT = os.environ.get('PROMPT_SNAPSHOT_FORMAT', 'json')
+
+# Open /api/events streams allowed at once; each one holds a server thread
+EVENT_MAX_CLIENTS = int(os.environ.get('PROMPT_EVENT_MAX_CLIENTS', '8'))
+
+# Counted copies are buffered in memory and written this often (or once
+# COPY_FLUSH_BATCH of them are waiting), and on shutdown
+COPY_FLUSH_INTERVAL = float(os.environ.get('PROMPT_COPY_FLUSH_INTERVAL', '5.0'))
+COPY_FLUSH_BATCH = int(os.environ.get('PROMPT_COPY_FLUSH_BATCH', '1000'))
+
+# PROMPT_METRICS=1 times every request and serves Prometheus metrics on
+# /metrics; PROMPT_METRICS_LOG=1 also prints one JSON line per request
+METRICS = os.environ.get('PROMPT_METRICS', '0') == '1'
+METRICS_LOG = os.environ.get('PROMPT_METRICS_LOG', '0') == '1'
+
+# PROMPT_PROFILING=1 lets a request ask to run under cProfile (X-Profile: 1
+# header or ?profile=1); profiles are saved next to DATA_FILE and listed
+# on /api/profiles
+PROFILING = os.environ.get('PROMPT_PROFILING', '0') == '1'
+PROFILE_DIR = DOCUMENTS_DIR / 'profiles'
+PROFILE_KEEP = int(os.environ.get('PROMPT_PROFILE_KEEP', '50'))
+
+
+def open_repository(seed=None):
+    """The repository of DATA_FILE with its event hub and copy counter, as configured above"""
+    repo = Repository(DATA_FILE, seed=seed,
+                      flush_interval=FLUSH_INTERVAL, sync_writes=SYNC_WRITES,
+                      storage_mode=STORAGE_MODE, compact_bytes=JOURNAL_COMPACT_BYTES,
+                      snapshot_format=SNAPSHOT_FORMAT)
+    events = EventHub(repo, max_clients=EVENT_MAX_CLIENTS)
+    # Created after the repository, so its atexit flush runs before the repository closes
+    usage = UsageCounter(repo, cooldown_ms=COOLDOWN_MINUTES * 60 * 1000,
+                         flush_interval=COPY_FLUSH_INTERVAL, max_pending=COPY_FLUSH_BATCH)
+    return repo, events, usage
+
+
+def enable_diagnostics(app, repo):
+    """Turn on the metrics and profiling hooks PROMPT_METRICS / PROMPT_PROFILING ask for"""
+    if METRICS:
+        instrument(app, repo, log_requests=METRICS_LOG)
+    if PROFILING:
+        enable_profiling(app, PROFILE_DIR, keep=PROFILE_KEEP)
@@ -0,0 +1,90 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+from storage import SnapshotStorage
+
+
+def file_stamp(stat):
+    """What identifies one version of the file: every write renames a new inode into place"""
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class SharedStorage(SnapshotStorage):
+    """config.json shared by several server processes on one machine.
+
+    Writers take an exclusive advisory lock (flock on config.lock) for the
+    whole transaction: the repository first reloads the file if another
+    process replaced it, applies the change and writes the snapshot through
+    a temp file and rename before the lock is released. So each process's
+    read-modify-write sees the latest data, and nothing is lost between
+    processes.
+
+    Readers take no lock. A rename swaps the whole file at once, so a reader
+    always opens a complete version, and the in-memory repository is its
+    parsed cache: ``is_stale`` compares the file's inode, mtime and size
+    with those of the version this process last read or wrote, which costs
+    one stat() per request.
+    """
+
+    def __init__(self, path, serializer=None):
+        super().__init__(path, serializer)
+        self.lock_path = path.with_suffix('.lock')
+        self._lock_file = None
+        # flock is held per open file, so threads of one process share it;
+        # this counts the nested holders within the process
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        # file_stamp of the version in memory, None when there was no file
+        self._stamp = None
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                # fstat describes the file that was opened, even if it is
+                # replaced while being read
+                stamp = file_stamp(os.fstat(f.fileno()))
+                payload = f.read()
+        except FileNotFoundError:
+            self._stamp = None
+            return None
+        self._stamp = stamp
+        return self._parse(payload)
+
+    def is_stale(self):
+        """Whether another process replaced the file since this one read or wrote it"""
+        try:
+            stamp = file_stamp(os.stat(self.path))
+        except FileNotFoundError:
+            stamp = None
+        return stamp != self._stamp
+
+    @contextmanager
+    def locked(self):
+        """Hold the exclusive lock on the shared file (reentrant)"""
+        with self._thread_lock:
+            if self._depth == 0:
+                if self._lock_file is None:
+                    self._lock_file = open(self.lock_path, 'a')
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def flush(self, repo):
+        with self.locked():
+            written = self._changed
+            super().flush(repo)
+            if written:
+                # Nobody else writes while the lock is held, so this is ours
+                self._stamp = file_stamp(os.stat(self.path))
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
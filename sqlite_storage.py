@@ -0,0 +1,337 @@
+import json
+import sqlite3
+import sys
+import time
+from contextlib import closing, nullcontext
+from pathlib import Path
+
+from blobs import BLOB_MIN_CHARS, pack_item, text_hash, unpack_item
+from journal import Journal
+from migrations import SCHEMA_VERSION
+from storage import IOStats, read_document
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS folders (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    ord REAL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent_id);
+CREATE INDEX IF NOT EXISTS folders_parent_order ON folders (parent_id, ord);
+
+CREATE TABLE IF NOT EXISTS prompts (
+    id TEXT PRIMARY KEY,
+    folder_id TEXT,
+    ord REAL,
+    body TEXT NOT NULL,
+    text_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS prompts_folder ON prompts (folder_id);
+CREATE INDEX IF NOT EXISTS prompts_folder_order ON prompts (folder_id, ord);
+
+CREATE TABLE IF NOT EXISTS versions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt_id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    text_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS versions_prompt ON versions (prompt_id, seq);
+
+-- Texts of prompts and versions, stored once (see blobs.py)
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+# Created once databases from before text_hash have the column
+TEXT_HASH_INDEXES = '''
+CREATE INDEX IF NOT EXISTS prompts_text_hash ON prompts (text_hash);
+CREATE INDEX IF NOT EXISTS versions_text_hash ON versions (text_hash);
+'''
+
+
+def dumps(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def _referencer(blobs):
+    """A pack_item reference that collects the texts it replaces in `blobs` (hash -> text)"""
+    def reference(text):
+        if len(text) < BLOB_MIN_CHARS:
+            return None
+        digest = text_hash(text)
+        blobs[digest] = text
+        return digest
+    return reference
+
+
+def folder_row(folder):
+    return (folder['id'], folder.get('parentId'), folder.get('order'), dumps(folder))
+
+
+def prompt_row(prompt, blobs):
+    body = pack_item({k: v for k, v in prompt.items() if k != 'versions'}, _referencer(blobs))
+    return (prompt['id'], prompt.get('folderId'), prompt.get('order'), body.get('textHash'), dumps(body))
+
+
+def version_row(prompt_id, version, blobs):
+    body = pack_item(version, _referencer(blobs))
+    return (prompt_id, body.get('textHash'), dumps(body))
+
+
+class SqliteStorage:
+    """Stores prompts, versions and folders as rows in a SQLite database.
+
+    Only the rows touched by a flush are written: staged records are reduced
+    to the set of changed prompts and folders plus appended versions, and
+    written in one SQLite transaction. Folders and prompts are indexed on
+    their container and (container, order), versions on their prompt.
+
+    Texts of at least blobs.BLOB_MIN_CHARS are stored once in the blobs
+    table and referenced by the ``text_hash`` of prompt and version rows. A
+    flush that replaces or deletes rows drops the blobs nothing refers to
+    any more.
+    """
+
+    needs_rewrite = False
+
+    def __init__(self, path, json_path=None):
+        self.path = Path(path)
+        self.json_path = Path(json_path) if json_path else None
+        # Only used at startup and under the repository write lock
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._add_text_hash_columns()
+        self.io = IOStats()
+        self._touched = set()
+        # (prompt id, text hash, body) of appended versions, or (prompt id,
+        # None, None) before the full history of a (re)inserted prompt
+        self._new_versions = []
+        # hash -> text of the texts the staged versions refer to
+        self._new_blobs = {}
+
+    def _add_text_hash_columns(self):
+        with self.conn:
+            for table in ('prompts', 'versions'):
+                columns = {row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')}
+                if 'text_hash' not in columns:
+                    # Existing rows keep their texts inline, which load still reads
+                    self.conn.execute(f'ALTER TABLE {table} ADD COLUMN text_hash TEXT')
+        self.conn.executescript(TEXT_HASH_INDEXES)
+
+    # ------------------ Loading ------------------
+    def is_empty(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'initialized'").fetchone()
+        return row is None
+
+    def load(self):
+        if self.is_empty():
+            # One-shot migration from the config.json layout
+            data = read_document(self.json_path) if self.json_path else None
+            if data is not None:
+                print(f"Migrating {self.json_path} into {self.path}")
+                self.needs_rewrite = True
+            else:
+                # Stamped like write_document, or the next start would migrate it
+                with self.conn:
+                    self.conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                          [('initialized', '1'), ('schemaVersion', str(SCHEMA_VERSION))])
+            return data
+
+        started = time.perf_counter()
+        size = 0
+        blobs = {}
+        for digest, text in self.conn.execute('SELECT hash, text FROM blobs'):
+            size += len(text)
+            blobs[digest] = text
+
+        versions = {}
+        for prompt_id, body in self.conn.execute('SELECT prompt_id, body FROM versions ORDER BY seq'):
+            size += len(body)
+            versions.setdefault(prompt_id, []).append(unpack_item(json.loads(body), blobs))
+
+        prompts = []
+        for prompt_id, body in self.conn.execute('SELECT id, body FROM prompts ORDER BY rowid'):
+            size += len(body)
+            prompt = unpack_item(json.loads(body), blobs)
+            prompt['versions'] = versions.get(prompt_id, [])
+            prompts.append(prompt)
+
+        folders = []
+        for (body,) in self.conn.execute('SELECT body FROM folders ORDER BY rowid'):
+            size += len(body)
+            folders.append(json.loads(body))
+        # Reading rows and parsing them interleave, so both count as parsing
+        self.io.record_read(size, time.perf_counter() - started)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schemaVersion'").fetchone()
+        data = {'prompts': prompts, 'folders': folders}
+        if row is not None:
+            data['schemaVersion'] = int(row[0])
+        return data
+
+    def backup(self, label):
+        """Copy the database aside (as NAME.<label>.bak); returns the copies"""
+        if self.is_empty():
+            # Migrating from config.json, which is left untouched
+            return []
+        target = self.path.with_name(f'{self.path.name}.{label}.bak')
+        with closing(sqlite3.connect(str(target))) as copy:
+            self.conn.backup(copy)
+        return [target]
+
+    def replay(self, after_seq):
+        # When migrating, include mutations journaled after the snapshot
+        if self.needs_rewrite:
+            return Journal(self.json_path.with_suffix('.journal')).replay(after_seq)
+        return ()
+
+    # ------------------ Writing ------------------
+    def stage(self, records):
+        inserted = set()
+        for record in records:
+            if record['op'] == 'ver':
+                # A prompt inserted in the same batch already carries its versions
+                if record['id'] not in inserted:
+                    self._new_versions.append(version_row(record['id'], record['version'], self._new_blobs))
+                continue
+
+            item_id = record['item']['id'] if record['op'] == 'put' else record['id']
+            if record['op'] == 'put' and record['kind'] == 'prompt':
+                inserted.add(item_id)
+                self._new_versions.append((item_id, None, None))
+                self._new_versions.extend(version_row(item_id, v, self._new_blobs)
+                                          for v in record['item']['versions'])
+            self._touched.add((record['kind'], item_id))
+
+    def flush(self, repo):
+        with repo.lock:
+            touched, self._touched = self._touched, set()
+            pending_versions, self._new_versions = self._new_versions, []
+            pending_blobs, self._new_blobs = self._new_blobs, {}
+            blobs = dict(pending_blobs)
+            upserts = {'prompt': [], 'folder': []}
+            deletes = {'prompt': [], 'folder': []}
+            for kind, item_id in touched:
+                item = repo.get(kind, item_id)
+                if item is None:
+                    deletes[kind].append((item_id,))
+                elif kind == 'prompt':
+                    upserts[kind].append(prompt_row(item, blobs))
+                else:
+                    upserts[kind].append(folder_row(item))
+            deleted = {item_id for (item_id,) in deletes['prompt']}
+            new_versions = [v for v in pending_versions if v[0] not in deleted]
+
+        try:
+            started = time.perf_counter()
+            with self.conn:
+                self._write_rows(upserts, deletes, new_versions, blobs)
+            size = (sum(len(row[-1]) for rows in upserts.values() for row in rows) +
+                    sum(len(body) for _, _, body in new_versions if body is not None))
+            self.io.record_write(size, 0.0, time.perf_counter() - started)
+        except sqlite3.Error:
+            with repo.lock:
+                self._touched |= touched
+                self._new_versions[:0] = pending_versions
+                self._new_blobs.update(pending_blobs)
+            raise
+
+    def _write_rows(self, upserts, deletes, new_versions, blobs):
+        # Texts the replaced and deleted rows referred to, dropped below if
+        # nothing else does
+        released = set()
+        for row in upserts['prompt']:
+            released.update(h for (h,) in self.conn.execute(
+                'SELECT text_hash FROM prompts WHERE id = ?', (row[0],)))
+        for (prompt_id,) in deletes['prompt']:
+            released.update(h for (h,) in self.conn.execute(
+                'SELECT text_hash FROM prompts WHERE id = ? UNION '
+                'SELECT text_hash FROM versions WHERE prompt_id = ?', (prompt_id, prompt_id)))
+        for prompt_id, _, body in new_versions:
+            if body is None:
+                released.update(h for (h,) in self.conn.execute(
+                    'SELECT text_hash FROM versions WHERE prompt_id = ?', (prompt_id,)))
+
+        self.conn.executemany('INSERT OR IGNORE INTO blobs (hash, text) VALUES (?, ?)', blobs.items())
+        self.conn.executemany(
+            'INSERT INTO prompts (id, folder_id, ord, text_hash, body) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET folder_id = excluded.folder_id, '
+            'ord = excluded.ord, text_hash = excluded.text_hash, body = excluded.body', upserts['prompt'])
+        self.conn.executemany(
+            'INSERT INTO folders (id, parent_id, ord, body) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET parent_id = excluded.parent_id, '
+            'ord = excluded.ord, body = excluded.body', upserts['folder'])
+        self.conn.executemany('DELETE FROM prompts WHERE id = ?', deletes['prompt'])
+        self.conn.executemany('DELETE FROM versions WHERE prompt_id = ?', deletes['prompt'])
+        self.conn.executemany('DELETE FROM folders WHERE id = ?', deletes['folder'])
+        for prompt_id, digest, body in new_versions:
+            if body is None:
+                # (Re)inserted prompt: its full history follows
+                self.conn.execute('DELETE FROM versions WHERE prompt_id = ?', (prompt_id,))
+            else:
+                self.conn.execute('INSERT INTO versions (prompt_id, text_hash, body) VALUES (?, ?, ?)',
+                                  (prompt_id, digest, body))
+        released.discard(None)
+        self.conn.executemany(
+            'DELETE FROM blobs WHERE hash = ? '
+            'AND NOT EXISTS (SELECT 1 FROM prompts WHERE text_hash = ?) '
+            'AND NOT EXISTS (SELECT 1 FROM versions WHERE text_hash = ?)',
+            [(h, h, h) for h in released])
+
+    def save_all(self, repo):
+        """Replace every row with the repository's current contents"""
+        with repo.lock:
+            self._touched = set()
+            self._new_versions = []
+            self._new_blobs = {}
+            data = repo.document()
+            blobs = {}
+            folders = [folder_row(f) for f in data['folders']]
+            prompts = [prompt_row(p, blobs) for p in data['prompts']]
+            versions = [version_row(p['id'], v, blobs) for p in data['prompts'] for v in p['versions']]
+        write_document(self.conn, folders, prompts, versions, blobs)
+
+    def is_stale(self):
+        return False
+
+    def locked(self):
+        return nullcontext()
+
+    def needs_compaction(self):
+        return False
+
+    def close(self):
+        self.conn.close()
+
+
+def write_document(conn, folders, prompts, versions, blobs):
+    with conn:
+        conn.execute('DELETE FROM folders')
+        conn.execute('DELETE FROM prompts')
+        conn.execute('DELETE FROM versions')
+        conn.execute('DELETE FROM blobs')
+        conn.executemany('INSERT INTO blobs (hash, text) VALUES (?, ?)', blobs.items())
+        conn.executemany('INSERT INTO folders (id, parent_id, ord, body) VALUES (?, ?, ?, ?)', folders)
+        conn.executemany('INSERT INTO prompts (id, folder_id, ord, text_hash, body) VALUES (?, ?, ?, ?, ?)',
+                         prompts)
+        conn.executemany('INSERT INTO versions (prompt_id, text_hash, body) VALUES (?, ?, ?)', versions)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('initialized', '1')")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schemaVersion', ?)",
+                     (str(SCHEMA_VERSION),))
+
+
+if __name__ == '__main__':
+    # python sqlite_storage.py [config.json]: migrate without starting the app
+    from repository import Repository
+
+    json_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path.home() / 'Documents' / 'PromptData' / 'config.json'
+    repo = Repository(json_path, storage_mode='sqlite', sync_writes=True)
+    repo.close()
+    print(f"{len(repo.prompts)} prompts and {len(repo.folders)} folders in {repo.storage.path}")
@@ -0,0 +1,151 @@
+def prompt_contribution(prompt):
+    """(folder id, usage count, last modified) a prompt adds to its folders"""
+    versions = prompt.get('versions')
+    modified = versions[-1].get('timestamp', 0) if versions else 0
+    return prompt.get('folderId'), prompt.get('usageCount', 0), modified
+
+
+class FolderStats:
+    """Per-folder aggregates kept up to date as prompts and folders change.
+
+    For every folder: ``promptCount`` (prompts directly in it),
+    ``totalPrompts`` and ``usageCount`` (summed over the whole subtree) and
+    ``lastModified`` (newest version timestamp in the subtree). A prompt
+    change adjusts the folders on its ancestor path, a folder move moves its
+    totals from the old path to the new one, so each mutation costs
+    O(depth). Only when the newest prompt of a subtree leaves it is
+    ``lastModified`` recomputed, from the direct prompts and child folders
+    of each folder on the path.
+
+    The repository calls the hooks after updating its tree (and before, for
+    removals), the same way it maintains FolderTree.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        # folder id -> aggregates
+        self._stats = {}
+        # prompt id -> prompt_contribution() it is counted with
+        self._prompts = {}
+        # folder id -> parent id its totals are counted under
+        self._parents = {}
+
+    def rebuild(self):
+        self.__init__(self.repo)
+        for folder in self.repo.folders.values():
+            self._stats[folder['id']] = self._empty()
+            self._parents[folder['id']] = folder.get('parentId')
+        for prompt in self.repo.prompts.values():
+            self.add_prompt(prompt)
+
+    def get(self, folder_id):
+        stats = self._stats.get(folder_id)
+        return dict(stats) if stats is not None else None
+
+    def all(self):
+        return {folder_id: dict(stats) for folder_id, stats in self._stats.items()}
+
+    # ------------------ Prompts ------------------
+    def add_prompt(self, prompt):
+        contribution = prompt_contribution(prompt)
+        self._prompts[prompt['id']] = contribution
+        folder_id, usage, modified = contribution
+        if folder_id in self._stats:
+            self._stats[folder_id]['promptCount'] += 1
+        self._add(self._chain(folder_id), 1, usage, modified)
+
+    def remove_prompt(self, prompt_id):
+        folder_id, usage, modified = self._prompts.pop(prompt_id)
+        if folder_id in self._stats:
+            self._stats[folder_id]['promptCount'] -= 1
+        self._subtract(self._chain(folder_id), 1, usage, modified)
+
+    def update_prompt(self, prompt):
+        old = self._prompts[prompt['id']]
+        new = prompt_contribution(prompt)
+        if old == new:
+            return
+        if old[0] != new[0] or new[2] < old[2]:
+            self.remove_prompt(prompt['id'])
+            self.add_prompt(prompt)
+            return
+        # Same folder and no older: a usage delta and a newer timestamp
+        self._prompts[prompt['id']] = new
+        self._add(self._chain(new[0]), 0, new[1] - old[1], new[2])
+
+    # ------------------ Folders ------------------
+    def add_folder(self, folder):
+        folder_id = folder['id']
+        stats = self._empty()
+        self._stats[folder_id] = stats
+        self._parents[folder_id] = folder.get('parentId')
+        # A re-added folder (e.g. on rollback) may still have contents
+        for kind, item in self.repo.container_items(folder_id):
+            if kind == 'prompt':
+                _, usage, modified = self._prompts[item['id']]
+                stats['promptCount'] += 1
+                stats['totalPrompts'] += 1
+                stats['usageCount'] += usage
+                stats['lastModified'] = max(stats['lastModified'], modified)
+            elif item['id'] in self._stats:
+                child = self._stats[item['id']]
+                stats['totalPrompts'] += child['totalPrompts']
+                stats['usageCount'] += child['usageCount']
+                stats['lastModified'] = max(stats['lastModified'], child['lastModified'])
+        self._add(self._chain(folder.get('parentId')), stats['totalPrompts'],
+                  stats['usageCount'], stats['lastModified'])
+
+    def remove_folder(self, folder_id):
+        stats = self._stats.pop(folder_id)
+        parent_id = self._parents.pop(folder_id)
+        self._subtract(self._chain(parent_id), stats['totalPrompts'],
+                       stats['usageCount'], stats['lastModified'])
+
+    def update_folder(self, folder):
+        folder_id = folder['id']
+        old_parent, new_parent = self._parents[folder_id], folder.get('parentId')
+        if old_parent == new_parent:
+            return
+        stats = self._stats[folder_id]
+        totals = stats['totalPrompts'], stats['usageCount'], stats['lastModified']
+        self._subtract(self._chain(old_parent), *totals)
+        self._parents[folder_id] = new_parent
+        self._add(self._chain(new_parent), *totals)
+
+    # ------------------ Internals ------------------
+    @staticmethod
+    def _empty():
+        return {'promptCount': 0, 'totalPrompts': 0, 'usageCount': 0, 'lastModified': 0}
+
+    def _chain(self, folder_id):
+        """Folders whose subtree contains `folder_id`, root first"""
+        if folder_id not in self._stats:
+            return ()
+        return self.repo.tree.path(folder_id) + (folder_id,)
+
+    def _add(self, chain, prompts, usage, modified):
+        for folder_id in chain:
+            stats = self._stats[folder_id]
+            stats['totalPrompts'] += prompts
+            stats['usageCount'] += usage
+            if modified > stats['lastModified']:
+                stats['lastModified'] = modified
+
+    def _subtract(self, chain, prompts, usage, modified):
+        # Deepest first, so a recomputed lastModified sees updated children
+        for folder_id in reversed(chain):
+            stats = self._stats[folder_id]
+            stats['totalPrompts'] -= prompts
+            stats['usageCount'] -= usage
+            if modified and modified >= stats['lastModified']:
+                stats['lastModified'] = self._newest(folder_id)
+
+    def _newest(self, folder_id):
+        newest = 0
+        for kind, item in self.repo.container_items(folder_id):
+            # The prompt being re-counted by update_prompt has no entry yet
+            source = self._prompts if kind == 'prompt' else self._stats
+            entry = source.get(item['id'])
+            if entry is not None:
+                newest = max(newest, entry[2] if kind == 'prompt' else entry['lastModified'])
+        return newest
@@ -0,0 +1,230 @@
+import json
+import os
+import pickle
+import shutil
+import time
+from contextlib import nullcontext
+
+import serializers
+from blobs import BlobWriter, pack_document, unpack_document
+from journal import Journal
+
+
+def read_document(path):
+    """Read a JSON or binary snapshot, returning None if it is missing or corrupted"""
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return parse_document(f.read())
+    return None
+
+
+def parse_document(payload):
+    """Parse a snapshot read from disk, returning None if it is corrupted"""
+    try:
+        data = serializers.loads(payload)
+    except (ValueError, pickle.UnpicklingError, EOFError):
+        # json.JSONDecodeError and UnicodeDecodeError are ValueErrors
+        return None
+    return unpack_document(data)
+
+
+def write_file_atomic(path, payload):
+    """Write to a temp file and rename so a crash never leaves a half-written file"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb' if isinstance(payload, bytes) else 'w') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class IOStats:
+    """Running totals of a storage's reads and writes, exported on /metrics"""
+
+    def __init__(self):
+        self.reads = 0
+        self.bytes_read = 0
+        self.parse_seconds = 0.0
+        self.writes = 0
+        self.bytes_written = 0
+        self.serialize_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def record_read(self, size, parse_seconds):
+        self.reads += 1
+        self.bytes_read += size
+        self.parse_seconds += parse_seconds
+
+    def record_write(self, size, serialize_seconds, write_seconds):
+        self.writes += 1
+        self.bytes_written += size
+        self.serialize_seconds += serialize_seconds
+        self.write_seconds += write_seconds
+
+
+class SnapshotStorage:
+    """Rewrites the whole config.json on every flush.
+
+    Snapshots are written with `serializer` (indented JSON or the binary
+    format from serializers.py); loading detects either. A JSON snapshot
+    stores a text held by several prompts or versions once, in its
+    ``blobs`` map (see blobs.pack_document).
+
+    All storages share this interface: ``load`` returns the stored document
+    (or None), ``replay`` yields mutation records newer than the document,
+    ``stage`` receives committed records with the repository lock held and
+    ``flush``/``save_all`` persist them with the repository write lock held.
+    ``locked`` is held around every transaction and ``is_stale`` tells the
+    repository to reload; both only matter for SharedStorage.
+    """
+
+    needs_rewrite = False
+
+    def __init__(self, path, serializer=None):
+        self.path = path
+        # Format snapshots are written in; either format is read
+        self.serializer = serializer or serializers.SERIALIZERS['json']
+        self.journal = Journal(path.with_suffix('.journal'))
+        self.io = IOStats()
+        self._changed = False
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            return self._parse(f.read())
+
+    def _parse(self, payload):
+        started = time.perf_counter()
+        data = parse_document(payload)
+        self.io.record_read(len(payload), time.perf_counter() - started)
+        return data
+
+    def _write_snapshot(self, document):
+        started = time.perf_counter()
+        if not self.serializer.shares_objects:
+            # Pickle already writes a text held twice once
+            document = pack_document(document)
+        payload = self.serializer.dumps(document)
+        serialized = time.perf_counter()
+        write_file_atomic(self.path, payload)
+        self.io.record_write(len(payload), serialized - started, time.perf_counter() - serialized)
+
+    def replay(self, after_seq):
+        for record in self.journal.replay(after_seq):
+            # A journal left behind by journal mode is folded into the snapshot
+            self.needs_rewrite = True
+            yield record
+
+    def stage(self, records):
+        self._changed = True
+
+    def flush(self, repo):
+        with repo.lock:
+            if not self._changed:
+                return
+            document = repo.snapshot()
+            self._changed = False
+        try:
+            self._write_snapshot(document)
+            self.journal.remove()
+        except OSError:
+            self._changed = True
+            raise
+
+    def save_all(self, repo):
+        self.stage(None)
+        self.flush(repo)
+
+    def backup(self, label):
+        """Copy the stored files aside (as NAME.<label>.bak); returns the copies"""
+        copies = []
+        for source in (self.path, self.journal.path):
+            if source.exists():
+                target = source.with_name(f'{source.name}.{label}.bak')
+                shutil.copy2(source, target)
+                copies.append(target)
+        return copies
+
+    def needs_compaction(self):
+        return False
+
+    def is_stale(self):
+        """Whether another process changed the stored data (see SharedStorage)"""
+        return False
+
+    def locked(self):
+        """Context held around each transaction; only SharedStorage locks anything"""
+        return nullcontext()
+
+    def close(self):
+        pass
+
+
+class JournalStorage(SnapshotStorage):
+    """Appends each mutation to config.journal; config.json is a snapshot.
+
+    The snapshot remembers the last sequence number it contains and is
+    rebuilt (and the journal truncated) once the journal grows past
+    ``compact_bytes``.
+    """
+
+    def __init__(self, path, compact_bytes=4 * 1024 * 1024, serializer=None):
+        super().__init__(path, serializer)
+        self.compact_bytes = compact_bytes
+        self._lines = []
+        # Texts go into the journal once and are referenced by hash after
+        self._blobs = BlobWriter()
+
+    def replay(self, after_seq):
+        return self.journal.replay(after_seq)
+
+    def stage(self, records):
+        # Serialize now: the records reference live dicts that later
+        # requests keep mutating
+        started = time.perf_counter()
+        self._lines.extend(json.dumps(packed, separators=(',', ':'))
+                           for r in records for packed in self._blobs.pack(r))
+        self.io.serialize_seconds += time.perf_counter() - started
+
+    def flush(self, repo):
+        with repo.lock:
+            lines, self._lines = self._lines, []
+        try:
+            started = time.perf_counter()
+            self.journal.append(lines)
+            if lines:
+                self.io.record_write(sum(len(line) + 1 for line in lines), 0.0,
+                                     time.perf_counter() - started)
+        except OSError:
+            with repo.lock:
+                self._lines[:0] = lines
+            raise
+
+    def save_all(self, repo):
+        with repo.lock:
+            document = repo.snapshot()
+            # Everything staged so far is contained in the snapshot, and
+            # the texts staged from now on go into the truncated journal
+            self._lines = []
+            self._blobs.reset()
+        self._write_snapshot(document)
+        self.journal.truncate()
+
+    def needs_compaction(self):
+        return self.journal.size() > self.compact_bytes
+
+
+def make_storage(mode, path, compact_bytes=4 * 1024 * 1024, snapshot_format='json'):
+    """Create the storage backend for a PROMPT_STORAGE_MODE value"""
+    serializer = serializers.make_serializer(snapshot_format)
+    if mode == 'journal':
+        return JournalStorage(path, compact_bytes=compact_bytes, serializer=serializer)
+    if mode == 'sqlite':
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage(path.with_suffix('.sqlite3'), json_path=path)
+    if mode == 'shared':
+        # Needs fcntl, which Windows lacks
+        from shared_storage import SharedStorage
+        return SharedStorage(path, serializer)
+    return SnapshotStorage(path, serializer)
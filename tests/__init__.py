@@ -0,0 +1,6 @@
+"""Tests for the storage layer.
+
+Run from the project root:
+
+    python -m pytest tests
+"""
@@ -0,0 +1,45 @@
+import time
+
+from repository import Repository
+
+
+def open_repo(path, **options):
+    """A repository of `path` that writes before every transaction returns"""
+    options.setdefault('sync_writes', True)
+    return Repository(path, **options)
+
+
+def add_prompt(repo, name, text, folder_id=None):
+    """Insert a prompt the way the apps do; returns its id"""
+    with repo.transaction():
+        prompt_id = repo.new_id()
+        repo.insert('prompt', {
+            'id': prompt_id,
+            'name': name,
+            'text': text,
+            'folderId': folder_id,
+            'order': repo.append_order(folder_id),
+            'versions': [{'id': f'{prompt_id}-v1', 'name': name, 'text': text,
+                          'timestamp': int(time.time() * 1000), 'version': 1}],
+            'currentVersion': 1,
+            'usageCount': 0
+        })
+    return prompt_id
+
+
+def edit_prompt(repo, prompt_id, text):
+    """Save `text` as a new version of a prompt, as PUT /api/prompts/<id> does"""
+    with repo.transaction():
+        prompt = repo.get_prompt(prompt_id)
+        version = prompt['currentVersion'] + 1
+        repo.add_version(prompt_id, {'id': f'{prompt_id}-v{version}', 'name': prompt['name'],
+                                     'text': text, 'timestamp': int(time.time() * 1000),
+                                     'version': version})
+        repo.update('prompt', prompt_id, text=text, currentVersion=version)
+
+
+def full_history(repo, prompt_id):
+    """Every version of a prompt with its full text, oldest first"""
+    with repo.lock:
+        versions = repo.get_prompt(prompt_id)['versions']
+        return [repo.versions.expand(prompt_id, versions, i) for i in range(len(versions))]
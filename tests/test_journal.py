@@ -0,0 +1,79 @@
+import pytest
+
+from tests.helpers import add_prompt, edit_prompt, full_history, open_repo
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / 'config.json'
+
+
+def contents(repo):
+    with repo.lock:
+        return ({pid: dict(p, versions=full_history(repo, pid)) for pid, p in repo.prompts.items()},
+                dict(repo.folders))
+
+
+def crashed_repo(path):
+    """A journal-mode repository with changes that only the journal holds"""
+    repo = open_repo(path, storage_mode='journal')
+    first = add_prompt(repo, 'Summary', 'Summarize the text below.')
+    second = add_prompt(repo, 'Review', 'Review this code.')
+    for i in range(5):
+        edit_prompt(repo, first, f'Summarize the text below in {i + 2} sentences.')
+    with repo.transaction():
+        repo.delete('prompt', second)
+    # Never closed: nothing but the journal records the changes
+    return repo
+
+
+def test_replay_restores_changes_after_crash(path):
+    repo = crashed_repo(path)
+    assert not path.exists()
+
+    reopened = open_repo(path, storage_mode='journal')
+    try:
+        assert contents(reopened) == contents(repo)
+        (prompt,) = reopened.prompts.values()
+        assert prompt['currentVersion'] == 6
+        assert [v['text'] for v in full_history(reopened, prompt['id'])][-1] == prompt['text']
+    finally:
+        reopened.close()
+        repo.close()
+
+
+def test_replay_skips_torn_final_record(path):
+    repo = crashed_repo(path)
+    journal = path.with_suffix('.journal')
+    with open(journal, 'a') as f:
+        # A crash in the middle of an append
+        f.write('{"seq": 999, "op": "del", "ki')
+
+    reopened = open_repo(path, storage_mode='journal')
+    try:
+        assert contents(reopened) == contents(repo)
+    finally:
+        reopened.close()
+        repo.close()
+
+
+def test_records_in_snapshot_are_not_replayed_twice(path):
+    repo = open_repo(path, storage_mode='journal')
+    prompt_id = add_prompt(repo, 'Summary', 'Summarize the text below.')
+    repo.compact()
+    for i in range(5):
+        edit_prompt(repo, prompt_id, f'Summarize the text below in {i + 2} sentences.')
+    journal = path.with_suffix('.journal')
+    records = journal.read_bytes()
+    repo.compact()
+    assert journal.stat().st_size == 0
+    # A crash after writing the snapshot but before the journal was truncated
+    journal.write_bytes(records)
+
+    reopened = open_repo(path, storage_mode='journal')
+    try:
+        assert contents(reopened) == contents(repo)
+        assert len(reopened.get_prompt(prompt_id)['versions']) == 6
+    finally:
+        reopened.close()
+        repo.close()
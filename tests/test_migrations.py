@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from migrations import SCHEMA_VERSION, migrate
+from storage import read_document
+from tests.helpers import open_repo
+
+# Written by app.js before prompts had ids, versions or folders of their own
+FOLDER_MAP = {'folders': {'Writing': [{'title': 'Outline', 'text': 'Outline this essay.'},
+                                      {'title': 'Proofread', 'text': 'Fix typos only.'}],
+                          'Empty': []}}
+
+# Written by dapp.py before schemaVersion: fields added later are missing
+UNSTAMPED = {'prompts': [{'id': '1', 'name': 'Outline', 'text': 'Outline this essay.'},
+                         {'id': '2', 'name': 'Proofread', 'text': 'Fix typos only.', 'folderId': '9'}],
+             'folders': [{'id': '9', 'name': 'Writing'}]}
+
+
+@pytest.fixture(params=[FOLDER_MAP, UNSTAMPED], ids=['folder-map', 'unstamped'])
+def legacy(request, tmp_path):
+    """config.json holding a version 0 document; returns its path and bytes"""
+    path = tmp_path / 'config.json'
+    payload = json.dumps(request.param, indent=2).encode('utf-8')
+    path.write_bytes(payload)
+    return path, payload
+
+
+@pytest.mark.parametrize('storage_mode', ['snapshot', 'journal'])
+def test_legacy_document_migrates_once_with_backup(legacy, storage_mode):
+    path, payload = legacy
+    backup = path.with_name('config.json.v0.bak')
+
+    repo = open_repo(path, storage_mode=storage_mode)
+    names = sorted(p['name'] for p in repo.prompts.values())
+    repo.close()
+    assert names == ['Outline', 'Proofread']
+    assert backup.read_bytes() == payload
+    stored = read_document(path)
+    assert stored['schemaVersion'] == SCHEMA_VERSION
+    for prompt in stored['prompts']:
+        assert prompt['currentVersion'] == 1
+        assert prompt['versions'][0]['text'] == prompt['text']
+
+    # Upgraded on disk, so the next start neither migrates nor backs up again
+    backup.unlink()
+    rewritten = path.read_bytes()
+    repo = open_repo(path, storage_mode=storage_mode)
+    assert sorted(p['name'] for p in repo.prompts.values()) == names
+    repo.close()
+    assert not backup.exists()
+    assert path.read_bytes() == rewritten
+
+
+def test_read_only_migrates_in_memory_only(legacy):
+    path, payload = legacy
+    repo = open_repo(path, read_only=True, sync_writes=False)
+    try:
+        assert len(repo.prompts) == 2
+    finally:
+        repo.close()
+    assert path.read_bytes() == payload
+    assert not path.with_name('config.json.v0.bak').exists()
+
+
+def test_migrate_backfills_missing_fields():
+    data = migrate(json.loads(json.dumps(UNSTAMPED)))
+    first, second = data['prompts']
+    assert first['folderId'] is None and second['folderId'] == '9'
+    assert [p['order'] for p in data['prompts']] == [0, 1]
+    assert all(p['usageCount'] == 0 for p in data['prompts'])
+    assert data['folders'][0]['parentId'] is None
+
+
+def test_newer_schema_is_refused():
+    with pytest.raises(ValueError):
+        migrate({'schemaVersion': SCHEMA_VERSION + 1, 'prompts': [], 'folders': []})
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from versions import VersionStore, apply_delta, make_delta
+from tests.helpers import add_prompt, edit_prompt, full_history, open_repo
+
+
+def drafts(count, seed=7):
+    """Successive edits of one text: words changed, inserted and removed"""
+    rng = random.Random(seed)
+    words = 'Summarize the following meeting notes as a short list of decisions'.split()
+    texts = []
+    for _ in range(count):
+        position = rng.randrange(len(words) + 1)
+        action = rng.choice(('insert', 'replace', 'remove'))
+        if action == 'insert' or len(words) < 3:
+            words.insert(position, rng.choice(('clearly', 'owners', 'dates', '\n-', 'ä', '')))
+        elif action == 'replace':
+            words[min(position, len(words) - 1)] = f'word{rng.randrange(100)}'
+        else:
+            del words[min(position, len(words) - 1)]
+        texts.append(' '.join(words))
+    return texts
+
+
+def history(texts):
+    return [{'id': f'p-v{n}', 'name': 'p', 'text': text, 'timestamp': n, 'version': n}
+            for n, text in enumerate(texts, 1)]
+
+
+@pytest.mark.parametrize('old, new', [
+    ('', ''), ('', 'added'), ('removed', ''), ('same', 'same'),
+    ('a b c', 'a x c'), ('prefix and tail', 'prefix, middle and tail'),
+])
+def test_apply_delta_rebuilds_new_text(old, new):
+    assert apply_delta(old, make_delta(old, new)) == new
+
+
+@pytest.mark.parametrize('keyframe_interval', [1, 2, 5, 20])
+def test_expand_matches_full_text_at_every_position(keyframe_interval):
+    texts = drafts(45)
+    store = VersionStore(keyframe_interval=keyframe_interval)
+    versions = []
+    for version in history(texts):
+        versions.append(store.encode('p', versions, version))
+    if keyframe_interval > 1:
+        assert any('delta' in v for v in versions)
+
+    # Without a cache every text is rebuilt from its keyframe; the store
+    # that encoded the history answers from its cache where it can
+    for reader in (VersionStore(keyframe_interval=keyframe_interval, cache_size=0), store):
+        for position in reversed(range(len(texts))):
+            expanded = reader.expand('p', versions, position)
+            assert expanded['text'] == texts[position]
+            assert 'delta' not in expanded
+            assert expanded['version'] == position + 1
+
+
+def test_encode_history_matches_full_text_at_every_position():
+    texts = drafts(30)
+    versions = history(texts)
+    store = VersionStore(keyframe_interval=4)
+    assert store.encode_history('p', versions) > 0
+    assert store.encode_history('p', versions) == 0
+
+    cold = VersionStore(keyframe_interval=4)
+    assert [cold.expand('p', versions, i)['text'] for i in range(len(texts))] == texts
+
+
+def test_history_survives_reload(tmp_path):
+    path = tmp_path / 'config.json'
+    texts = drafts(25)
+    repo = open_repo(path, keyframe_interval=4)
+    prompt_id = add_prompt(repo, 'Notes', texts[0])
+    for text in texts[1:]:
+        edit_prompt(repo, prompt_id, text)
+    assert [v['text'] for v in full_history(repo, prompt_id)] == texts
+    repo.close()
+
+    reopened = open_repo(path, keyframe_interval=4)
+    try:
+        assert [v['text'] for v in full_history(reopened, prompt_id)] == texts
+        page = reopened.versions_page(prompt_id, limit=len(texts))
+        assert [v['text'] for v in page['versions']] == texts[::-1]
+    finally:
+        reopened.close()
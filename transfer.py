@@ -0,0 +1,288 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from migrations import first_version
+
+FORMAT = 'promptrepo-ndjson'
+FORMAT_VERSION = 1
+
+# Prompts applied per transaction while importing
+IMPORT_CHUNK = 500
+
+
+def _line(record):
+    return (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _is_id(value):
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+
+def _is_order(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def valid_record(kind, record):
+    """Whether an import record has the fields a folder, prompt or version needs"""
+    if kind == 'folder':
+        return (_is_id(record.get('id')) and isinstance(record.get('name'), str)
+                and (record.get('parentId') is None or _is_id(record['parentId']))
+                and _is_order(record.get('order', 0)))
+    if kind == 'prompt':
+        return (_is_id(record.get('id')) and isinstance(record.get('name'), str)
+                and isinstance(record.get('text'), str)
+                and (record.get('folderId') is None or _is_id(record['folderId']))
+                and _is_order(record.get('order', 0)))
+    if kind == 'version':
+        return (_is_id(record.get('id')) and isinstance(record.get('text'), str)
+                and isinstance(record.get('name', ''), str))
+    return False
+
+
+def export_records(repo):
+    """Yield the repository as NDJSON lines, one record per line.
+
+    A header comes first, then folders (parents before children), then each
+    prompt followed by its versions with full text. The repository lock is
+    only held while one prompt is serialized, so a long export doesn't
+    block writers; prompts deleted meanwhile are skipped.
+    """
+    with repo.lock:
+        header = {'type': 'header', 'format': FORMAT, 'version': FORMAT_VERSION,
+                  'revision': repo.revision, 'instance': repo.instance_id}
+        folders = [dict(f) for f in repo.folders.values()]
+        prompt_ids = list(repo.prompts)
+    yield _line(header)
+
+    # Emit parents first so an import can map parent ids as it goes
+    children = {}
+    for folder in folders:
+        children.setdefault(folder.get('parentId'), []).append(folder)
+    known = {f['id'] for f in folders}
+    stack = [f for f in folders if f.get('parentId') not in known][::-1]
+    while stack:
+        folder = stack.pop()
+        yield _line({'type': 'folder', **folder})
+        stack.extend(reversed(children.get(folder['id'], [])))
+
+    for prompt_id in prompt_ids:
+        with repo.lock:
+            prompt = repo.get_prompt(prompt_id)
+            if prompt is None:
+                continue
+            lines = [_line({'type': 'prompt', **{k: v for k, v in prompt.items() if k != 'versions'}})]
+            for position in range(len(prompt['versions'])):
+                version = repo.versions.expand(prompt_id, prompt['versions'], position)
+                lines.append(_line({'type': 'version', 'promptId': prompt_id, **version}))
+        yield b''.join(lines)
+
+
+class Importer:
+    """Applies exported records to a repository in bounded chunks.
+
+    Every folder and prompt gets a fresh id; parent and folder references
+    are remapped through the ids seen so far (a folder whose parent appears
+    later is re-parented when it does). Items imported at the root are
+    ordered after the existing root items. Only the current prompt's
+    versions and one chunk of prompts are held in memory.
+
+    Records missing required fields (see ``valid_record``) are counted as
+    skipped, as are the versions of a skipped prompt. Each chunk is applied
+    atomically, so an unexpected error leaves no partial chunk behind.
+    """
+
+    def __init__(self, repo, chunk_size=IMPORT_CHUNK):
+        self.repo = repo
+        self.chunk_size = chunk_size
+        self.folder_ids = {}
+        # old parent id -> (new id, exported order) of folders waiting for it
+        self.orphans = {}
+        self.chunk = []
+        self.prompt = None
+        self.counts = {'folders': 0, 'prompts': 0, 'versions': 0, 'skipped': 0}
+        with repo.lock:
+            self.root_offset = repo.append_order(None)
+
+    def feed(self, record):
+        kind = record.pop('type', None)
+        if kind == 'version':
+            if (self.prompt is None or record.pop('promptId', None) != self.prompt['id']
+                    or not valid_record(kind, record)):
+                self.counts['skipped'] += 1
+                return
+            record.setdefault('name', self.prompt['name'])
+            record.setdefault('timestamp', int(time.time() * 1000))
+            record.setdefault('version', len(self.prompt['versions']) + 1)
+            self.prompt['versions'].append(record)
+            return
+
+        self._end_prompt()
+        if kind == 'header':
+            pass
+        elif not valid_record(kind, record):
+            self.counts['skipped'] += 1
+        elif kind == 'prompt':
+            record['versions'] = []
+            self.prompt = record
+        else:
+            self.chunk.append(('folder', record))
+        if len(self.chunk) >= self.chunk_size:
+            self._apply()
+
+    def finish(self):
+        self._end_prompt()
+        self._apply()
+        return self.counts
+
+    def _end_prompt(self):
+        if self.prompt is not None:
+            self.chunk.append(('prompt', self.prompt))
+            self.prompt = None
+
+    def _apply(self):
+        if not self.chunk:
+            return
+        repo = self.repo
+        with repo.transaction(), repo.atomic():
+            for kind, item in self.chunk:
+                if kind == 'folder':
+                    self._insert_folder(item)
+                else:
+                    self._insert_prompt(item)
+        self.chunk = []
+
+    def _insert_folder(self, folder):
+        repo = self.repo
+        old_id = folder['id']
+        old_parent = folder.get('parentId')
+        folder['id'] = repo.new_id()
+        order = folder.get('order', 0)
+        if old_parent in self.folder_ids:
+            folder['parentId'] = self.folder_ids[old_parent]
+        else:
+            if old_parent is not None:
+                # Parked at the root until its parent shows up
+                self.orphans.setdefault(old_parent, []).append((folder['id'], order))
+            folder['parentId'] = None
+            folder['order'] = order + self.root_offset
+        repo.insert('folder', folder)
+        self.folder_ids[old_id] = folder['id']
+        for child_id, child_order in self.orphans.pop(old_id, []):
+            # Parents that form a cycle in the export stay at the root
+            if not repo.tree.would_create_cycle(child_id, folder['id']):
+                repo.update('folder', child_id, parentId=folder['id'], order=child_order)
+        self.counts['folders'] += 1
+
+    def _insert_prompt(self, prompt):
+        repo = self.repo
+        history = prompt['versions']
+        prompt['id'] = repo.new_id()
+        if not history:
+            # Same default as migrations.normalize
+            history = [first_version(prompt, int(time.time() * 1000))]
+        prompt.setdefault('currentVersion', len(history))
+        folder_id = prompt.get('folderId')
+        prompt['folderId'] = self.folder_ids.get(folder_id)
+        if prompt['folderId'] is None:
+            prompt['order'] = prompt.get('order', 0) + self.root_offset
+        prompt.setdefault('usageCount', 0)
+
+        # Delta-encode the history before inserting, so it is stored (and
+        # journaled) exactly as if it had been edited here
+        prompt['versions'] = []
+        for version in history:
+            prompt['versions'].append(repo.versions.encode(prompt['id'], prompt['versions'], version))
+        repo.insert('prompt', prompt)
+        self.counts['prompts'] += 1
+        self.counts['versions'] += len(history)
+
+
+def import_records(repo, lines, chunk_size=IMPORT_CHUNK):
+    """Import NDJSON lines (bytes or str) from export_records; returns counts and throughput"""
+    start = time.perf_counter()
+    importer = Importer(repo, chunk_size=chunk_size)
+    total_bytes = 0
+    errors = 0
+    for line in lines:
+        total_bytes += len(line)
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            errors += 1
+            continue
+        if isinstance(record, dict):
+            importer.feed(record)
+    counts = importer.finish()
+
+    seconds = time.perf_counter() - start
+    records = counts['folders'] + counts['prompts'] + counts['versions']
+    return {
+        **counts,
+        'invalidLines': errors,
+        'bytes': total_bytes,
+        'seconds': round(seconds, 3),
+        'recordsPerSecond': round(records / seconds) if seconds else None,
+        'megabytesPerSecond': round(total_bytes / seconds / 1e6, 2) if seconds else None
+    }
+
+
+def main(argv=None):
+    # Run while the app is stopped; both would otherwise write the same files
+    from repository import Repository
+
+    parser = argparse.ArgumentParser(description='Export or import the prompt repository as NDJSON')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('file', help="NDJSON file to write or read ('-' for stdout/stdin)")
+    parser.add_argument('--data', type=Path,
+                        default=Path.home() / 'Documents' / 'PromptData' / 'config.json',
+                        help='config.json of the repository')
+    parser.add_argument('--storage', default=os.environ.get('PROMPT_STORAGE_MODE', 'snapshot'),
+                        choices=['snapshot', 'journal', 'sqlite', 'shared'])
+    parser.add_argument('--snapshot-format', default=os.environ.get('PROMPT_SNAPSHOT_FORMAT', 'json'),
+                        choices=['binary', 'json'])
+    args = parser.parse_args(argv)
+
+    args.data.parent.mkdir(parents=True, exist_ok=True)
+    stdout = sys.stdout.buffer
+    # The repository reports loading progress with print(); keep it out of
+    # an export written to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        # An export only reads: an old document is upgraded in memory, and
+        # the source files are never written
+        repo = Repository(args.data, storage_mode=args.storage,
+                          snapshot_format=args.snapshot_format, read_only=args.command == 'export')
+        try:
+            if args.command == 'export':
+                start = time.perf_counter()
+                out = stdout if args.file == '-' else open(args.file, 'wb')
+                written = 0
+                try:
+                    for chunk in export_records(repo):
+                        out.write(chunk)
+                        written += len(chunk)
+                finally:
+                    if out is not stdout:
+                        out.close()
+                seconds = time.perf_counter() - start
+                print(f"Exported {len(repo.prompts)} prompts and {len(repo.folders)} folders "
+                      f"({written / 1e6:.1f} MB) in {seconds:.1f}s")
+            else:
+                source = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+                try:
+                    report = import_records(repo, source)
+                finally:
+                    if source is not sys.stdin.buffer:
+                        source.close()
+                print(json.dumps(report))
+        finally:
+            repo.close()
+
+if __name__ == '__main__':
+    main()
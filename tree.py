@@ -0,0 +1,113 @@
+from bisect import bisect_left, insort
+
+from ordering import key_between
+
+
+def sort_key(folder):
+    return (folder.get('order', 0), folder['id'])
+
+
+class FolderTree:
+    """Folder hierarchy index: ordered children and materialized paths.
+
+    For every folder it keeps the (parent, sort key) it was linked with, the
+    sibling list it sits in (sorted by order, then id) and its ancestor path
+    from the root. Ancestor checks are therefore a tuple lookup of O(depth)
+    and sibling queries need no sorting. A folder whose parent doesn't exist
+    is treated as top-level.
+
+    The repository calls add/update/remove as folders change; update compares
+    against the stored link, so unrelated field changes cost a dict lookup.
+    """
+
+    def __init__(self):
+        # folder id -> (parent id, sort key) it is linked under
+        self._links = {}
+        # parent id (None for root) -> sorted [(sort key, folder id)]
+        self._children = {}
+        # folder id -> ancestor ids, root first
+        self._paths = {}
+
+    def rebuild(self, folders):
+        self.__init__()
+        for folder in folders:
+            self._link(folder['id'], folder.get('parentId'), sort_key(folder))
+        for folder_id, (parent_id, _) in self._links.items():
+            if parent_id not in self._links:
+                self._update_paths(folder_id)
+
+    def add(self, folder):
+        self._link(folder['id'], folder.get('parentId'), sort_key(folder))
+        self._update_paths(folder['id'])
+
+    def update(self, folder):
+        folder_id = folder['id']
+        parent_id, key = self._links[folder_id]
+        new_parent, new_key = folder.get('parentId'), sort_key(folder)
+        if (parent_id, key) == (new_parent, new_key):
+            return
+        self._unlink(folder_id)
+        self._link(folder_id, new_parent, new_key)
+        if new_parent != parent_id:
+            self._update_paths(folder_id)
+
+    def remove(self, folder_id):
+        self._unlink(folder_id)
+        self._paths.pop(folder_id, None)
+        # Any children left behind become top-level
+        for _, child_id in self._children.get(folder_id, ()):
+            self._update_paths(child_id)
+
+    # ------------------ Queries ------------------
+    def children(self, parent_id):
+        """Ids of the folders directly under `parent_id`, in display order"""
+        return [folder_id for _, folder_id in self._children.get(parent_id, ())]
+
+    def append_order(self, parent_id):
+        """Order value that places a folder after its siblings under `parent_id`"""
+        siblings = self._children.get(parent_id)
+        return key_between(siblings[-1][0][0] if siblings else None, None)
+
+    def path(self, folder_id):
+        """Ancestor ids of a folder, root first"""
+        return self._paths.get(folder_id, ())
+
+    def depth(self, folder_id):
+        return len(self.path(folder_id))
+
+    def descendants(self, folder_id):
+        """Ids of every folder below `folder_id`, depth first"""
+        stack = self.children(folder_id)[::-1]
+        while stack:
+            child_id = stack.pop()
+            yield child_id
+            stack.extend(self.children(child_id)[::-1])
+
+    def would_create_cycle(self, folder_id, new_parent_id):
+        """Whether moving `folder_id` under `new_parent_id` would nest it in itself"""
+        if new_parent_id is None:
+            return False
+        return new_parent_id == folder_id or folder_id in self.path(new_parent_id)
+
+    # ------------------ Maintenance ------------------
+    def _link(self, folder_id, parent_id, key):
+        self._links[folder_id] = (parent_id, key)
+        insort(self._children.setdefault(parent_id, []), (key, folder_id))
+
+    def _unlink(self, folder_id):
+        parent_id, key = self._links.pop(folder_id)
+        siblings = self._children[parent_id]
+        del siblings[bisect_left(siblings, (key, folder_id))]
+        if not siblings:
+            del self._children[parent_id]
+
+    def _update_paths(self, folder_id):
+        """Recompute the paths of a folder and everything below it"""
+        parent_id = self._links[folder_id][0]
+        if parent_id in self._links:
+            self._paths[folder_id] = self._paths.get(parent_id, ()) + (parent_id,)
+        else:
+            self._paths[folder_id] = ()
+        for child_id in self.descendants(folder_id):
+            parent_id = self._links[child_id][0]
+            self._paths[child_id] = self._paths[parent_id] + (parent_id,)
@@ -0,0 +1,163 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ranking import record_use
+
+# Buffered copies that trigger a flush before the interval is up
+FLUSH_BATCH = 1000
+
+
+class UsageCounter:
+    """Buffers prompt copy events and writes them to the repository in batches.
+
+    ``record`` only touches in-memory state: a cooldown table of when each
+    prompt was last counted and a buffer of counted copy times. A background
+    thread applies the buffer in one transaction every `flush_interval`
+    seconds, or sooner once `max_pending` copies are waiting, and ``close``
+    (registered with atexit before the repository's) applies whatever is
+    left, so a clean shutdown loses no counts.
+
+    The cooldown table is ordered by time counted; entries older than the
+    cooldown are evicted from the front as new copies come in. A prompt
+    missing from it falls back to the lastCopiedAt stored on the prompt.
+
+    Buffered copies are outside any repository transaction, so copies made
+    inside ``repo.atomic()`` must be recorded within ``deferred()`` to be
+    undone with it.
+    """
+
+    def __init__(self, repo, cooldown_ms, flush_interval=5.0, max_pending=FLUSH_BATCH):
+        self.repo = repo
+        self.cooldown_ms = cooldown_ms
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # prompt id -> ms it was last counted, oldest first
+        self._cooldown = OrderedDict()
+        # prompt id -> [ms of each counted copy not yet written]
+        self._pending = {}
+        self._pending_count = 0
+        self._closed = False
+        # .staged: copies held back by deferred() in this thread
+        self._local = threading.local()
+
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def record(self, prompt_id, now=None):
+        """Count a copy unless the prompt is cooling down; returns whether it counted.
+
+        Within ``deferred()`` the copy is only held back, and None is returned.
+        """
+        now = int(time.time() * 1000) if now is None else now
+        staged = getattr(self._local, 'staged', None)
+        if staged is not None:
+            staged.append((prompt_id, now))
+            return None
+        with self._lock:
+            self._evict(now)
+            last = self._cooldown.get(prompt_id)
+            if last is None:
+                prompt = self.repo.prompts.get(prompt_id)
+                if prompt is None:
+                    return False
+                last = prompt.get('lastCopiedAt', 0)
+            if now - last < self.cooldown_ms:
+                return False
+            self._cooldown[prompt_id] = now
+            self._cooldown.move_to_end(prompt_id)
+            self._pending.setdefault(prompt_id, []).append(now)
+            self._pending_count += 1
+            if self._pending_count >= self.max_pending:
+                self._cond.notify()
+            return True
+
+    @contextmanager
+    def deferred(self):
+        """Hold back this thread's copies until the block exits.
+
+        They are counted if it completes and dropped if it raises, like the
+        repository changes of an atomic() block it encloses.
+        """
+        staged = self._local.staged = []
+        try:
+            yield
+        finally:
+            self._local.staged = None
+        for prompt_id, copied_at in staged:
+            self.record(prompt_id, copied_at)
+
+    def pending_fields(self):
+        """{prompt id: usage fields} the buffered copies will set when written.
+
+        Reads only memory, so ranking with the buffered copies (see
+        Repository.top_prompts) doesn't force a write.
+        """
+        repo = self.repo
+        # Under the repository lock a flush can't write between reading the
+        # buffer and the prompts, which would count its copies twice
+        with repo.lock:
+            with self._lock:
+                pending = {prompt_id: list(times) for prompt_id, times in self._pending.items()}
+            fields = {}
+            for prompt_id, times in pending.items():
+                prompt = repo.get_prompt(prompt_id)
+                if prompt is not None:
+                    fields[prompt_id] = self._counted(prompt, times)
+            return fields
+
+    def flush(self):
+        """Write the buffered counts to the repository in one transaction"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._pending_count = 0
+        if not pending:
+            return
+        repo = self.repo
+        with repo.transaction():
+            for prompt_id, times in pending.items():
+                prompt = repo.get_prompt(prompt_id)
+                if prompt is None:
+                    # Deleted since it was copied
+                    continue
+                repo.update('prompt', prompt_id, **self._counted(prompt, times))
+
+    def _counted(self, prompt, times):
+        fields = {k: prompt[k] for k in ('usageCount', 'recentUsage', 'lastCopiedAt')
+                  if k in prompt}
+        for copied_at in times:
+            fields = record_use(fields, copied_at, self.repo.ranking.rate)
+        return fields
+
+    def close(self):
+        """Stop the background thread and write anything still buffered"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join(timeout=5)
+        self.flush()
+
+    def _evict(self, now):
+        cooldown = self._cooldown
+        while cooldown:
+            prompt_id, counted_at = next(iter(cooldown.items()))
+            if now - counted_at < self.cooldown_ms:
+                break
+            cooldown.popitem(last=False)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if not self._closed and self._pending_count < self.max_pending:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
@@ -0,0 +1,152 @@
+import difflib
+from collections import OrderedDict
+
+
+def make_delta(old, new):
+    """Encode `new` as line-level edit operations against `old`.
+
+    Operations are a flat list: a positive int copies that many characters
+    from `old`, a negative int skips that many, and a string is inserted.
+    """
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+
+    # Edits are usually local: only the lines between the common head and
+    # tail go through SequenceMatcher, which is slow on long, repetitive texts
+    head = 0
+    limit = min(len(a), len(b))
+    while head < limit and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+
+    ops = []
+    if head:
+        ops.append(sum(len(line) for line in a[:head]))
+    a_mid = a[head:len(a) - tail]
+    b_mid = b[head:len(b) - tail]
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a_mid, b_mid, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append(sum(len(line) for line in a_mid[i1:i2]))
+            continue
+        if i2 > i1:
+            ops.append(-sum(len(line) for line in a_mid[i1:i2]))
+        if j2 > j1:
+            ops.append(''.join(b_mid[j1:j2]))
+    if tail:
+        ops.append(sum(len(line) for line in a[len(a) - tail:]))
+    return ops
+
+
+def apply_delta(old, ops):
+    """Rebuild the text encoded by make_delta"""
+    out = []
+    pos = 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op >= 0:
+            out.append(old[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    return ''.join(out)
+
+
+def delta_size(ops):
+    """Rough serialized size of a delta, to compare against the full text"""
+    return sum(len(op) + 3 if isinstance(op, str) else 8 for op in ops)
+
+
+class VersionStore:
+    """Delta-compressed version histories.
+
+    A stored version either carries its full ``text`` (a keyframe) or a
+    ``delta`` against the version before it. Every ``keyframe_interval``-th
+    version is a keyframe, so rebuilding any version applies fewer than that
+    many deltas. Recently rebuilt texts are kept in a small LRU cache keyed
+    by (prompt id, position), which stays valid because history is
+    append-only.
+    """
+
+    def __init__(self, keyframe_interval=20, cache_size=256):
+        self.keyframe_interval = keyframe_interval
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def _cache_put(self, key, text):
+        self._cache[key] = text
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def text_at(self, prompt_id, versions, position):
+        """Full text of the version at `position`"""
+        chain = []
+        p = position
+        while True:
+            key = (prompt_id, p)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                text = self._cache[key]
+                break
+            if 'delta' not in versions[p]:
+                text = versions[p]['text']
+                break
+            chain.append(p)
+            p -= 1
+
+        for q in reversed(chain):
+            text = apply_delta(text, versions[q]['delta'])
+        self._cache_put((prompt_id, position), text)
+        return text
+
+    def expand(self, prompt_id, versions, position):
+        """The version at `position` in its original {id, name, text, ...} form"""
+        stored = versions[position]
+        if 'delta' not in stored:
+            return stored
+        version = {k: v for k, v in stored.items() if k != 'delta'}
+        version['text'] = self.text_at(prompt_id, versions, position)
+        return version
+
+    def encode(self, prompt_id, versions, version, position=None):
+        """Stored form of `version` when placed at `position` (default: appended)"""
+        if position is None:
+            position = len(versions)
+        text = version['text']
+        self._cache_put((prompt_id, position), text)
+        if position % self.keyframe_interval == 0:
+            return version
+
+        delta = make_delta(self.text_at(prompt_id, versions, position - 1), text)
+        if delta_size(delta) >= len(text):
+            return version
+        stored = {k: v for k, v in version.items() if k != 'text'}
+        stored['delta'] = delta
+        return stored
+
+    def encode_history(self, prompt_id, versions):
+        """Delta-encode a history stored as full texts; returns the number changed"""
+        if any('delta' in v for v in versions):
+            # Already written by encode()
+            return 0
+        changed = 0
+        for position in range(1, len(versions)):
+            if position % self.keyframe_interval == 0:
+                continue
+            encoded = self.encode(prompt_id, versions, versions[position], position)
+            if encoded is not versions[position]:
+                versions[position] = encoded
+                changed += 1
+        return changed
+
+    def clear(self):
+        """Drop every cached text (after the histories were reloaded)"""
+        self._cache.clear()
+
+    def forget(self, prompt_id):
+        """Drop cached texts of a removed prompt"""
+        for key in [k for k in self._cache if k[0] == prompt_id]:
+            del self._cache[key]